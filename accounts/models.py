@@ -4,7 +4,7 @@ from django.urls import reverse
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from djangoblog.utils import get_current_site
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.db.models import F
 import datetime
@@ -141,6 +141,13 @@ class UserMembership(models.Model):
         ordering = ['-created_time']
 
 
+@receiver(post_save, sender=UserMembership)
+@receiver(post_delete, sender=UserMembership)
+def user_membership_changed_callback(sender, instance, **kwargs):
+    from accounts.utils import invalidate_membership
+    invalidate_membership(instance.user_id)
+
+
 class RedemptionCode(models.Model):
     MEMBERSHIP_CHOICES = (
         ('month', _('Monthly Membership')),
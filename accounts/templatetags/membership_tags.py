@@ -0,0 +1,24 @@
+import datetime
+import time
+
+from django import template
+from django.utils import timezone
+
+from accounts.utils import get_membership_until
+
+register = template.Library()
+
+
+@register.simple_tag
+def membership_active_until(user):
+    """
+    有效会员的到期时间, 不是有效会员时返回None
+    用法: {% membership_active_until request.user as member_until %}
+    """
+    if not user or not user.is_authenticated:
+        return None
+    until = get_membership_until(user.id)
+    if until < time.time():
+        return None
+    return datetime.datetime.fromtimestamp(until, tz=datetime.timezone.utc).astimezone(
+        timezone.get_current_timezone())
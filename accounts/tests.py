@@ -130,6 +130,27 @@ class AccountTest(TestCase):
         err = utils.verify("admin@123.com", code)
         self.assertEqual(type(err), str)
 
+    def test_membership_entitlement(self):
+        import datetime
+        from accounts.models import UserMembership
+        cache.clear()
+        self.assertFalse(utils.has_active_membership(self.blog_user))
+
+        membership = UserMembership(user=self.blog_user, membership_type='month', is_active=True)
+        membership.save()
+        self.assertTrue(utils.has_active_membership(self.blog_user))
+        with self.assertNumQueries(0):
+            self.assertTrue(utils.has_active_membership(self.blog_user))
+
+        membership.is_active = False
+        membership.save()
+        self.assertFalse(utils.has_active_membership(self.blog_user))
+
+        membership.is_active = True
+        membership.start_date = timezone.now() - datetime.timedelta(days=31)
+        membership.save()
+        self.assertFalse(utils.has_active_membership(self.blog_user))
+
     def test_forget_password_email_code_success(self):
         resp = self.client.post(
             path=reverse("account:forget_password_code"),
@@ -1,3 +1,4 @@
+import time
 import typing
 from datetime import timedelta
 
@@ -8,6 +9,8 @@ from django.utils.translation import gettext_lazy as _
 from djangoblog.utils import send_email
 
 _code_ttl = timedelta(minutes=5)
+_membership_ttl = timedelta(hours=6)
+_membership_key = 'membership_until_{user_id}'
 
 
 def send_verify_email(to_mail: str, code: str, subject: str = _("Verify Email")):
@@ -47,3 +50,46 @@ def set_code(email: str, code: str):
 def get_code(email: str) -> typing.Optional[str]:
     """获取code"""
     return cache.get(email)
+
+
+def get_membership_until(user_id: int) -> float:
+    """获取会员有效期截止时间戳
+    Args:
+        user_id: 用户id
+    Return:
+        截止时间戳, 没有有效会员时为0
+    Node:
+        缓存的是绝对时间, 会员到期后无需失效缓存也能得到正确结果
+    """
+    key = _membership_key.format(user_id=user_id)
+    value = cache.get(key)
+    if value is None:
+        from accounts.models import UserMembership
+        membership = UserMembership.objects.filter(user_id=user_id).only('is_active', 'end_date').first()
+        if membership and membership.is_active and membership.end_date:
+            value = membership.end_date.timestamp()
+        else:
+            value = 0
+        cache.set(key, value, _membership_ttl.seconds)
+    return value
+
+
+def has_active_membership(user) -> bool:
+    """用户是否为有效会员"""
+    if not user or not user.is_authenticated:
+        return False
+    return get_membership_until(user.id) >= time.time()
+
+
+def has_premium_access(user, article) -> bool:
+    """用户是否可以阅读该文章, 管理员不受会员限制"""
+    if not article.is_premium:
+        return True
+    if user and user.is_authenticated and (user.is_superuser or user.is_staff):
+        return True
+    return has_active_membership(user)
+
+
+def invalidate_membership(user_id: int):
+    """会员变更后失效缓存"""
+    cache.delete(_membership_key.format(user_id=user_id))
@@ -3,6 +3,7 @@ from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.utils.html import format_html
+from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 
@@ -13,6 +14,7 @@ from ckeditor_uploader.widgets import CKEditorUploadingWidget  # 导入 CKEditor
 
 # Register your models here.
 from .models import Article, Tag, Category, Links, SideBar, BlogSettings, MembershipType, Membership, Order # Import Order model
+from .utils import invalidate_published_article_ids
 
 
 class MultipleClearableFileInput(forms.ClearableFileInput):
@@ -78,11 +80,13 @@ class ArticleAdminForm(forms.ModelForm):
 
 
 def makr_article_publish(modeladmin, request, queryset):
-    queryset.update(status='p')
+    queryset.update(status='p', last_modify_time=now())
+    invalidate_published_article_ids()
 
 
 def draft_article(modeladmin, request, queryset):
-    queryset.update(status='d')
+    queryset.update(status='d', last_modify_time=now())
+    invalidate_published_article_ids()
 
 
 def close_article_commentstatus(modeladmin, request, queryset):
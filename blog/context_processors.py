@@ -1,5 +1,6 @@
 import logging
 
+from django.conf import settings
 from django.utils import timezone
 
 from djangoblog.utils import cache, get_blog_setting
@@ -38,6 +39,7 @@ def seo_processor(requests):
             "GLOBAL_HEADER": setting.global_header,
             "GLOBAL_FOOTER": setting.global_footer,
             "COMMENT_NEED_REVIEW": setting.comment_need_review,
+            "SHOW_LOAD_TIMES": getattr(settings, 'SHOW_LOAD_TIMES', False),
         }
         cache.set(key, value, 60 * 60 * 10)
         return value
@@ -1,11 +1,21 @@
+import datetime
+import logging
 import time
 
 import elasticsearch.client
 from django.conf import settings
-from elasticsearch_dsl import Document, InnerDoc, Date, Integer, Long, Text, Object, GeoPoint, Keyword, Boolean
+from django.db.models import QuerySet
+from django.utils import timezone
+from elasticsearch.helpers import bulk, parallel_bulk
+from elasticsearch_dsl import Document, InnerDoc, Date, Integer, Long, Text, Object, GeoPoint, Keyword, Boolean, \
+    Completion
 from elasticsearch_dsl.connections import connections
 
 from blog.models import Article
+from djangoblog.search_cache import bump_index_generation
+from djangoblog.utils import parse_user_agent
+
+logger = logging.getLogger(__name__)
 
 ELASTICSEARCH_ENABLED = hasattr(settings, 'ELASTICSEARCH_DSL')
 
@@ -83,23 +93,33 @@ class ElapsedTimeDocument(Document):
 
 
 class ElaspedTimeDocumentManager:
+    _index_ready = False
+
     @staticmethod
     def build_index():
+        if ElaspedTimeDocumentManager._index_ready:
+            return
         from elasticsearch import Elasticsearch
         client = Elasticsearch(settings.ELASTICSEARCH_DSL['default']['hosts'])
         res = client.indices.exists(index="performance")
         if not res:
             ElapsedTimeDocument.init()
+        ElaspedTimeDocumentManager._index_ready = True
 
     @staticmethod
     def delete_index():
         from elasticsearch import Elasticsearch
         es = Elasticsearch(settings.ELASTICSEARCH_DSL['default']['hosts'])
         es.indices.delete(index='performance', ignore=[400, 404])
+        ElaspedTimeDocumentManager._index_ready = False
 
     @staticmethod
-    def create(url, time_taken, log_datetime, useragent, ip):
-        ElaspedTimeDocumentManager.build_index()
+    def build_doc(url, time_taken, log_datetime, useragent, ip):
+        """
+        :param useragent: user_agents 解析结果或原始 UA 字符串
+        """
+        if isinstance(useragent, str):
+            useragent = parse_user_agent(useragent)
         ua = UserAgent()
         ua.browser = UserAgentBrowser()
         ua.browser.Family = useragent.browser.family
@@ -116,19 +136,92 @@ class ElaspedTimeDocumentManager:
         ua.string = useragent.ua_string
         ua.is_bot = useragent.is_bot
 
-        doc = ElapsedTimeDocument(
-            meta={
-                'id': int(
-                    round(
-                        time.time() *
-                        1000))
-            },
+        return ElapsedTimeDocument(
             url=url,
             time_taken=time_taken,
             log_datetime=log_datetime,
             useragent=ua, ip=ip)
+
+    @staticmethod
+    def create(url, time_taken, log_datetime, useragent, ip):
+        ElaspedTimeDocumentManager.build_index()
+        doc = ElaspedTimeDocumentManager.build_doc(url, time_taken, log_datetime, useragent, ip)
+        doc.meta.id = int(round(time.time() * 1000))
         doc.save(pipeline="geoip")
 
+    @staticmethod
+    def bulk_create(events):
+        """
+        一次 bulk 请求写入多条记录, 由 ES 生成 id, 避免同一毫秒的记录互相覆盖
+        :param events: list of dict, 参数同 create
+        """
+        ElaspedTimeDocumentManager.build_index()
+        actions = [ElaspedTimeDocumentManager.build_doc(**event).to_dict(include_meta=True) for event in events]
+        count, errors = bulk(connections.get_connection(), actions, pipeline='geoip', raise_on_error=False)
+        for error in errors:
+            logger.error('bulk elapsed time error:{error}'.format(error=error))
+        return count
+
+    @staticmethod
+    def rollup(start, end, size=500):
+        """
+        按 url 和分钟聚合 [start, end) 内的原始记录
+        :return: 生成 dict url/minute/count/p50_ms/p95_ms/p99_ms/max_ms/bot_count/countries
+        """
+        client = connections.get_connection()
+        after = None
+        while True:
+            composite = {
+                'size': size,
+                'sources': [
+                    {'url': {'terms': {'field': 'url'}}},
+                    {'minute': {'date_histogram': {'field': 'log_datetime', 'fixed_interval': '1m'}}},
+                ],
+            }
+            if after:
+                composite['after'] = after
+            body = {
+                'size': 0,
+                'query': {'range': {'log_datetime': {'gte': start.isoformat(), 'lt': end.isoformat()}}},
+                'aggs': {
+                    'rollup': {
+                        'composite': composite,
+                        'aggs': {
+                            'time': {'percentiles': {'field': 'time_taken', 'percents': [50, 95, 99]}},
+                            'max_time': {'max': {'field': 'time_taken'}},
+                            'bots': {'filter': {'term': {'useragent.is_bot': True}}},
+                            'countries': {'terms': {'field': 'geoip.country_iso_code', 'size': 3}},
+                        },
+                    },
+                },
+            }
+            result = client.search(index='performance', body=body)['aggregations']['rollup']
+            for bucket in result['buckets']:
+                percentiles = bucket['time']['values']
+                yield {
+                    'url': bucket['key']['url'],
+                    'minute': datetime.datetime.fromtimestamp(bucket['key']['minute'] / 1000,
+                                                              tz=datetime.timezone.utc),
+                    'count': bucket['doc_count'],
+                    'p50_ms': percentiles.get('50.0') or 0,
+                    'p95_ms': percentiles.get('95.0') or 0,
+                    'p99_ms': percentiles.get('99.0') or 0,
+                    'max_ms': bucket['max_time']['value'] or 0,
+                    'bot_count': bucket['bots']['doc_count'],
+                    'countries': {c['key']: c['doc_count'] for c in bucket['countries']['buckets']},
+                }
+            after = result.get('after_key')
+            if not after or not result['buckets']:
+                return
+
+    @staticmethod
+    def delete_before(before):
+        """删除 before 之前的原始记录, 不等待删除完成"""
+        client = connections.get_connection()
+        client.delete_by_query(index='performance',
+                               body={'query': {'range': {'log_datetime': {'lt': before.isoformat()}}}},
+                               conflicts='proceed', wait_for_completion=False, ignore=[404])
+
 
 class ArticleDocument(Document):
     body = Text(analyzer='ik_max_word', search_analyzer='ik_smart')
@@ -152,6 +245,8 @@ class ArticleDocument(Document):
     type = Text()
     views = Integer()
     article_order = Integer()
+    # 搜索框联想, 来自标题/标签/分类
+    suggest = Completion()
 
     class Index:
         name = 'blog'
@@ -164,50 +259,183 @@ class ArticleDocument(Document):
         doc_type = 'Article'
 
 
+ARTICLE_INDEX_ALIAS = 'blog'
+ARTICLE_INDEX_PATTERN = ARTICLE_INDEX_ALIAS + '-*'
+
+
 class ArticleDocumentManager():
+    """
+    搜索通过别名 blog 访问, 实际索引为 blog-时间戳.
+    全量重建写入新索引, 完成后原子切换别名, 重建期间搜索不受影响.
+    """
 
-    def __init__(self):
+    def __init__(self, client=None):
+        self.client = client or connections.get_connection()
         self.create_index()
 
     def create_index(self):
-        ArticleDocument.init()
+        """别名不存在时创建第一个版本"""
+        if not self.client.indices.exists(index=ARTICLE_INDEX_ALIAS):
+            self.switch_alias(self.create_versioned_index())
+
+    def create_versioned_index(self):
+        name = '{alias}-{version}'.format(
+            alias=ARTICLE_INDEX_ALIAS, version=timezone.now().strftime('%Y%m%d%H%M%S%f'))
+        ArticleDocument._index.clone(name).create(using=self.client)
+        return name
+
+    def get_versioned_indices(self):
+        """
+        :return: dict 索引名 -> 是否挂有别名
+        """
+        indices = self.client.indices.get(index=ARTICLE_INDEX_PATTERN, ignore_unavailable=True)
+        return {name: ARTICLE_INDEX_ALIAS in info.get('aliases', {}) for name, info in indices.items()}
+
+    def switch_alias(self, index):
+        """一次 update_aliases 请求内完成摘除旧索引和挂载新索引"""
+        actions = []
+        if self.client.indices.exists(index=ARTICLE_INDEX_ALIAS) and \
+                not self.client.indices.exists_alias(name=ARTICLE_INDEX_ALIAS):
+            # 旧版本直接创建的 blog 索引, 与别名同名, 需要一并删除
+            actions.append({'remove_index': {'index': ARTICLE_INDEX_ALIAS}})
+        for name, aliased in self.get_versioned_indices().items():
+            if aliased and name != index:
+                actions.append({'remove': {'index': name, 'alias': ARTICLE_INDEX_ALIAS}})
+        actions.append({'add': {'index': index, 'alias': ARTICLE_INDEX_ALIAS}})
+        self.client.indices.update_aliases(body={'actions': actions})
+        logger.info('switch index alias {alias} to {index}'.format(alias=ARTICLE_INDEX_ALIAS, index=index))
+
+    def cleanup_indices(self, keep=None):
+        """
+        删除旧版本索引, 保留最新的 keep 个(含当前使用的)用于回滚
+        :return: 删除的索引名
+        """
+        if keep is None:
+            keep = getattr(settings, 'ELASTICSEARCH_INDEX_KEEP', 2)
+        indices = self.get_versioned_indices()
+        removed = [name for name in sorted(indices, reverse=True)[keep:] if not indices[name]]
+        for name in removed:
+            self.client.indices.delete(index=name, ignore=[404])
+        return removed
 
     def delete_index(self):
-        from elasticsearch import Elasticsearch
-        es = Elasticsearch(settings.ELASTICSEARCH_DSL['default']['hosts'])
-        es.indices.delete(index='blog', ignore=[400, 404])
+        self.client.indices.delete(index=ARTICLE_INDEX_PATTERN, ignore=[400, 404])
+        self.client.indices.delete(index=ARTICLE_INDEX_ALIAS, ignore=[400, 404])
+
+    @staticmethod
+    def get_queryset(since=None):
+        """预取作者/分类/标签, 避免每篇文章单独查询"""
+        articles = Article.objects.select_related('author', 'category').prefetch_related('tags').order_by('id')
+        if since:
+            articles = articles.filter(last_modify_time__gte=since)
+        return articles
+
+    @staticmethod
+    def convert_article(article):
+        return ArticleDocument(
+            meta={
+                'id': article.id},
+            body=article.body,
+            title=article.title,
+            author={
+                'nickname': article.author.username,
+                'id': article.author.id},
+            category={
+                'name': article.category.name,
+                'id': article.category.id},
+            tags=[
+                {
+                    'name': t.name,
+                    'id': t.id} for t in article.tags.all()],
+            pub_time=article.pub_time,
+            status=article.status,
+            comment_status=article.comment_status,
+            type=article.type,
+            views=article.views,
+            article_order=article.article_order,
+            # completion 无法按状态过滤, 只为已发布文章生成
+            suggest={
+                'input': [article.title, article.category.name] + [t.name for t in article.tags.all()]
+            } if article.status == 'p' else None)
 
     def convert_to_doc(self, articles):
-        return [
-            ArticleDocument(
-                meta={
-                    'id': article.id},
-                body=article.body,
-                title=article.title,
-                author={
-                    'nickname': article.author.username,
-                    'id': article.author.id},
-                category={
-                    'name': article.category.name,
-                    'id': article.category.id},
-                tags=[
-                    {
-                        'name': t.name,
-                        'id': t.id} for t in article.tags.all()],
-                pub_time=article.pub_time,
-                status=article.status,
-                comment_status=article.comment_status,
-                type=article.type,
-                views=article.views,
-                article_order=article.article_order) for article in articles]
-
-    def rebuild(self, articles=None):
-        ArticleDocument.init()
-        articles = articles if articles else Article.objects.all()
-        docs = self.convert_to_doc(articles)
-        for doc in docs:
-            doc.save()
+        return [self.convert_article(article) for article in articles]
+
+    def iter_actions(self, articles, chunk_size=500, index=ARTICLE_INDEX_ALIAS):
+        """逐批读取文章并转换为 bulk action, 不一次性加载全部文章"""
+        if isinstance(articles, QuerySet):
+            articles = articles.iterator(chunk_size=chunk_size)
+        for article in articles:
+            action = self.convert_article(article).to_dict(include_meta=True)
+            action['_index'] = index
+            yield action
+
+    def get_last_sync_time(self):
+        try:
+            mappings = self.client.indices.get_mapping(index=ARTICLE_INDEX_ALIAS)
+        except elasticsearch.exceptions.NotFoundError:
+            return None
+        for mapping in mappings.values():
+            value = mapping.get('mappings', {}).get('_meta', {}).get('last_sync_time')
+            if value:
+                return datetime.datetime.fromisoformat(value)
+        return None
+
+    def set_last_sync_time(self, value, index=ARTICLE_INDEX_ALIAS):
+        self.client.indices.put_mapping(index=index, body={'_meta': {'last_sync_time': value.isoformat()}})
+
+    def bulk_index(self, actions, chunk_size=500, parallel=False):
+        """
+        使用 bulk api 写入
+        :return: 成功写入的文档数
+        """
+        if parallel:
+            count = 0
+            for ok, info in parallel_bulk(self.client, actions, chunk_size=chunk_size, raise_on_error=False):
+                if ok:
+                    count += 1
+                else:
+                    logger.error('bulk index error:{info}'.format(info=info))
+            return count
+        count, errors = bulk(self.client, actions, chunk_size=chunk_size, raise_on_error=False)
+        for error in errors:
+            logger.error('bulk index error:{error}'.format(error=error))
+        return count
+
+    def rebuild(self, articles=None, chunk_size=500, parallel=False, incremental=False):
+        """
+        重建索引
+        :param articles: 指定文章, 写入当前索引; 为空时从数据库流式读取
+        :param incremental: 只同步上次成功后修改过的文章到当前索引, 删除的文章不会同步
+        :return: 统计信息 count/seconds/docs_per_sec
+        """
+        from_database = articles is None
+        sync_time = timezone.now()
+        if from_database and not incremental:
+            index = self.create_versioned_index()
+        else:
+            self.create_index()
+            index = ARTICLE_INDEX_ALIAS
+        if from_database:
+            since = self.get_last_sync_time() if incremental else None
+            articles = self.get_queryset(since)
+        start = time.perf_counter()
+        count = self.bulk_index(self.iter_actions(articles, chunk_size, index), chunk_size, parallel)
+        seconds = time.perf_counter() - start
+        if from_database:
+            self.set_last_sync_time(sync_time, index)
+        if index != ARTICLE_INDEX_ALIAS:
+            self.client.indices.refresh(index=index)
+            self.switch_alias(index)
+            self.cleanup_indices()
+        bump_index_generation()
+        stats = {
+            'count': count,
+            'seconds': round(seconds, 3),
+            'docs_per_sec': round(count / seconds, 1) if seconds else 0,
+        }
+        logger.info('rebuild article index {index}:{stats}'.format(index=index, stats=stats))
+        return stats
 
     def update_docs(self, docs):
-        for doc in docs:
-            doc.save()
+        self.bulk_index(doc.to_dict(include_meta=True) for doc in docs)
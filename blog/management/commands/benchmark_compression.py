@@ -0,0 +1,68 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.middleware.gzip import GZipMiddleware
+from django.test import Client, RequestFactory
+from django.test.utils import override_settings
+from django.views.decorators.cache import cache_page as django_cache_page
+
+from djangoblog.page_cache import cache_page, get_encodings
+
+ACCEPT_ENCODING = 'gzip, deflate, br, zstd'
+
+
+class Command(BaseCommand):
+    help = 'compare the cpu cost of serving cached pages recompressed by GZipMiddleware ' \
+           'and precompressed by djangoblog.page_cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', help='page to benchmark, may be repeated')
+        parser.add_argument('--requests', type=int, default=1000, help='cache hits per page and setup')
+
+    def build(self, decorator, body):
+        # 与线上相同: GZipMiddleware 在外层, 页面缓存装饰在视图上
+        return GZipMiddleware(decorator(lambda request: HttpResponse(body)))
+
+    def run(self, handler, path, count):
+        factory = RequestFactory()
+        start = time.process_time()
+        response = handler(factory.get(path, HTTP_ACCEPT_ENCODING=ACCEPT_ENCODING))
+        fill = time.process_time() - start
+        start = time.process_time()
+        for _ in range(count):
+            response = handler(factory.get(path, HTTP_ACCEPT_ENCODING=ACCEPT_ENCODING))
+        hit = time.process_time() - start
+        return response, fill, hit
+
+    def handle(self, *args, **options):
+        paths = options['path'] or ['/', '/archives.html', '/sitemap.xml']
+        count = options['requests']
+        self.stdout.write('encodings: {encodings}'.format(encodings=', '.join(get_encodings())))
+        # 每次运行使用新的键前缀, 之前运行留下的缓存不影响结果
+        prefix = uuid.uuid4().hex
+        client = Client()
+        with override_settings(RATE_LIMIT_REQUESTS=10 ** 9, RATE_LIMIT_ROUTES=[]):
+            for path in paths:
+                response = client.get(path)
+                if response.status_code != 200 or response.streaming:
+                    self.stdout.write(self.style.WARNING('{path}: status {status}, skipped'.format(
+                        path=path, status=response.status_code)))
+                    continue
+                body = response.content
+                self.stdout.write('{path} {size:.1f}KB'.format(path=path, size=len(body) / 1024))
+                results = []
+                for name, decorator in (('gzip middleware', django_cache_page(60, key_prefix=prefix + 'stock')),
+                                        ('precompressed', cache_page(60, key_prefix=prefix + 'precompressed'))):
+                    response, fill, hit = self.run(self.build(decorator, body), path, count)
+                    results.append(hit)
+                    self.stdout.write(
+                        '  {name:<16} {encoding:<8} {size:>8.1f}KB  fill {fill:.2f}ms  '
+                        'hit {hit:.3f}ms cpu/request'.format(
+                            name=name, encoding=response.get('Content-Encoding', 'identity'),
+                            size=len(response.content) / 1024, fill=fill * 1000, hit=hit * 1000 / count))
+                stock, precompressed = results
+                if precompressed:
+                    self.stdout.write(self.style.SUCCESS('  {speedup:.1f}x less cpu per cache hit'.format(
+                        speedup=stock / precompressed)))
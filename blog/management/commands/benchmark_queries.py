@@ -0,0 +1,222 @@
+import datetime
+import json
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import signals
+from django.utils import timezone
+
+from blog.models import Article, Category
+from comments.models import Comment
+from blog.utils import invalidate_published_article_ids, invalidate_search_words
+from djangoblog.utils import clear_cache
+from owntracks.models import OwnTrackLog
+
+BENCHMARK_PREFIX = 'benchmark-'
+BENCHMARK_USER = 'benchmark'
+
+
+def check_database(force):
+    """
+    基准数据只应写入测试库, 其他数据库需要显式传入 --force
+    :param force: 是否允许写入非测试库
+    """
+    if not settings.TESTING and not force:
+        raise CommandError('refusing to write benchmark data into database %s, pass --force to do it anyway'
+                           % connection.settings_dict['NAME'])
+
+
+@contextmanager
+def muted_model_signals():
+    """
+    生成和清理数据时暂停模型信号, 避免逐条清空缓存、通知搜索引擎和更新搜索索引,
+    结束并提交后由 invalidate_caches 统一使缓存失效
+    """
+    model_signals = (signals.pre_save, signals.post_save, signals.pre_delete, signals.post_delete)
+    saved = [(signal, signal.receivers) for signal in model_signals]
+    for signal in model_signals:
+        signal.receivers = []
+        signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        for signal, receivers in saved:
+            signal.receivers = receivers
+            signal.sender_receivers_cache.clear()
+
+
+def invalidate_caches():
+    """代替被暂停的信号使缓存失效, 需在事务之外调用, clear_cache 会先把待写入的阅读数落库"""
+    invalidate_published_article_ids()
+    invalidate_search_words()
+    clear_cache()
+
+
+class Command(BaseCommand):
+    help = 'seed a large dataset, record EXPLAIN plans and timings of hot queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=20000, help='number of articles to seed')
+        parser.add_argument('--comments', type=int, default=500, help='comments on the benchmark article')
+        parser.add_argument('--tracks', type=int, default=50000, help='number of owntracks logs to seed')
+        parser.add_argument('--repeat', type=int, default=20, help='executions per query')
+        parser.add_argument('--output', help='write the report as json to this file')
+        parser.add_argument('--compare', help='compare against a previous json report')
+        parser.add_argument('--keep', action='store_true',
+                            help='commit the seeded data, by default it is rolled back when finished')
+        parser.add_argument('--force', action='store_true', help='allow --keep outside the test database')
+
+    def seed(self, articles, comments, tracks):
+        with muted_model_signals():
+            return self._seed(articles, comments, tracks)
+
+    def _seed(self, articles, comments, tracks):
+        user = get_user_model().objects.get_or_create(
+            username=BENCHMARK_USER, defaults={'email': 'benchmark@benchmark.com'})[0]
+        category = Category.objects.get_or_create(name=BENCHMARK_PREFIX + 'category')[0]
+
+        exists = Article.objects.filter(title__startswith=BENCHMARK_PREFIX).count()
+        if exists < articles:
+            now = timezone.now()
+            Article.objects.bulk_create([
+                Article(
+                    title=BENCHMARK_PREFIX + str(i),
+                    body='benchmark content ' + str(i),
+                    author=user,
+                    category=category,
+                    status='p' if i % 10 else 'd',
+                    type='a' if i % 50 else 'p',
+                    views=(i * 7919) % 100000,
+                    article_order=1 if i % 1000 == 0 else 0,
+                    pub_time=now - datetime.timedelta(minutes=i)) for i in range(exists, articles)
+            ], batch_size=1000)
+
+        article = Article.objects.filter(title__startswith=BENCHMARK_PREFIX, status='p').first()
+        # 每条评论带 4 条回复, 按已有的评论数补齐, 重复运行不会再给已有评论加回复
+        roots = Comment.objects.filter(article=article, parent_comment=None, body__startswith='benchmark comment')
+        exists = roots.count()
+        bodies = ['benchmark comment ' + str(i) for i in range(exists, (comments + 4) // 5)]
+        if bodies:
+            Comment.objects.bulk_create([
+                Comment(body=body, author=user, article=article, is_enable=True) for body in bodies
+            ], batch_size=1000)
+            # MySQL 的 bulk_create 不回填主键
+            Comment.objects.bulk_create([
+                Comment(body='benchmark reply', author=user, article=article, is_enable=True,
+                        parent_comment=root) for root in roots.filter(body__in=bodies) for _ in range(4)
+            ], batch_size=1000)
+
+        exists = OwnTrackLog.objects.filter(tid__startswith=BENCHMARK_PREFIX).count()
+        if exists < tracks:
+            now = timezone.now()
+            OwnTrackLog.objects.bulk_create([
+                OwnTrackLog(tid=BENCHMARK_PREFIX + str(i % 5), lat=30.0, lon=120.0,
+                            creation_time=now - datetime.timedelta(minutes=i))
+                for i in range(exists, tracks)
+            ], batch_size=1000)
+        return article
+
+    def get_queries(self, article):
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        # (名称, queryset, 期望使用的索引)
+        return [
+            ('article_list',
+             Article.objects.filter(type='a', status='p')[:10],
+             'blog_article_list_idx'),
+            ('article_list_deep_page',
+             Article.objects.filter(type='a', status='p')[5000:5010],
+             'blog_article_list_idx'),
+            ('most_read',
+             Article.objects.filter(status='p').order_by('-views')[:10],
+             'blog_article_views_idx'),
+            ('article_comments',
+             Comment.objects.filter(article=article, is_enable=True, parent_comment=None),
+             'comment_article_enable_idx'),
+            ('owntracks_by_date',
+             OwnTrackLog.objects.filter(creation_time__range=(today, today + datetime.timedelta(days=1))),
+             'owntrack_time_tid_idx'),
+        ]
+
+    def measure(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - start) * 1000)
+        return {
+            'min_ms': round(min(timings), 3),
+            'median_ms': round(statistics.median(timings), 3),
+            'max_ms': round(max(timings), 3),
+        }
+
+    def handle(self, *args, **options):
+        if options['keep']:
+            check_database(options['force'])
+        # 默认在事务中生成数据, 结束后回滚, 不会留在数据库里
+        with transaction.atomic():
+            self.run(options)
+            if not options['keep']:
+                transaction.set_rollback(True)
+        invalidate_caches()
+        if not options['keep']:
+            self.stdout.write(self.style.SUCCESS('benchmark data rolled back'))
+
+    def run(self, options):
+        self.stdout.write('seeding data on %s' % connection.vendor)
+        article = self.seed(options['articles'], options['comments'], options['tracks'])
+        if article is None:
+            raise CommandError('no published benchmark article was seeded')
+
+        report = {'vendor': connection.vendor, 'queries': {}}
+        for name, queryset, index in self.get_queries(article):
+            plan = queryset.explain()
+            result = self.measure(queryset, options['repeat'])
+            result['plan'] = plan
+            result['expected_index'] = index
+            result['uses_index'] = index in plan
+            report['queries'][name] = result
+            style = self.style.SUCCESS if result['uses_index'] else self.style.WARNING
+            self.stdout.write(style('%-24s median %8.3fms  index %s: %s' % (
+                name, result['median_ms'], index, 'yes' if result['uses_index'] else 'NO')))
+            self.stdout.write(plan)
+
+        if options['compare']:
+            self.compare(report, options['compare'])
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS('report saved to %s' % options['output']))
+
+    @staticmethod
+    def cleanup():
+        """删除 seed 创建的文章、评论、定位记录和分类, benchmark 用户没有其他文章时一并删除"""
+        with muted_model_signals():
+            Comment.objects.filter(article__title__startswith=BENCHMARK_PREFIX).delete()
+            Article.objects.filter(title__startswith=BENCHMARK_PREFIX).delete()
+            Category.objects.filter(name=BENCHMARK_PREFIX + 'category').delete()
+            OwnTrackLog.objects.filter(tid__startswith=BENCHMARK_PREFIX).delete()
+            user = get_user_model().objects.filter(username=BENCHMARK_USER).first()
+            if user is not None and not Article.objects.filter(author=user).exists():
+                user.delete()
+        invalidate_caches()
+
+    def compare(self, report, path):
+        with open(path) as file:
+            baseline = json.load(file)
+        if baseline.get('vendor') != report['vendor']:
+            self.stdout.write(self.style.WARNING('baseline was recorded on %s' % baseline.get('vendor')))
+        for name, result in report['queries'].items():
+            old = baseline.get('queries', {}).get(name)
+            if not old:
+                continue
+            if old['plan'] != result['plan']:
+                self.stdout.write(self.style.WARNING('%s: plan changed' % name))
+            if old['median_ms'] and result['median_ms'] > old['median_ms'] * 1.5:
+                self.stdout.write(self.style.WARNING('%s: median %.3fms -> %.3fms' % (
+                    name, old['median_ms'], result['median_ms'])))
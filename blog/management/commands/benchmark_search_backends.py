@@ -0,0 +1,186 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from haystack import connections
+from haystack.query import SearchQuerySet
+from haystack.views import search_view_factory
+
+from blog.management.commands.create_testdata import CORPUS_CATEGORY, EN_WORDS, ZH_WORDS, \
+    create_corpus
+from blog.models import Article
+from blog.utils import invalidate_published_article_ids
+from blog.views import EsSearchView
+from djangoblog.elasticsearch_backend import ElasticSearchModelSearchForm
+
+ENGINES = {
+    'whoosh': 'djangoblog.whoosh_cn_backend.WhooshEngine',
+    'sqlite_fts': 'djangoblog.sqlite_fts_backend.SqliteFtsEngine',
+}
+BENCHMARK_ALIAS = 'benchmark_{name}'
+
+
+def get_dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def percentile(timings, p):
+    """timings 已排序, 取最近秩"""
+    return round(timings[max(int(round(len(timings) * p / 100.0)) - 1, 0)], 3)
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+    }
+
+
+class Command(BaseCommand):
+    help = 'generate a chinese/english corpus, index it into each search engine and replay a query mix'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--docs', type=int, default=2000, help='number of generated articles')
+        parser.add_argument('--queries', type=int, default=100, help='number of queries in the mix')
+        parser.add_argument('--repeat', type=int, default=3, help='times the query mix is replayed')
+        parser.add_argument('--batch-size', type=int, default=200, help='documents per update call')
+        parser.add_argument('--engine', action='append', choices=sorted(ENGINES),
+                            help='engine to benchmark, may be repeated, default all')
+        parser.add_argument('--seed', type=int, default=0, help='random seed for the corpus and queries')
+        parser.add_argument('--output', help='write the report as json to this file')
+        parser.add_argument('--compare', help='compare against a previous json report')
+        parser.add_argument('--keep', action='store_true', help='keep the generated articles')
+
+    def get_query_mix(self, count, seed):
+        """常见词/少见词/两个词组合/英文词混合"""
+        rng = random.Random(seed)
+        queries = []
+        for i in range(count):
+            kind = i % 4
+            if kind == 0:
+                queries.append(rng.choice(ZH_WORDS[:10]))
+            elif kind == 1:
+                queries.append(rng.choice(ZH_WORDS[10:]))
+            elif kind == 2:
+                queries.append(' '.join(rng.sample(ZH_WORDS, 2)))
+            else:
+                queries.append(rng.choice(EN_WORDS))
+        return queries
+
+    def index(self, alias, queryset, batch_size):
+        backend = connections[alias].get_backend()
+        index = connections[alias].get_unified_index().get_index(Article)
+        backend.clear()
+        ids = list(queryset.values_list('id', flat=True))
+        start = time.perf_counter()
+        for i in range(0, len(ids), batch_size):
+            backend.update(index, list(index.read_queryset(alias).filter(id__in=ids[i:i + batch_size])))
+        return time.perf_counter() - start
+
+    def replay(self, alias, queries, repeat):
+        view = search_view_factory(view_class=EsSearchView, form_class=ElasticSearchModelSearchForm,
+                                   searchqueryset=SearchQuerySet(using=alias))
+        factory = RequestFactory()
+        sqs_timings = []
+        view_timings = []
+        for _ in range(repeat):
+            for query in queries:
+                start = time.perf_counter()
+                list(SearchQuerySet(using=alias).auto_query(query).load_all()[:10])
+                sqs_timings.append((time.perf_counter() - start) * 1000)
+
+                request = factory.get('/search', {'q': query})
+                request.user = AnonymousUser()
+                request.session = {}
+                start = time.perf_counter()
+                view(request)
+                view_timings.append((time.perf_counter() - start) * 1000)
+        return summarize(sqs_timings), summarize(view_timings)
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.get_or_create(
+            username='benchmark', defaults={'email': 'benchmark@benchmark.com'})[0]
+        self.stdout.write('generating {docs} articles'.format(docs=options['docs']))
+        # 每次运行使用新的分类, 不统计也不删除之前运行或 create_testdata --corpus 留下的文章
+        category_name = '{name} {run}'.format(name=CORPUS_CATEGORY, run=uuid.uuid4().hex[:8])
+        category = create_corpus(options['docs'], user, options['seed'], category_name)
+        queryset = Article.objects.filter(category=category)
+        queries = self.get_query_mix(options['queries'], options['seed'])
+
+        report = {'docs': queryset.count(), 'queries': len(queries), 'repeat': options['repeat'], 'engines': {}}
+        workdir = tempfile.mkdtemp()
+        try:
+            # 结果缓存会让重复查询不经过后端
+            with override_settings(SEARCH_RESULT_CACHE_TIMEOUT=0):
+                for name in options['engine'] or sorted(ENGINES):
+                    alias = BENCHMARK_ALIAS.format(name=name)
+                    path = os.path.join(workdir, name)
+                    # connections_info 与 settings.HAYSTACK_CONNECTIONS 是同一个 dict, 引擎从中读取配置
+                    connections.connections_info[alias] = {
+                        'ENGINE': ENGINES[name],
+                        'PATH': os.path.join(path, 'index.sqlite3') if name == 'sqlite_fts' else path,
+                    }
+                    try:
+                        seconds = self.index(alias, queryset, options['batch_size'])
+                        sqs, view = self.replay(alias, queries, options['repeat'])
+                    finally:
+                        connections.connections_info.pop(alias, None)
+                        getattr(connections.thread_local, 'connections', {}).pop(alias, None)
+                    result = {
+                        'docs_per_sec': round(report['docs'] / seconds, 1) if seconds else 0,
+                        'size_kb': round(get_dir_size(path) / 1024, 1),
+                        'searchqueryset': sqs,
+                        'view': view,
+                    }
+                    report['engines'][name] = result
+                    self.stdout.write(
+                        '{name:<12} index {docs_per_sec} docs/s  size {size_kb}KB'.format(name=name, **result))
+                    for path_name in ('searchqueryset', 'view'):
+                        self.stdout.write('  {path:<16} p50 {p50_ms}ms  p95 {p95_ms}ms  p99 {p99_ms}ms'.format(
+                            path=path_name, **result[path_name]))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+            if not options['keep']:
+                queryset.delete()
+                category.delete()
+                invalidate_published_article_ids()
+
+        if options['compare']:
+            self.compare(report, options['compare'])
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS('report saved to %s' % options['output']))
+
+    def compare(self, report, path):
+        with open(path) as file:
+            baseline = json.load(file)
+        if baseline.get('docs') != report['docs']:
+            self.stdout.write(self.style.WARNING('baseline indexed %s docs' % baseline.get('docs')))
+        for name, result in report['engines'].items():
+            old = baseline.get('engines', {}).get(name)
+            if not old:
+                continue
+            if old['docs_per_sec'] and result['docs_per_sec'] < old['docs_per_sec'] / 1.5:
+                self.stdout.write(self.style.WARNING('%s: index %.1f -> %.1f docs/s' % (
+                    name, old['docs_per_sec'], result['docs_per_sec'])))
+            for path_name in ('searchqueryset', 'view'):
+                before, after = old[path_name]['p95_ms'], result[path_name]['p95_ms']
+                if before and after > before * 1.5:
+                    self.stdout.write(self.style.WARNING('%s %s: p95 %.3fms -> %.3fms' % (
+                        name, path_name, before, after)))
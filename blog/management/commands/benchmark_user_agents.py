@@ -0,0 +1,61 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from djangoblog.utils import _parse_user_agent, parse_user_agent, parse_user_agent_uncached
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/124.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+    'Version/17.4 Safari/605.1.15',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+    'Version/17.4 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Chrome/124.0.0.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0',
+    'Mozilla/5.0 (Linux; Android 13; SM-S9080) AppleWebKit/537.36 (KHTML, like Gecko) '
+    'Version/4.0 Chrome/110.0.5481.153 Mobile Safari/537.36 MicroMessenger/8.0.47.2560',
+    'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+    'Mozilla/5.0 (compatible; Baiduspider/2.0; +http://www.baidu.com/search/spider.html)',
+    'Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)',
+    'Sogou web spider/4.0(+http://www.sogou.com/docs/help/webmasters.htm#07)',
+    'curl/8.5.0',
+    'python-requests/2.31.0',
+]
+
+
+class Command(BaseCommand):
+    help = 'compare uncached and cached user agent parsing on a replayed traffic mix'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000, help='number of user agents to parse')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def run(self, parse, agents):
+        start = time.perf_counter()
+        for agent in agents:
+            parse(agent)
+        return time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # 少数几种浏览器占大部分流量
+        weights = [len(USER_AGENTS) - i for i in range(len(USER_AGENTS))]
+        agents = rng.choices(USER_AGENTS, weights=weights, k=options['requests'])
+
+        _parse_user_agent.cache_clear()
+        uncached = self.run(parse_user_agent_uncached, agents)
+        cached = self.run(parse_user_agent, agents)
+        info = _parse_user_agent.cache_info()
+
+        count = len(agents)
+        self.stdout.write('parsed {count} user agents, {distinct} distinct'.format(
+            count=count, distinct=len(set(agents))))
+        self.stdout.write('uncached {total:.1f}ms  {each:.1f}us/parse'.format(
+            total=uncached * 1000, each=uncached * 1e6 / count))
+        self.stdout.write('cached   {total:.1f}ms  {each:.1f}us/parse  hits {hits} misses {misses}'.format(
+            total=cached * 1000, each=cached * 1e6 / count, hits=info.hits, misses=info.misses))
+        if cached:
+            self.stdout.write(self.style.SUCCESS('speedup {speedup:.1f}x'.format(speedup=uncached / cached)))
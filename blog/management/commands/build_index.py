@@ -4,15 +4,23 @@ from blog.documents import ElapsedTimeDocument, ArticleDocumentManager, ElaspedT
     ELASTICSEARCH_ENABLED
 
 
-# TODO 参数化
 class Command(BaseCommand):
     help = 'build search index'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='only index articles modified since the last successful build')
+        parser.add_argument('--parallel', action='store_true', help='use parallel bulk requests')
+        parser.add_argument('--chunk-size', type=int, default=500, help='documents per bulk request')
+
     def handle(self, *args, **options):
         if ELASTICSEARCH_ENABLED:
             ElaspedTimeDocumentManager.build_index()
             manager = ElapsedTimeDocument()
             manager.init()
             manager = ArticleDocumentManager()
-            manager.delete_index()
-            manager.rebuild()
+            stats = manager.rebuild(chunk_size=options['chunk_size'],
+                                    parallel=options['parallel'],
+                                    incremental=options['incremental'])
+            self.stdout.write(self.style.SUCCESS(
+                'indexed {count} articles in {seconds}s ({docs_per_sec} docs/s)'.format(**stats)))
@@ -1,13 +1,12 @@
 from django.core.management.base import BaseCommand
 
-from blog.models import Tag, Category
+from blog.utils import get_search_words
 
 
-# TODO 参数化
 class Command(BaseCommand):
-    help = 'build search words'
+    help = 'build search words used by the search box suggestions'
 
     def handle(self, *args, **options):
-        datas = set([t.name for t in Tag.objects.all()] +
-                    [t.name for t in Category.objects.all()])
-        print('\n'.join(datas))
+        words = get_search_words(refresh=True)
+        self.stdout.write('\n'.join(name for _, name in words))
+        self.stdout.write(self.style.SUCCESS('cached {count} search words'.format(count=len(words))))
@@ -1,11 +1,11 @@
 from django.core.management.base import BaseCommand
 
-from djangoblog.utils import cache
+from djangoblog.utils import clear_cache
 
 
 class Command(BaseCommand):
     help = 'clear the whole cache'
 
     def handle(self, *args, **options):
-        cache.clear()
+        clear_cache()
         self.stdout.write(self.style.SUCCESS('Cleared cache\n'))
@@ -1,13 +1,78 @@
+import random
+
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
 from django.core.management.base import BaseCommand
 
 from blog.models import Article, Tag, Category
 
+ZH_WORDS = [
+    '博客', '搜索', '索引', '分词', '数据库', '缓存', '部署', '性能', '优化', '服务器',
+    '并发', '线程', '异步', '队列', '日志', '监控', '测试', '框架', '模板', '中间件',
+    '容器', '网络', '安全', '算法', '数据', '查询', '接口', '用户', '评论', '文章',
+    '配置', '迁移', '备份', '权限', '会员', '图片', '视频', '统计', '分页', '排序',
+]
+EN_WORDS = [
+    'django', 'python', 'whoosh', 'elasticsearch', 'sqlite', 'redis', 'nginx', 'docker',
+    'gunicorn', 'linux', 'cache', 'index', 'query', 'search', 'haystack', 'jieba',
+    'mysql', 'celery', 'kubernetes', 'benchmark',
+]
+CORPUS_CATEGORY = '语料'
+
+
+def _zipf_weights(words):
+    # 词频大致服从 zipf 分布, 少数词非常常见
+    return [1.0 / (rank + 1) for rank in range(len(words))]
+
+
+def generate_text(rng, count):
+    """生成中英文混合的一句话"""
+    words = []
+    for _ in range(count):
+        if rng.random() < 0.8:
+            words.append(rng.choices(ZH_WORDS, _zipf_weights(ZH_WORDS))[0])
+        else:
+            words.append(' ' + rng.choices(EN_WORDS, _zipf_weights(EN_WORDS))[0] + ' ')
+    return ''.join(words).strip()
+
+
+def generate_corpus(count, seed=0):
+    """
+    生成 count 篇文章的标题和正文
+    :return: list of (title, body)
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        title = generate_text(rng, rng.randint(3, 6))
+        body = '\n\n'.join(
+            '。'.join(generate_text(rng, rng.randint(8, 20)) for _ in range(rng.randint(2, 5))) + '。'
+            for _ in range(rng.randint(3, 10)))
+        corpus.append(('{title} {i}'.format(title=title, i=i), body))
+    return corpus
+
+
+def create_corpus(count, user, seed=0, category_name=CORPUS_CATEGORY):
+    """
+    批量创建语料文章, 放在单独的分类下便于删除, bulk_create 不触发索引更新
+    :param category_name: 语料分类名, 传入唯一的名称可以只取到本次创建的文章
+    :return: 语料分类
+    """
+    category = Category.objects.get_or_create(name=category_name, parent_category=None)[0]
+    Article.objects.bulk_create([
+        Article(title=title, body=body, author=user, category=category, status='p', type='a')
+        for title, body in generate_corpus(count, seed)
+    ], batch_size=500)
+    return category
+
 
 class Command(BaseCommand):
     help = 'create test datas'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', type=int, default=0,
+                            help='also create this many generated chinese/english articles')
+
     def handle(self, *args, **options):
         user = get_user_model().objects.get_or_create(
             email='test@test.com', username='测试用户', password=make_password('test!q@w#eTYU'))[0]
@@ -35,6 +100,9 @@ class Command(BaseCommand):
             article.tags.add(basetag)
             article.save()
 
-        from djangoblog.utils import cache
-        cache.clear()
+        if options['corpus']:
+            create_corpus(options['corpus'], user)
+
+        from djangoblog.utils import clear_cache
+        clear_cache()
         self.stdout.write(self.style.SUCCESS('created test datas \n'))
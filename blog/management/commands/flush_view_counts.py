@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog.view_counter import flush_all_pending_views
+
+
+class Command(BaseCommand):
+    help = 'write buffered article and video views back to the database'
+
+    def handle(self, *args, **options):
+        total = flush_all_pending_views()
+        self.stdout.write(self.style.SUCCESS('flushed %d views' % total))
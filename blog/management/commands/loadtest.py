@@ -0,0 +1,193 @@
+import json
+import threading
+import time
+
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from blog.management.commands.benchmark_queries import BENCHMARK_PREFIX, BENCHMARK_USER, \
+    Command as BenchmarkQueriesCommand, check_database, invalidate_caches, muted_model_signals
+from blog.management.commands.benchmark_search_backends import summarize
+from blog.models import Article, Category
+from owntracks.models import OwnTrackLog
+
+LOADTEST_TID = 'loadtest'
+LOADTEST_COMMENT = 'loadtest comment'
+# 需要登录的场景, 只能在进程内运行, 其余场景以匿名用户访问
+LOGIN_REQUIRED = ('comment_post',)
+
+
+class RemoteClient:
+    """与 django.test.Client 相同的 get/post 接口, 请求发往已运行的服务"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def get(self, path, data=None):
+        return self.session.get(self.base_url + path, params=data, allow_redirects=False)
+
+    def post(self, path, data=None, content_type=None):
+        headers = {'Content-Type': content_type} if content_type else {}
+        return self.session.post(self.base_url + path, data=data, headers=headers, allow_redirects=False)
+
+
+class Command(BaseCommand):
+    help = 'seed data and replay key endpoints in-process or against a running server, ' \
+           'reporting throughput and latency percentiles per scenario'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=2000, help='number of articles to seed')
+        parser.add_argument('--comments', type=int, default=300, help='comments on the benchmark article')
+        parser.add_argument('--images', type=int, default=200, help='images in the gallery article')
+        parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=1, help='concurrent clients per scenario')
+        parser.add_argument('--url', help='base url of a running server, default in-process')
+        parser.add_argument('--scenario', action='append', help='scenario to run, may be repeated, default all')
+        parser.add_argument('--output', help='write the report as json to this file')
+        parser.add_argument('--compare', help='compare against a previous json report')
+        parser.add_argument('--keep', action='store_true', help='keep the seeded data when finished')
+        parser.add_argument('--force', action='store_true', help='allow seeding outside the test database')
+
+    def seed(self, options):
+        article = BenchmarkQueriesCommand().seed(options['articles'], options['comments'], 0)
+        if article is None:
+            raise CommandError('no published benchmark article was seeded')
+        body = '\n\n'.join('![image {i}](/static/blog/img/loadtest-{i}.png)'.format(i=i)
+                           for i in range(options['images']))
+        with muted_model_signals():
+            gallery = Article.objects.update_or_create(
+                title=BENCHMARK_PREFIX + 'gallery',
+                defaults={'body': body, 'author': article.author, 'status': 'p', 'type': 'a',
+                          'category': Category.objects.get(name=BENCHMARK_PREFIX + 'category')})[0]
+        invalidate_caches()
+        return article, gallery
+
+    def get_scenarios(self, article, gallery):
+        published = Article.objects.filter(type='a', status='p').count()
+        deep_page = max(published // 10 // 2, 1)
+        track = json.dumps({'tid': LOADTEST_TID, 'lat': 30.0, 'lon': 120.0})
+        # (名称, 请求函数, 期望的状态码)
+        return [
+            ('index', lambda c: c.get('/'), 200),
+            ('list_deep_page', lambda c: c.get(reverse('blog:index_page', kwargs={'page': deep_page})), 200),
+            ('article_detail', lambda c: c.get(article.get_absolute_url()), 200),
+            ('search', lambda c: c.get('/search', {'q': 'benchmark'}), 200),
+            ('comment_post', lambda c: c.post(reverse('comment:postcomment', kwargs={'article_id': article.id}),
+                                              {'body': LOADTEST_COMMENT}), 302),
+            ('paginated_images', lambda c: c.get(reverse('get_paginated_images',
+                                                         kwargs={'article_id': gallery.id, 'page_num': 2})), 200),
+            ('owntracks_ingest', lambda c: c.post(reverse('owntracks:logtracks'), track,
+                                                  content_type='application/json'), 200),
+        ]
+
+    def get_client(self, options, user=None):
+        if options['url']:
+            return RemoteClient(options['url'])
+        client = Client()
+        if user:
+            client.force_login(user)
+        return client
+
+    def run_scenario(self, request, status, options, user=None):
+        timings = []
+        errors = [0]
+        lock = threading.Lock()
+        per_client = [options['requests'] // options['concurrency']] * options['concurrency']
+        per_client[0] += options['requests'] % options['concurrency']
+
+        def worker(count):
+            client = self.get_client(options, user)
+            local_timings = []
+            local_errors = 0
+            for _ in range(count):
+                start = time.perf_counter()
+                response = request(client)
+                local_timings.append((time.perf_counter() - start) * 1000)
+                if response.status_code != status:
+                    local_errors += 1
+            with lock:
+                timings.extend(local_timings)
+                errors[0] += local_errors
+
+        def thread_worker(count):
+            try:
+                worker(count)
+            finally:
+                connections.close_all()
+
+        start = time.perf_counter()
+        if options['concurrency'] == 1:
+            worker(options['requests'])
+        else:
+            threads = [threading.Thread(target=thread_worker, args=(count,)) for count in per_client if count]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        seconds = time.perf_counter() - start
+        return dict(summarize(timings), requests=len(timings), errors=errors[0],
+                    rps=round(len(timings) / seconds, 1) if seconds else 0)
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+        # 请求由其他线程或远程服务处理, 数据必须提交, 不能像 benchmark_queries 那样回滚
+        check_database(options['force'])
+        self.stdout.write('seeding data')
+        article, gallery = self.seed(options)
+        user = get_user_model().objects.get(username=BENCHMARK_USER)
+        scenarios = self.get_scenarios(article, gallery)
+        names = options['scenario'] or [name for name, _, _ in scenarios]
+
+        report = {'target': options['url'] or 'in-process', 'requests': options['requests'],
+                  'concurrency': options['concurrency'], 'scenarios': {}}
+        # 进程内运行时测的是应用本身, 不经过限流, 评论通知邮件不真正发送
+        with override_settings(RATE_LIMIT_REQUESTS=10 ** 9, RATE_LIMIT_ROUTES=[],
+                               EMAIL_BACKEND='django.core.mail.backends.dummy.EmailBackend'):
+            for name, request, status in scenarios:
+                if name not in names:
+                    continue
+                if options['url'] and name in LOGIN_REQUIRED:
+                    self.stdout.write(self.style.WARNING('%s: skipped, needs a logged in in-process client' % name))
+                    continue
+                result = self.run_scenario(request, status, options, user if name in LOGIN_REQUIRED else None)
+                report['scenarios'][name] = result
+                style = self.style.WARNING if result['errors'] else self.style.SUCCESS
+                self.stdout.write(style(
+                    '{name:<18} {rps:>8} req/s  p50 {p50_ms}ms  p95 {p95_ms}ms  p99 {p99_ms}ms  '
+                    'errors {errors}'.format(name=name, **result)))
+
+        if options['compare']:
+            self.compare(report, options['compare'])
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS('report saved to %s' % options['output']))
+
+        if not options['keep']:
+            OwnTrackLog.objects.filter(tid=LOADTEST_TID).delete()
+            BenchmarkQueriesCommand.cleanup()
+            self.stdout.write(self.style.SUCCESS('loadtest data deleted'))
+
+    def compare(self, report, path):
+        with open(path) as file:
+            baseline = json.load(file)
+        if baseline.get('target') != report['target'] or baseline.get('concurrency') != report['concurrency']:
+            self.stdout.write(self.style.WARNING('baseline was recorded against %s with concurrency %s' % (
+                baseline.get('target'), baseline.get('concurrency'))))
+        for name, result in report['scenarios'].items():
+            old = baseline.get('scenarios', {}).get(name)
+            if not old:
+                continue
+            if old['rps'] and result['rps'] < old['rps'] / 1.5:
+                self.stdout.write(self.style.WARNING('%s: %.1f -> %.1f req/s' % (name, old['rps'], result['rps'])))
+            if old['p95_ms'] and result['p95_ms'] > old['p95_ms'] * 1.5:
+                self.stdout.write(self.style.WARNING('%s: p95 %.3fms -> %.3fms' % (
+                    name, old['p95_ms'], result['p95_ms'])))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from blog.documents import ELASTICSEARCH_ENABLED
+from blog.telemetry import rollup_performance
+
+
+class Command(BaseCommand):
+    help = 'aggregate the performance index into per-url, per-minute rollups and expire old raw events'
+
+    def handle(self, *args, **options):
+        if ELASTICSEARCH_ENABLED:
+            count = rollup_performance()
+            self.stdout.write(self.style.SUCCESS('wrote %d rollups' % count))
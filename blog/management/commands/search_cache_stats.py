@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from djangoblog.search_cache import get_search_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'show search result cache hit rate and backend time saved'
+
+    def handle(self, *args, **options):
+        stats = get_search_cache_stats()
+        self.stdout.write(
+            'hits {hits}  misses {misses}  hit rate {hit_rate:.2%}\n'
+            'avg backend {avg_backend_ms}ms  saved ~{saved_ms}ms  generation {generation}'.format(**stats))
@@ -0,0 +1,55 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+
+from blog.models import Article, Category
+from djangoblog.timing import advise
+
+
+class Command(BaseCommand):
+    help = 'replay pages in-process, time every blog template tag and filter, ' \
+           'and recommend which ones to fragment-cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', help='path to replay, may be repeated, '
+                                                            'default the index, recent articles and categories')
+        parser.add_argument('--articles', type=int, default=10, help='recent articles replayed by default')
+        parser.add_argument('--repeat', type=int, default=3, help='times each path is requested')
+        parser.add_argument('--min-repeat', type=float, default=0.5, help='input repeat rate worth caching')
+        parser.add_argument('--min-ms', type=float, default=0.5, help='average milliseconds worth caching')
+        parser.add_argument('--output', help='write the report as json to this file')
+
+    def get_paths(self, options):
+        if options['path']:
+            return options['path']
+        paths = ['/', '/page/2/']
+        articles = Article.objects.filter(type='a', status='p').order_by('-pub_time')[:options['articles']]
+        paths += [article.get_absolute_url() for article in articles]
+        paths += [category.get_absolute_url() for category in Category.objects.all()[:5]]
+        return paths
+
+    def handle(self, *args, **options):
+        paths = self.get_paths(options)
+        client = Client()
+        with override_settings(RATE_LIMIT_REQUESTS=10 ** 9, RATE_LIMIT_ROUTES=[]), advise() as advisor:
+            for _ in range(options['repeat']):
+                for path in paths:
+                    client.get(path)
+        rows = advisor.report(min_repeat=options['min_repeat'], min_ms=options['min_ms'])
+
+        self.stdout.write('replayed {count} paths x {repeat}'.format(count=len(paths), repeat=options['repeat']))
+        self.stdout.write('{:<28}{:>8}{:>10}{:>9}{:>10}{:>10}{:>11}'.format(
+            'tag', 'calls', 'distinct', 'repeat', 'avg ms', 'max ms', 'saved ms'))
+        for row in rows:
+            line = '{name:<28}{calls:>8}{distinct_inputs:>10}{repeat_rate:>9.0%}{avg_ms:>10.3f}' \
+                   '{max_ms:>10.3f}{saved_ms:>11.1f}'.format(**row)
+            self.stdout.write(self.style.SUCCESS(line) if row['cache'] else line)
+        recommended = [row['name'] for row in rows if row['cache']]
+        self.stdout.write('fragment-cache candidates: %s' % (', '.join(recommended) or 'none'))
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({'paths': paths, 'repeat': options['repeat'], 'tags': rows}, file, indent=2)
+            self.stdout.write(self.style.SUCCESS('report saved to %s' % options['output']))
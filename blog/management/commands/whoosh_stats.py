@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from haystack import connections
+
+from djangoblog.whoosh_cn_backend import WhooshSearchBackend, get_metrics
+
+
+class Command(BaseCommand):
+    help = 'show whoosh segment count, merge and writer lock metrics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--using', default='default', help='haystack connection')
+        parser.add_argument('--merge', action='store_true', help='merge small segments now')
+        parser.add_argument('--optimize', action='store_true', help='merge all segments into one')
+
+    def handle(self, *args, **options):
+        backend = connections[options['using']].get_backend()
+        if not isinstance(backend, WhooshSearchBackend):
+            raise CommandError('connection {using} is not a whoosh backend'.format(using=options['using']))
+        if options['merge'] or options['optimize']:
+            elapsed = backend.merge_segments(optimize=options['optimize'])
+            if elapsed is None:
+                self.stdout.write(self.style.WARNING('index is locked, merge skipped'))
+            else:
+                self.stdout.write(self.style.SUCCESS('merged in {elapsed}ms'.format(elapsed=elapsed)))
+        metrics = get_metrics()
+        metrics['segments'] = backend.segment_count()
+        for name, value in sorted(metrics.items()):
+            self.stdout.write('{name:<16} {value}'.format(name=name, value=value))
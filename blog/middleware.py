@@ -1,10 +1,12 @@
 import logging
-import time
+import random
 
+from django.conf import settings
+from django.utils import timezone
 from ipware import get_client_ip
-from user_agents import parse
 
-from blog.documents import ELASTICSEARCH_ENABLED, ElaspedTimeDocumentManager
+from blog.documents import ELASTICSEARCH_ENABLED
+from djangoblog.timing import request_timing
 
 logger = logging.getLogger(__name__)
 
@@ -16,27 +18,39 @@ class OnlineMiddleware(object):
 
     def __call__(self, request):
         ''' page render time '''
-        start_time = time.time()
-        response = self.get_response(request)
-        http_user_agent = request.META.get('HTTP_USER_AGENT', '')
-        ip, _ = get_client_ip(request)
-        user_agent = parse(http_user_agent)
-        if not response.streaming:
+        with request_timing() as timings:
+            response = self.get_response(request)
+        # 耗时放在 Server-Timing 头中, 不再改写响应内容, 流式响应同样适用
+        if getattr(settings, 'SERVER_TIMING', True):
+            response['Server-Timing'] = timings.header()
+        if ELASTICSEARCH_ENABLED:
             try:
-                cast_time = time.time() - start_time
-                if ELASTICSEARCH_ENABLED:
-                    time_taken = round((cast_time) * 1000, 2)
-                    url = request.path
-                    from django.utils import timezone
-                    ElaspedTimeDocumentManager.create(
-                        url=url,
-                        time_taken=time_taken,
-                        log_datetime=timezone.now(),
-                        useragent=user_agent,
-                        ip=ip)
-                response.content = response.content.replace(
-                    b'<!!LOAD_TIMES!!>', str.encode(str(cast_time)[:5]))
+                # 只入队, UA 解析和写入 ES 都在后台线程中完成
+                from blog.telemetry import elapsed_time_queue
+                ip, _ = get_client_ip(request)
+                elapsed_time_queue.record({
+                    'url': request.path,
+                    'time_taken': round(timings.total, 2),
+                    'log_datetime': timezone.now(),
+                    'useragent': request.META.get('HTTP_USER_AGENT', ''),
+                    'ip': ip,
+                })
             except Exception as e:
                 logger.error("Error OnlineMiddleware: %s" % e)
+        if getattr(settings, 'REQUEST_PROFILING', False) and \
+                random.random() < getattr(settings, 'REQUEST_PROFILING_SAMPLE_RATE', 0.01):
+            self.record_profile(request, response, timings)
 
         return response
+
+    def record_profile(self, request, response, timings):
+        from blog.telemetry import request_profile_queue
+        match = getattr(request, 'resolver_match', None)
+        request_profile_queue.record(dict(
+            timings.as_dict(),
+            path=request.path[:500],
+            view_name=match.view_name[:200] if match else '',
+            method=request.method,
+            status_code=response.status_code,
+            creation_time=timezone.now(),
+        ))
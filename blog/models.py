@@ -34,7 +34,7 @@ class BaseModel(models.Model):
     def save(self, *args, **kwargs):
         is_update_views = isinstance(
             self,
-            Article) and 'update_fields' in kwargs and kwargs['update_fields'] == ['views']
+            Article) and kwargs.get('update_fields') is not None and set(kwargs['update_fields']) == {'views'}
         if is_update_views:
             Article.objects.filter(pk=self.pk).update(views=self.views)
         else:
@@ -166,13 +166,24 @@ class Article(BaseModel):
 
 
         # Call the original delete method to delete the Article instance
-        super().delete(*args, **kwargs)
+        article_id = self.id
+        result = super().delete(*args, **kwargs)
+        from blog.utils import discard_published_article
+        discard_published_article(article_id)
+        return result
 
     class Meta:
         ordering = ['-article_order', '-pub_time']
         verbose_name = _('article')
         verbose_name_plural = verbose_name
         get_latest_by = 'id'
+        indexes = [
+            # 首页/列表页: filter(status, type) order_by(-article_order, -pub_time)
+            models.Index(fields=['status', 'type', '-article_order', '-pub_time'],
+                         name='blog_article_list_idx'),
+            # 阅读排行: filter(status) order_by(-views)
+            models.Index(fields=['status', '-views'], name='blog_article_views_idx'),
+        ]
 
     def get_absolute_url(self):
         return reverse('blog:detailbyid', kwargs={
@@ -190,20 +201,36 @@ class Article(BaseModel):
         return names
 
     def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            # update_fields 可以是任意可迭代对象, 与 blog_signals 一样按集合比较
+            update_fields = kwargs['update_fields'] = list(update_fields)
+        is_update_views = update_fields is not None and set(update_fields) == {'views'}
+        if not is_update_views:
+            # 增量同步搜索索引依赖修改时间
+            self.last_modify_time = now()
+            if update_fields is not None:
+                kwargs['update_fields'] = update_fields + ['last_modify_time']
         super().save(*args, **kwargs)
+        if not is_update_views:
+            from blog.utils import sync_published_article
+            sync_published_article(self)
 
-    def viewed(self):
-        self.views += 1
-        self.save(update_fields=['views'])
+    def viewed(self, request=None):
+        from blog.view_counter import record_view, with_pending_views
+        record_view(self, request)
+        # 显示数据库中的浏览数加上尚未写回的部分
+        with_pending_views(self)
 
     def comment_list(self):
         cache_key = 'article_comments_{id}'.format(id=self.id)
         value = cache.get(cache_key)
-        if value:
+        if value is not None:
             logger.info('get article comments:{id}'.format(id=self.id))
             return value
         else:
-            comments = self.comment_set.filter(is_enable=True).order_by('-id')
+            comments = list(self.comment_set.filter(is_enable=True).select_related(
+                'author').order_by('-id'))
             cache.set(cache_key, comments, 60 * 100)
             logger.info('set article comments:{id}'.format(id=self.id))
             return comments
@@ -212,16 +239,21 @@ class Article(BaseModel):
         info = (self._meta.app_label, self._meta.model_name)
         return reverse('admin:%s_%s_change' % info, args=(self.pk,))
 
-    @cache_decorator(expiration=60 * 100)
+    def get_adjacent_articles(self):
+        """
+        获得下一篇与上一篇,基于缓存的已发布id列表二分查找
+        :return: (下一篇, 上一篇)
+        """
+        from blog.utils import get_adjacent_articles
+        return get_adjacent_articles(self.id)
+
     def next_article(self):
         # 下一篇
-        return Article.objects.filter(
-            id__gt=self.id, status='p').order_by('id').first()
+        return self.get_adjacent_articles()[0]
 
-    @cache_decorator(expiration=60 * 100)
     def prev_article(self):
         # 前一篇
-        return Article.objects.filter(id__lt=self.id, status='p').first()
+        return self.get_adjacent_articles()[1]
 
 
 class Category(BaseModel):
@@ -332,9 +364,11 @@ class Video(BaseModel):
     def get_absolute_url(self):
         return reverse('blog:video_detail', kwargs={'video_id': self.id})
 
-    def viewed(self):
-        self.views += 1
-        self.save(update_fields=['views'])
+    def viewed(self, request=None):
+        from blog.view_counter import record_view, with_pending_views
+        record_view(self, request)
+        # 显示数据库中的浏览数加上尚未写回的部分
+        with_pending_views(self)
 
 
 class Links(models.Model):
@@ -448,8 +482,8 @@ class BlogSettings(models.Model):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
-        from djangoblog.utils import cache
-        cache.clear()
+        from djangoblog.utils import clear_cache
+        clear_cache()
 
 
 class MembershipType(models.Model):
@@ -5,9 +5,15 @@ from blog.models import Article
 
 class ArticleIndex(indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True, use_template=True)
+    # 只更新这些字段时无需重建索引, 见 djangoblog.signal_processor
+    skip_update_fields = ('views',)
 
     def get_model(self):
         return Article
 
     def index_queryset(self, using=None):
         return self.get_model().objects.filter(status='p')
+
+    def read_queryset(self, using=None):
+        # 搜索结果页批量加载文章时一并取出作者/分类/标签
+        return self.index_queryset(using).select_related('author', 'category').prefetch_related('tags')
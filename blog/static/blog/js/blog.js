@@ -43,6 +43,26 @@ function debounce(func, wait) {
     };
 }
 
+/** 搜索框联想 */
+var searchInput = $('#q');
+
+searchInput.on('input', debounce(loadSearchSuggestions, 300));
+
+function loadSearchSuggestions() {
+    var q = $.trim(searchInput.val());
+    var datalist = $('#search-suggestions');
+    if (!q) {
+        datalist.empty();
+        return;
+    }
+    $.getJSON(searchInput.data('suggest-url'), {q: q}, function (data) {
+        datalist.empty();
+        $.each(data.suggestions, function (i, text) {
+            datalist.append($('<option>').attr('value', text));
+        });
+    });
+}
+
 function slideTopSet() {
     var top = $(document).scrollTop();
 
@@ -72,7 +92,24 @@ $(document).on('webkitAnimationEnd', function () {
 });
 
 
+// 从 Server-Timing 头读取服务端耗时, 页面中有 #load-times 时才显示
+function showLoadTimes() {
+    var element = document.getElementById('load-times');
+    if (!element || !window.performance || !performance.getEntriesByType) {
+        return;
+    }
+    var entries = performance.getEntriesByType('navigation');
+    var timings = entries.length ? entries[0].serverTiming || [] : [];
+    for (var i = 0; i < timings.length; i++) {
+        if (timings[i].name === 'total') {
+            element.querySelector('.load-times-value').textContent = (timings[i].duration / 1000).toFixed(3);
+            element.style.display = '';
+        }
+    }
+}
+
 window.onload = function () {
+  showLoadTimes();
   var replyLinks = document.querySelectorAll(".comment-reply-link");
   for (var i = 0; i < replyLinks.length; i++) {
     replyLinks[i].onclick = function () {
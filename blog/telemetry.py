@@ -0,0 +1,163 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetryQueue:
+    """
+    请求耗时等事件放入有界内存队列, 由后台线程批量发送, 请求只需一次 append.
+    队列满时丢弃最旧的事件.
+    """
+
+    def __init__(self, ship, maxsize=10000, batch_size=500, flush_interval=5):
+        """
+        :param ship: 发送函数, 参数为事件列表
+        """
+        self.ship = ship
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = deque(maxlen=maxsize)
+        self._condition = threading.Condition()
+        self._worker = None
+        self.metrics = {
+            'enqueued': 0,
+            'dropped': 0,
+            'shipped': 0,
+            'failed': 0,
+            'batches': 0,
+            'last_flush_ms': 0,
+        }
+        atexit.register(self.flush)
+
+    def record(self, event):
+        with self._condition:
+            if len(self._queue) == self._queue.maxlen:
+                self.metrics['dropped'] += 1
+            self._queue.append(event)
+            self.metrics['enqueued'] += 1
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify()
+        if not settings.TESTING:
+            self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._condition:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name='telemetry', daemon=True)
+                    self._worker.start()
+
+    def _take(self):
+        with self._condition:
+            events = []
+            while self._queue and len(events) < self.batch_size:
+                events.append(self._queue.popleft())
+            return events
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if len(self._queue) < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+            # 后台线程长期存在, 数据库可能已断开空闲连接(如 MySQL wait_timeout), 每批重新取连接
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                connections.close_all()
+
+    def flush(self):
+        """
+        发送队列中的全部事件
+        :return: 发送成功的事件数
+        """
+        shipped = 0
+        while True:
+            events = self._take()
+            if not events:
+                return shipped
+            start = time.perf_counter()
+            try:
+                self.ship(events)
+            except Exception as e:
+                self.metrics['failed'] += len(events)
+                logger.error('ship telemetry error:{e}'.format(e=e))
+                return shipped
+            self.metrics['shipped'] += len(events)
+            self.metrics['batches'] += 1
+            self.metrics['last_flush_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            shipped += len(events)
+
+    def get_metrics(self):
+        return dict(self.metrics, queue_size=len(self._queue))
+
+
+def ship_elapsed_time(events):
+    from blog.documents import ElaspedTimeDocumentManager
+    ElaspedTimeDocumentManager.bulk_create(events)
+
+
+elapsed_time_queue = TelemetryQueue(
+    ship_elapsed_time,
+    maxsize=getattr(settings, 'TELEMETRY_QUEUE_SIZE', 10000),
+    batch_size=getattr(settings, 'TELEMETRY_BATCH_SIZE', 500),
+    flush_interval=getattr(settings, 'TELEMETRY_FLUSH_INTERVAL', 5))
+
+
+_last_prune = 0
+
+
+def ship_request_profiles(events):
+    """采样的请求耗时写入数据库, 每小时清理一次过期记录"""
+    global _last_prune
+    from servermanager.models import RequestProfile
+    RequestProfile.objects.bulk_create([RequestProfile(**event) for event in events])
+    if time.time() - _last_prune > 3600:
+        _last_prune = time.time()
+        days = getattr(settings, 'REQUEST_PROFILING_RETENTION_DAYS', 7)
+        RequestProfile.objects.filter(creation_time__lt=timezone.now() - timedelta(days=days)).delete()
+
+
+request_profile_queue = TelemetryQueue(
+    ship_request_profiles,
+    maxsize=getattr(settings, 'TELEMETRY_QUEUE_SIZE', 10000),
+    batch_size=getattr(settings, 'TELEMETRY_BATCH_SIZE', 500),
+    flush_interval=getattr(settings, 'TELEMETRY_FLUSH_INTERVAL', 5))
+
+
+def rollup_performance(now=None):
+    """
+    把 performance 索引中的原始记录按 url/分钟汇总到 PerformanceRollup, 并清理过期数据.
+    从已有的最后一分钟开始重新汇总, 覆盖队列延迟写入的记录
+    :return: 写入的汇总条数
+    """
+    from django.db import transaction
+    from django.db.models import Max
+    from blog.documents import ElaspedTimeDocumentManager
+    from servermanager.models import PerformanceRollup
+
+    now = now or timezone.now()
+    # 最近几分钟的记录可能还在各进程的队列中
+    end = now.replace(second=0, microsecond=0) - timedelta(minutes=getattr(settings, 'PERFORMANCE_ROLLUP_LAG', 2))
+    start = PerformanceRollup.objects.aggregate(Max('minute'))['minute__max'] or \
+        end - timedelta(minutes=getattr(settings, 'PERFORMANCE_ROLLUP_BACKFILL', 60 * 24))
+    rows = [PerformanceRollup(**row) for row in ElaspedTimeDocumentManager.rollup(start, end)]
+    with transaction.atomic():
+        PerformanceRollup.objects.filter(minute__gte=start, minute__lt=end).delete()
+        PerformanceRollup.objects.bulk_create(rows, batch_size=500)
+
+    ElaspedTimeDocumentManager.delete_before(
+        now - timedelta(days=getattr(settings, 'PERFORMANCE_RAW_RETENTION_DAYS', 7)))
+    PerformanceRollup.objects.filter(
+        minute__lt=now - timedelta(days=getattr(settings, 'PERFORMANCE_ROLLUP_RETENTION_DAYS', 180))).delete()
+    logger.info('rollup performance {start} - {end}: {count}'.format(start=start, end=end, count=len(rows)))
+    return len(rows)
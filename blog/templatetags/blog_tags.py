@@ -3,7 +3,6 @@ import logging
 import random
 import urllib
 
-from django import template
 from django.conf import settings
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
@@ -17,12 +16,14 @@ from comments.models import Comment
 from djangoblog.utils import CommonMarkdown, sanitize_html
 from djangoblog.utils import cache
 from djangoblog.utils import get_current_site
+from djangoblog.timing import TimedLibrary
 from oauth.models import OAuthUser
 from bs4 import BeautifulSoup # Import BeautifulSoup
 
 logger = logging.getLogger(__name__)
 
-register = template.Library()
+# 所有标签和过滤器都会计时, 见 djangoblog.timing.TimedLibrary
+register = TimedLibrary()
 
 
 @register.simple_tag
@@ -159,8 +160,6 @@ def load_sidebar(user, linktype):
         sidebar_categorys = Category.objects.all()
         extra_sidebars = SideBar.objects.filter(
             is_enable=True).order_by('sequence')
-        most_read_articles = Article.objects.filter(status='p').order_by(
-            '-views')[:blogsetting.sidebar_article_count]
         dates = Article.objects.datetimes('creation_time', 'month', order='DESC')
         links = Links.objects.filter(is_enable=True).filter(
             Q(show_type=str(linktype)) | Q(show_type=LinkShowType.A))
@@ -183,7 +182,6 @@ def load_sidebar(user, linktype):
         value = {
             'recent_articles': recent_articles,
             'sidebar_categorys': sidebar_categorys,
-            'most_read_articles': most_read_articles,
             'article_dates': dates,
             'sidebar_comments': commment_list,
             'sidabar_links': links,
@@ -194,11 +192,9 @@ def load_sidebar(user, linktype):
             'sidebar_tags': sidebar_tags,
             'extra_sidebars': extra_sidebars
         }
-        # Remove 'sidebar_categorys' and 'most_read_articles' from the value dictionary
+        # Remove 'sidebar_categorys' from the value dictionary
         if 'sidebar_categorys' in value:
             del value['sidebar_categorys']
-        if 'most_read_articles' in value:
-            del value['most_read_articles']
 
         cache.set("sidebar" + linktype, value, 60 * 60 * 60 * 3)
         logger.info('set sidebar cache.key:{key}'.format(key="sidebar" + linktype))
@@ -1,4 +1,7 @@
+import fnmatch
 import os
+from io import StringIO
+from unittest.mock import patch
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -19,6 +22,58 @@ from oauth.models import OAuthUser, OAuthConfig
 
 # Create your tests here.
 
+class FakeIndicesClient:
+    """只实现别名切换用到的 indices 接口"""
+
+    def __init__(self):
+        self.indices = {}
+
+    def _match(self, index):
+        return [name for name, info in self.indices.items()
+                if fnmatch.fnmatch(name, index) or index in info['aliases']]
+
+    def exists(self, index):
+        return bool(self._match(index))
+
+    def exists_alias(self, name):
+        return any(name in info['aliases'] for info in self.indices.values())
+
+    def create(self, index, body=None, **kwargs):
+        self.indices[index] = {'aliases': {}, 'mappings': {}}
+
+    def get(self, index, **kwargs):
+        return {name: self.indices[name] for name in self._match(index)}
+
+    def delete(self, index, **kwargs):
+        for name in self._match(index):
+            del self.indices[name]
+
+    def refresh(self, index):
+        pass
+
+    def update_aliases(self, body):
+        for action in body['actions']:
+            for op, args in action.items():
+                if op == 'remove_index':
+                    del self.indices[args['index']]
+                elif op == 'remove':
+                    del self.indices[args['index']]['aliases'][args['alias']]
+                elif op == 'add':
+                    self.indices[args['index']]['aliases'][args['alias']] = {}
+
+    def get_mapping(self, index):
+        return {name: {'mappings': self.indices[name]['mappings']} for name in self._match(index)}
+
+    def put_mapping(self, index, body):
+        for name in self._match(index):
+            self.indices[name]['mappings'].update(body)
+
+
+class FakeElasticsearch:
+    def __init__(self):
+        self.indices = FakeIndicesClient()
+
+
 class ArticleTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -97,6 +152,18 @@ class ArticleTest(TestCase):
 
         response = self.client.get('/search', {'q': 'django'})
         self.assertEqual(response.status_code, 200)
+        response = self.client.get('/search', {'q': 'nicecontent'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<em>nicecontent</em>')
+        response = self.client.get(reverse('blog:search_suggest'), {'q': 'NICE'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('nicetitle', response.json()['suggestions'])
+        self.assertIn('nicetag', response.json()['suggestions'])
+        from blog.utils import complete_search_words
+        newtag = Tag()
+        newtag.name = "nicenewtag"
+        newtag.save()
+        self.assertEqual(['nicenewtag'], complete_search_words('nicenew'))
         s = load_articletags(article)
         self.assertIsNotNone(s)
 
@@ -182,6 +249,164 @@ class ArticleTest(TestCase):
         save_user_avatar(
             'https://www.python.org/static/img/python-logo.png')
 
+    def test_article_navigation(self):
+        from blog.utils import get_published_article_ids
+        from djangoblog.utils import cache
+        cache.clear()
+        user = BlogUser.objects.get_or_create(
+            email="liangliangyy@gmail.com",
+            username="liangliangyy")[0]
+        category = Category()
+        category.name = "navcategory"
+        category.save()
+        articles = []
+        for i in range(4):
+            article = Article()
+            article.title = "navtitle" + str(i)
+            article.body = "navcontent" + str(i)
+            article.author = user
+            article.category = category
+            article.type = 'a'
+            article.status = 'p'
+            article.save()
+            articles.append(article)
+        first, second, third, fourth = articles
+        self.assertEqual([a.id for a in articles], get_published_article_ids())
+
+        next_article, prev_article = second.get_adjacent_articles()
+        self.assertEqual(third.id, next_article.id)
+        self.assertEqual(first.id, prev_article.id)
+        self.assertEqual(third.get_absolute_url(), next_article.get_absolute_url())
+
+        third.status = 'd'
+        third.save()
+        next_article, prev_article = second.get_adjacent_articles()
+        self.assertEqual(fourth.id, next_article.id)
+
+        with self.assertNumQueries(0):
+            second.get_adjacent_articles()
+
+        # 只更新浏览数时不修改 last_modify_time, 也不重新同步索引
+        last_modify_time = Article.objects.get(pk=second.pk).last_modify_time
+        for update_fields in (['views'], ('views',), {'views'}):
+            second.views += 1
+            second.save(update_fields=update_fields)
+        self.assertEqual(last_modify_time, Article.objects.get(pk=second.pk).last_modify_time)
+        self.assertEqual(3, Article.objects.get(pk=second.pk).views)
+        with self.assertNumQueries(0):
+            second.get_adjacent_articles()
+
+        fourth.delete()
+        next_article, prev_article = second.get_adjacent_articles()
+        self.assertIsNone(next_article)
+        self.assertIsNone(first.get_adjacent_articles()[1])
+
+    def test_view_counter(self):
+        from django.test.utils import override_settings
+        from blog.view_counter import flush_pending_views, get_counter_cache, get_pending_views
+        from djangoblog.utils import cache
+        cache.clear()
+        get_counter_cache().clear()
+        user = BlogUser.objects.get_or_create(
+            email="liangliangyy@gmail.com",
+            username="liangliangyy")[0]
+        category = Category()
+        category.name = "viewcategory"
+        category.save()
+        article = Article()
+        article.title = "viewtitle"
+        article.body = "viewcontent"
+        article.author = user
+        article.category = category
+        article.type = 'a'
+        article.status = 'p'
+        article.save()
+
+        with self.assertNumQueries(0):
+            for i in range(3):
+                article.viewed()
+        self.assertEqual({article.id: 3}, get_pending_views(Article, [article.id]))
+        self.assertEqual(0, Article.objects.get(pk=article.pk).views)
+        # 详情页显示数据库中的浏览数加上尚未写回的部分
+        self.assertEqual(3, article.views)
+
+        request = self.factory.get(article.get_absolute_url(), REMOTE_ADDR='8.8.8.8')
+        with override_settings(VIEW_COUNT_DEDUP_WINDOW=60):
+            article.viewed(request)
+            article.viewed(request)
+        self.assertEqual({article.id: 4}, get_pending_views(Article, [article.id]))
+
+        # 计数器不在默认缓存中, 清空默认缓存不会丢失
+        cache.clear()
+        self.assertEqual({article.id: 4}, get_pending_views(Article, [article.id]))
+
+        self.assertEqual(4, flush_pending_views(Article))
+        self.assertEqual(4, Article.objects.get(pk=article.pk).views)
+        self.assertEqual({}, get_pending_views(Article, [article.id]))
+
+    def test_search_index_alias(self):
+        from blog.documents import ArticleDocumentManager
+        client = FakeElasticsearch()
+        # 旧版本直接创建的同名索引
+        client.indices.create(index='blog')
+        manager = ArticleDocumentManager(client=client)
+        self.assertTrue(client.indices.exists(index='blog'))
+
+        def aliased():
+            return [name for name, info in client.indices.indices.items() if 'blog' in info['aliases']]
+
+        user = BlogUser.objects.create(username='aliasuser', email='aliasuser@test.com')
+        category = Category.objects.create(name='aliascategory')
+        article = Article.objects.create(title='alias title', body='alias body', author=user,
+                                         category=category, status='p', type='a')
+        written = []
+
+        def fake_bulk_index(actions, chunk_size=500, parallel=False):
+            # 与 bulk 一样在调用时消费 actions
+            actions = list(actions)
+            written.append(actions)
+            return len(actions)
+
+        with patch.object(ArticleDocumentManager, 'bulk_index', side_effect=fake_bulk_index):
+            for _ in range(3):
+                manager.rebuild()
+                live = aliased()
+                self.assertEqual(len(live), 1)
+                self.assertTrue(live[0].startswith('blog-'))
+                self.assertEqual([article.id], [int(a['_id']) for a in written[-1]])
+                self.assertEqual([live[0]], [a['_index'] for a in written[-1]])
+            self.assertNotIn('blog', client.indices.indices)
+            self.assertEqual(len(client.indices.indices), 2)
+            self.assertIsNotNone(manager.get_last_sync_time())
+
+            article.title = 'alias title changed'
+            article.save()
+            manager.rebuild(incremental=True)
+            self.assertEqual(aliased(), live)
+            self.assertEqual([article.id], [int(a['_id']) for a in written[-1]])
+            self.assertEqual(['blog'], [a['_index'] for a in written[-1]])
+
+    def test_telemetry_queue(self):
+        from blog.telemetry import TelemetryQueue
+        shipped = []
+        queue = TelemetryQueue(shipped.append, maxsize=3, batch_size=2)
+        for i in range(5):
+            queue.record({'url': '/' + str(i)})
+        self.assertEqual(2, queue.get_metrics()['dropped'])
+        self.assertEqual(3, queue.flush())
+        self.assertEqual([['/2', '/3'], ['/4']], [[e['url'] for e in batch] for batch in shipped])
+
+        def fail(events):
+            raise ValueError('es unavailable')
+
+        queue.ship = fail
+        queue.record({'url': '/5'})
+        self.assertEqual(0, queue.flush())
+        metrics = queue.get_metrics()
+        self.assertEqual(1, metrics['failed'])
+        self.assertEqual(3, metrics['shipped'])
+        self.assertEqual(0, metrics['queue_size'])
+
     def test_errorpage(self):
         rsp = self.client.get('/eee')
         self.assertEqual(rsp.status_code, 404)
@@ -230,3 +455,145 @@ class ArticleTest(TestCase):
         call_command("clear_cache")
         call_command("sync_user_avatar")
         call_command("build_search_words")
+
+    def test_flush_view_counts_command(self):
+        from blog.view_counter import get_counter_cache
+        get_counter_cache().clear()
+        user = BlogUser.objects.create(username='flushuser', email='flushuser@test.com')
+        category = Category.objects.create(name='flushcategory')
+        article = Article.objects.create(title='flush title', body='flush body', author=user,
+                                         category=category, status='p', type='a')
+        article.viewed()
+        article.viewed()
+        out = StringIO()
+        call_command("flush_view_counts", stdout=out)
+        self.assertIn('flushed 2 views', out.getvalue())
+        self.assertEqual(2, Article.objects.get(pk=article.pk).views)
+
+    def test_benchmark_queries_command(self):
+        from django.core.management.base import CommandError
+        from django.test.utils import override_settings
+        from blog.management.commands.benchmark_queries import Command as BenchmarkQueriesCommand
+        from comments.models import Comment
+        from owntracks.models import OwnTrackLog
+
+        def seeded():
+            return (Article.objects.filter(title__startswith='benchmark-').count(),
+                    Comment.objects.filter(article__title__startswith='benchmark-').count(),
+                    OwnTrackLog.objects.filter(tid__startswith='benchmark-').count())
+
+        out = StringIO()
+        call_command("benchmark_queries", articles=50, comments=10, tracks=50, repeat=1, stdout=out)
+        for name in ('article_list', 'most_read', 'article_comments', 'owntracks_by_date'):
+            self.assertIn(name, out.getvalue())
+        self.assertIn('benchmark data rolled back', out.getvalue())
+        self.assertEqual((0, 0, 0), seeded())
+
+        # 保留数据时重复运行不会重复生成
+        for _ in range(2):
+            call_command("benchmark_queries", articles=50, comments=10, tracks=50, repeat=1, keep=True,
+                         stdout=StringIO())
+        self.assertEqual((50, 10, 50), seeded())
+        BenchmarkQueriesCommand.cleanup()
+        self.assertEqual((0, 0, 0), seeded())
+        self.assertFalse(Category.objects.filter(name__startswith='benchmark-').exists())
+        self.assertFalse(BlogUser.objects.filter(username='benchmark').exists())
+
+        with override_settings(TESTING=False), self.assertRaises(CommandError):
+            call_command("benchmark_queries", articles=50, comments=10, tracks=50, repeat=1, keep=True)
+        self.assertEqual((0, 0, 0), seeded())
+
+    def test_search_cache_stats_command(self):
+        from djangoblog.search_cache import STATS_HITS_KEY, STATS_MISS_MS_KEY, STATS_MISSES_KEY
+        from djangoblog.utils import cache
+        cache.set_many({STATS_HITS_KEY: 3, STATS_MISSES_KEY: 1, STATS_MISS_MS_KEY: 20})
+        out = StringIO()
+        call_command("search_cache_stats", stdout=out)
+        self.assertIn('hits 3  misses 1  hit rate 75.00%', out.getvalue())
+        self.assertIn('avg backend 20.0ms  saved ~60ms', out.getvalue())
+
+    def test_build_jieba_dict_command(self):
+        from djangoblog.jieba_dict import get_user_dict_path
+        Tag.objects.create(name='性能优化')
+        out = StringIO()
+        call_command("build_jieba_dict", stdout=out)
+        self.assertRegex(out.getvalue(), r'user dictionary: [1-9]\d* words')
+        self.assertIn('preload with user dictionary', out.getvalue())
+        with open(get_user_dict_path(), encoding='utf-8') as file:
+            self.assertIn('性能优化', file.read().split())
+
+    def test_benchmark_search_backends_command(self):
+        from blog.management.commands.create_testdata import CORPUS_CATEGORY
+        call_command("create_testdata", corpus=10)
+        corpus = Article.objects.filter(category__name=CORPUS_CATEGORY)
+        self.assertEqual(10, corpus.count())
+
+        out = StringIO()
+        call_command("benchmark_search_backends", "--docs", "20", "--queries", "4", "--repeat", "1", stdout=out)
+        for name in ('whoosh', 'sqlite_fts'):
+            self.assertRegex(out.getvalue(), r'%s\s+index [\d.]+ docs/s' % name)
+        self.assertEqual(2, out.getvalue().count('searchqueryset'))
+        # 只删除本次运行生成的文章, create_testdata --corpus 生成的保留
+        self.assertEqual(10, corpus.count())
+        self.assertEqual(1, Category.objects.filter(name__startswith=CORPUS_CATEGORY).count())
+
+    def test_whoosh_stats_command(self):
+        out = StringIO()
+        call_command("whoosh_stats", "--merge", stdout=out)
+        self.assertRegex(out.getvalue(), r'merged in [\d.]+ms|index is locked')
+        self.assertRegex(out.getvalue(), r'segments\s+\d+')
+
+    def test_benchmark_user_agents_command(self):
+        import re
+        out = StringIO()
+        call_command("benchmark_user_agents", "--requests", "50", stdout=out)
+        output = out.getvalue()
+        distinct = int(re.search(r'parsed 50 user agents, (\d+) distinct', output).group(1))
+        hits, misses = map(int, re.search(r'hits (\d+) misses (\d+)', output).groups())
+        self.assertEqual(distinct, misses)
+        self.assertEqual(50, hits + misses)
+
+    def test_loadtest_command(self):
+        import json
+        import tempfile
+        with tempfile.TemporaryDirectory() as path:
+            output = os.path.join(path, 'loadtest.json')
+            out = StringIO()
+            call_command("loadtest", articles=30, comments=10, images=60, requests=3, output=output, stdout=out)
+            with open(output) as file:
+                report = json.load(file)
+        self.assertEqual('in-process', report['target'])
+        for name in ('index', 'list_deep_page', 'article_detail', 'search', 'comment_post',
+                     'paginated_images', 'owntracks_ingest'):
+            self.assertEqual(3, report['scenarios'][name]['requests'])
+        self.assertEqual(0, report['scenarios']['index']['errors'])
+        self.assertEqual(0, report['scenarios']['article_detail']['errors'])
+        # 默认结束时清理生成的数据
+        self.assertIn('loadtest data deleted', out.getvalue())
+        self.assertFalse(Article.objects.filter(title__startswith='benchmark-').exists())
+        self.assertFalse(Category.objects.filter(name__startswith='benchmark-').exists())
+        self.assertFalse(BlogUser.objects.filter(username='benchmark').exists())
+
+    def test_tag_advisor_command(self):
+        import json
+        import tempfile
+        user = BlogUser.objects.create(username='advisoruser', email='advisoruser@test.com')
+        category = Category.objects.create(name='advisorcategory')
+        article = Article.objects.create(title='advisor title', body='advisor body', author=user,
+                                         category=category, status='p', type='a')
+        with tempfile.TemporaryDirectory() as path:
+            output = os.path.join(path, 'tags.json')
+            out = StringIO()
+            call_command("tag_advisor", "--repeat", "1", "--output", output, stdout=out)
+            with open(output) as file:
+                report = json.load(file)
+        self.assertIn(article.get_absolute_url(), report['paths'])
+        self.assertTrue(report['tags'])
+        self.assertIn('fragment-cache candidates', out.getvalue())
+
+    def test_benchmark_compression_command(self):
+        out = StringIO()
+        call_command("benchmark_compression", "--path", "/", "--requests", "5", stdout=out)
+        self.assertIn('gzip', out.getvalue().splitlines()[0])
+        self.assertRegex(out.getvalue(), r'gzip middleware\s+gzip')
+        self.assertRegex(out.getvalue(), r'precompressed\s+(zstd|br|gzip)')
@@ -1,5 +1,5 @@
 from django.urls import path
-from django.views.decorators.cache import cache_page
+from djangoblog.page_cache import cache_page
 
 from . import views
 
@@ -51,6 +51,10 @@ urlpatterns = [
         'links.html',
         views.LinkListView.as_view(),
         name='links'),
+    path(
+        r'suggest',
+        views.search_suggest,
+        name='search_suggest'),
     path(
         r'upload',
         views.fileupload,
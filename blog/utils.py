@@ -0,0 +1,207 @@
+import logging
+from bisect import bisect_left, bisect_right
+
+from django.urls import reverse
+
+from djangoblog.utils import cache, get_sha256
+
+logger = logging.getLogger(__name__)
+
+PUBLISHED_IDS_CACHE_KEY = 'published_article_ids'
+PUBLISHED_IDS_CACHE_TIMEOUT = 60 * 60 * 24
+ARTICLE_NAV_CACHE_KEY = 'article_nav_{id}'
+ARTICLE_NAV_CACHE_TIMEOUT = 60 * 60 * 24
+SEARCH_WORDS_CACHE_KEY = 'search_words'
+SEARCH_WORDS_CACHE_TIMEOUT = 60 * 60 * 24
+SEARCH_COMPLETION_CACHE_KEY = 'search_completion_{key}'
+SEARCH_COMPLETION_CACHE_TIMEOUT = 60 * 10
+
+
+class ArticleNavItem:
+    """上一篇/下一篇导航所需的最少字段,可直接放入缓存"""
+    __slots__ = ('id', 'title', 'year', 'month', 'day')
+
+    def __init__(self, id, title, year, month, day):
+        self.id = id
+        self.title = title
+        self.year = year
+        self.month = month
+        self.day = day
+
+    @classmethod
+    def from_article(cls, article):
+        created = article.creation_time
+        return cls(article.id, article.title, created.year, created.month, created.day)
+
+    def get_absolute_url(self):
+        # url 在读取时生成,保证与当前语言前缀一致
+        return reverse('blog:detailbyid', kwargs={
+            'article_id': self.id,
+            'year': self.year,
+            'month': self.month,
+            'day': self.day
+        })
+
+    def __str__(self):
+        return self.title
+
+
+def get_published_article_ids():
+    """
+    获得按id升序排列的已发布文章id列表
+    :return: list
+    """
+    ids = cache.get(PUBLISHED_IDS_CACHE_KEY)
+    if ids is None:
+        from blog.models import Article
+        ids = list(Article.objects.filter(status='p').order_by(
+            'id').values_list('id', flat=True))
+        cache.set(PUBLISHED_IDS_CACHE_KEY, ids, PUBLISHED_IDS_CACHE_TIMEOUT)
+        logger.info('set published article ids cache, count:{count}'.format(count=len(ids)))
+    return ids
+
+
+def invalidate_published_article_ids():
+    """批量修改文章状态后调用,下次读取时重建"""
+    cache.delete(PUBLISHED_IDS_CACHE_KEY)
+
+
+def _sync_published_article_id(article_id, published):
+    """
+    缓存的列表与文章状态不一致时删除缓存, 下次读取时从数据库重建.
+    不直接在列表中增删 id: get/修改/set 不是原子的, 并发发布时会丢失 id
+    """
+    ids = cache.get(PUBLISHED_IDS_CACHE_KEY)
+    if ids is None:
+        return
+    index = bisect_left(ids, article_id)
+    if (index < len(ids) and ids[index] == article_id) != published:
+        invalidate_published_article_ids()
+
+
+def add_published_article_id(article_id):
+    _sync_published_article_id(article_id, True)
+
+
+def remove_published_article_id(article_id):
+    _sync_published_article_id(article_id, False)
+
+
+def sync_published_article(article):
+    """文章保存后同步已发布id列表与导航缓存"""
+    if article.status == 'p':
+        add_published_article_id(article.id)
+    else:
+        remove_published_article_id(article.id)
+    cache.delete(ARTICLE_NAV_CACHE_KEY.format(id=article.id))
+
+
+def discard_published_article(article_id):
+    """文章删除后从已发布id列表与导航缓存中移除"""
+    remove_published_article_id(article_id)
+    cache.delete(ARTICLE_NAV_CACHE_KEY.format(id=article_id))
+
+
+def get_adjacent_article_ids(article_id):
+    """
+    二分查找相邻的已发布文章
+    :return: (下一篇id, 上一篇id), 不存在时为None
+    """
+    ids = get_published_article_ids()
+    right = bisect_right(ids, article_id)
+    left = bisect_left(ids, article_id)
+    next_id = ids[right] if right < len(ids) else None
+    prev_id = ids[left - 1] if left > 0 else None
+    return next_id, prev_id
+
+
+def get_nav_items(article_ids):
+    """
+    批量获得导航条目,缓存未命中的部分用一次查询补齐
+    :return: dict id -> ArticleNavItem
+    """
+    article_ids = [i for i in article_ids if i is not None]
+    if not article_ids:
+        return {}
+    keys = {ARTICLE_NAV_CACHE_KEY.format(id=i): i for i in article_ids}
+    cached = cache.get_many(list(keys.keys()))
+    items = {keys[k]: v for k, v in cached.items()}
+    missing = [i for i in article_ids if i not in items]
+    if missing:
+        from blog.models import Article
+        articles = Article.objects.filter(id__in=missing, status='p').only(
+            'id', 'title', 'creation_time')
+        fetched = {a.id: ArticleNavItem.from_article(a) for a in articles}
+        if fetched:
+            cache.set_many({ARTICLE_NAV_CACHE_KEY.format(id=i): v for i, v in fetched.items()},
+                           ARTICLE_NAV_CACHE_TIMEOUT)
+        for i in missing:
+            if i not in fetched:
+                # 文章已被删除或下线但id列表未同步,顺手修正
+                logger.warning('published article ids out of sync, discard:{id}'.format(id=i))
+                remove_published_article_id(i)
+        items.update(fetched)
+    return items
+
+
+def get_adjacent_articles(article_id):
+    """
+    获得文章的下一篇与上一篇
+    :return: (下一篇, 上一篇) ArticleNavItem 或 None
+    """
+    next_id, prev_id = get_adjacent_article_ids(article_id)
+    items = get_nav_items([next_id, prev_id])
+    return items.get(next_id), items.get(prev_id)
+
+
+def get_search_words(refresh=False):
+    """
+    已发布文章标题、标签和分类名, 按小写排序, 用于搜索联想
+    :return: list of (小写, 原词)
+    """
+    words = None if refresh else cache.get(SEARCH_WORDS_CACHE_KEY)
+    if words is None:
+        from blog.models import Article, Category, Tag
+        names = set(Article.objects.filter(status='p').values_list('title', flat=True))
+        names.update(Tag.objects.values_list('name', flat=True))
+        names.update(Category.objects.values_list('name', flat=True))
+        words = sorted((name.lower(), name) for name in names if name)
+        cache.set(SEARCH_WORDS_CACHE_KEY, words, SEARCH_WORDS_CACHE_TIMEOUT)
+        logger.info('set search words cache, count:{count}'.format(count=len(words)))
+    return words
+
+
+def invalidate_search_words():
+    """文章、标签或分类修改后调用, 下次联想时重建"""
+    cache.delete(SEARCH_WORDS_CACHE_KEY)
+
+
+def complete_search_words(prefix, count=10):
+    """在排好序的搜索词中二分查找前缀"""
+    words = get_search_words()
+    prefix = prefix.lower()
+    result = []
+    for lower, name in words[bisect_left(words, (prefix,)):]:
+        if len(result) >= count or not lower.startswith(prefix):
+            break
+        result.append(name)
+    return result
+
+
+def get_search_completions(prefix, count=10):
+    """
+    搜索框联想, 启用 elasticsearch 时使用 completion suggester
+    :return: list
+    """
+    key = SEARCH_COMPLETION_CACHE_KEY.format(key=get_sha256('{p}:{c}'.format(p=prefix.lower(), c=count)))
+    value = cache.get(key)
+    if value is not None:
+        return value
+    from blog.documents import ELASTICSEARCH_ENABLED
+    if ELASTICSEARCH_ENABLED:
+        from djangoblog.elasticsearch_backend import ElasticSearchBackend
+        value = ElasticSearchBackend.get_completions(prefix, count)
+    else:
+        value = complete_search_words(prefix, count)
+    cache.set(key, value, SEARCH_COMPLETION_CACHE_TIMEOUT)
+    return value
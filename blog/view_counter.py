@@ -0,0 +1,175 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.db import connections
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from ipware import get_client_ip
+
+from djangoblog.utils import cache
+
+logger = logging.getLogger(__name__)
+
+PENDING_VIEWS_KEY = 'pending_views_{label}_{id}'
+VIEWED_KEY = 'viewed_{label}_{id}_{visitor}'
+FLUSH_LOCK_KEY = 'pending_views_flush_lock'
+FLUSH_CHUNK_SIZE = 500
+
+
+_atexit_registered = False
+
+
+def get_counter_alias():
+    alias = getattr(settings, 'VIEW_COUNT_CACHE', DEFAULT_CACHE_ALIAS)
+    return alias if alias in settings.CACHES else DEFAULT_CACHE_ALIAS
+
+
+def get_counter_cache():
+    """浏览数计数器所在的缓存, 默认缓存会被 clear 和淘汰, 计数器不能放在那里"""
+    return caches[get_counter_alias()]
+
+
+def _pending_key(model, id):
+    return PENDING_VIEWS_KEY.format(label=model._meta.label_lower, id=id)
+
+
+def get_visitor_key(request):
+    """同一会话优先,没有会话时按ip去重"""
+    if request is None:
+        return None
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return 's' + session.session_key
+    ip, _ = get_client_ip(request)
+    return 'ip' + ip if ip else None
+
+
+def record_view(instance, request=None):
+    """
+    记录一次浏览,只累加到缓存中的计数器,由定时任务批量写回数据库
+    :param instance: Article 或 Video
+    :param request: 用于去重,为None时不去重
+    :return: 是否计数
+    """
+    window = getattr(settings, 'VIEW_COUNT_DEDUP_WINDOW', 0)
+    visitor = get_visitor_key(request) if window else None
+    if visitor:
+        viewed_key = VIEWED_KEY.format(
+            label=instance._meta.label_lower, id=instance.pk, visitor=visitor)
+        if not cache.add(viewed_key, 1, window):
+            return False
+
+    counters = get_counter_cache()
+    key = _pending_key(type(instance), instance.pk)
+    counters.add(key, 0, None)
+    try:
+        counters.incr(key)
+    except ValueError:
+        # add 与 incr 之间被淘汰
+        counters.set(key, 1, None)
+    _schedule_flush()
+    return True
+
+
+def get_pending_views(model, ids):
+    """
+    获得尚未写回数据库的浏览数
+    :return: dict id -> count
+    """
+    keys = {_pending_key(model, i): i for i in ids}
+    values = get_counter_cache().get_many(list(keys.keys()))
+    return {keys[k]: v for k, v in values.items() if v}
+
+
+def flush_pending_views(model, ids=None):
+    """
+    将缓存中的浏览数用一条 UPDATE 批量写回数据库
+    :return: 写回的浏览总数
+    """
+    if ids is None:
+        ids = list(model.objects.values_list('id', flat=True))
+    counters = get_counter_cache()
+    total = 0
+    for start in range(0, len(ids), FLUSH_CHUNK_SIZE):
+        pending = get_pending_views(model, ids[start:start + FLUSH_CHUNK_SIZE])
+        taken = {}
+        for id, count in pending.items():
+            # decr 是原子的,flush 期间的新浏览会留到下一次
+            try:
+                counters.decr(_pending_key(model, id), count)
+                taken[id] = count
+            except ValueError:
+                pass
+        if not taken:
+            continue
+        try:
+            model.objects.filter(id__in=list(taken.keys())).update(views=F('views') + Case(
+                *[When(id=id, then=Value(count)) for id, count in taken.items()],
+                default=Value(0),
+                output_field=PositiveIntegerField()))
+        except Exception as e:
+            logger.error('flush pending views error:{e}'.format(e=e))
+            for id, count in taken.items():
+                counters.add(_pending_key(model, id), 0, None)
+                counters.incr(_pending_key(model, id), count)
+            raise
+        total += sum(taken.values())
+    if total:
+        logger.info('flush pending views:{model} {total}'.format(
+            model=model._meta.label_lower, total=total))
+    return total
+
+
+def flush_all_pending_views():
+    from blog.models import Article, Video
+    return flush_pending_views(Article) + flush_pending_views(Video)
+
+
+def _flush_in_background():
+    try:
+        flush_all_pending_views()
+    except Exception as e:
+        logger.error(e)
+    finally:
+        connections.close_all()
+
+
+def _schedule_flush():
+    global _atexit_registered
+    if settings.TESTING:
+        return
+    if not _atexit_registered:
+        # 进程退出时写回, 本地内存中的计数不会丢失
+        _atexit_registered = True
+        atexit.register(_flush_in_background)
+    interval = getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 0)
+    if not interval:
+        return
+    # 所有进程共用一把锁,每个周期只会有一个线程执行 flush
+    if cache.add(FLUSH_LOCK_KEY, 1, interval):
+        threading.Thread(target=_flush_in_background, daemon=True).start()
+
+
+def flush_before_clear():
+    """
+    清空默认缓存前调用, 先把浏览数写回数据库;
+    计数器未配置单独的缓存时与默认缓存在一起, 会被一起清空
+    :return: 写回的浏览总数
+    """
+    try:
+        return flush_all_pending_views()
+    except Exception as e:
+        logger.error('flush pending views before clear error:{e}'.format(e=e))
+        return 0
+
+
+def with_pending_views(instance):
+    """
+    把尚未写回的浏览数加到 instance.views 上, 用于详情页显示
+    :return: instance
+    """
+    persisted = instance.__dict__.setdefault('_persisted_views', instance.views)
+    instance.views = persisted + get_pending_views(type(instance), [instance.pk]).get(instance.pk, 0)
+    return instance
@@ -23,9 +23,12 @@ from storages.backends.s3boto3 import S3Boto3Storage
 
 from blog.models import Article, Category, LinkShowType, Links, Tag, Video, MembershipType, Order
 from comments.forms import CommentForm
+from blog.utils import get_search_completions
+from comments.utils import build_comment_tree
 from blog.forms import VideoUploadForm
-from djangoblog.utils import cache, get_blog_setting
+from djangoblog.utils import cache, clear_cache, get_blog_setting
 from accounts.models import RedemptionCode, UserMembership
+from accounts.utils import has_active_membership, has_premium_access, invalidate_membership
 
 logger = logging.getLogger(__name__)
 
@@ -140,7 +143,7 @@ class ArticleDetailView(DetailView):
         else:
             logger.debug("ArticleDetailView: Failed to retrieve article object.")
 
-        obj.viewed()
+        obj.viewed(self.request)
         self.object = obj
         return obj
 
@@ -154,7 +157,8 @@ class ArticleDetailView(DetailView):
         comment_form = CommentForm()
 
         article_comments = self.object.comment_list()
-        parent_comments = article_comments.filter(parent_comment=None)
+        # 一次查询取出全部评论, 在内存中构建评论树并按顶级评论分页
+        parent_comments = build_comment_tree(article_comments)
         blog_setting = get_blog_setting()
         paginator = Paginator(parent_comments, blog_setting.article_comment_count)
         page = self.request.GET.get('comment_page', '1')
@@ -180,46 +184,14 @@ class ArticleDetailView(DetailView):
         kwargs['form'] = comment_form
         kwargs['article_comments'] = article_comments
         kwargs['p_comments'] = p_comments
-        kwargs['comment_count'] = len(
-            article_comments) if article_comments else 0
+        kwargs['comment_count'] = len(article_comments)
 
-        kwargs['next_article'] = self.object.next_article
-        kwargs['prev_article'] = self.object.prev_article
+        kwargs['next_article'], kwargs['prev_article'] = self.object.get_adjacent_articles()
 
-        logger.debug(f"ArticleDetailView: User authenticated: {self.request.user.is_authenticated}")
-        is_premium_article = self.object.is_premium
-        is_member = False
-        if self.request.user.is_authenticated:
-            logger.debug(f"ArticleDetailView: User {self.request.user.username} is authenticated.")
-            try:
-                # Check if the user has an active membership
-                user_membership = self.request.user.usermembership
-                logger.debug(f"ArticleDetailView: UserMembership found for {self.request.user.username}: is_active={user_membership.is_active}, end_date={user_membership.end_date}, now={timezone.now()}")
-                if user_membership.is_membership_active():
-                    is_member = True
-                    logger.debug(f"ArticleDetailView: User {self.request.user.username} is an active member.")
-                else:
-                    logger.debug(f"ArticleDetailView: User {self.request.user.username} is NOT an active member (is_active: {user_membership.is_active}, end_date: {user_membership.end_date}).")
-            except UserMembership.DoesNotExist: # Use specific exception
-                logger.debug(f"ArticleDetailView: User {self.request.user.username} has no UserMembership record.")
-                pass # User has no membership
-            except Exception as e:
-                logger.error(f"ArticleDetailView: Error checking membership for {self.request.user.username}: {e}")
-                pass
-
-        logger.debug(f"ArticleDetailView: is_premium_article={is_premium_article}, is_member={is_member}")
-        if is_premium_article and not is_member:
-            # 如果是会员文章且用户不是活跃会员，设置标志并在模板中处理
-            kwargs['is_premium_restricted'] = True
-            logger.debug(f"ArticleDetailView: Article is premium restricted for user {self.request.user.username}.")
-        else:
-            kwargs['is_premium_restricted'] = False
-            logger.debug(f"ArticleDetailView: Article is NOT premium restricted for user {self.request.user.username}.")
-
-        # Add exception for superusers and staff
-        if self.request.user.is_authenticated and (self.request.user.is_superuser or self.request.user.is_staff):
-            kwargs['is_premium_restricted'] = False
-            logger.debug(f"ArticleDetailView: User {self.request.user.username} is superuser/staff, not restricted.")
+        # 会员状态从缓存的有效期判断, 不再每次请求查询 UserMembership
+        is_member = has_active_membership(self.request.user)
+        kwargs['is_premium_restricted'] = not has_premium_access(self.request.user, self.object)
+        logger.debug(f"ArticleDetailView: is_member={is_member}, is_premium_restricted={kwargs['is_premium_restricted']}")
 
         # Pass is_member to context for general front-end display (e.g., membership badge)
         kwargs['is_member'] = is_member
@@ -350,6 +322,13 @@ class LinkListView(ListView):
         return Links.objects.filter(is_enable=True)
 
 
+def search_suggest(request):
+    """搜索框联想"""
+    prefix = request.GET.get('q', '').strip()[:50]
+    suggestions = get_search_completions(prefix) if prefix else []
+    return JsonResponse({'suggestions': suggestions})
+
+
 class EsSearchView(SearchView):
     def get_context(self):
         paginator, page = self.build_page()
@@ -545,7 +524,7 @@ def permission_denied_view(
 
 
 def clean_cache_view(request):
-    cache.clear()
+    clear_cache()
     return HttpResponse('ok')
 
 
@@ -578,7 +557,7 @@ class VideoDetailView(DetailView):
 
     def get_object(self, queryset=None):
         obj = super().get_object()
-        obj.viewed()
+        obj.viewed(self.request)
         return obj
 
 
@@ -720,6 +699,7 @@ def order_detail(request, order_id):
             order.is_paid = True
             order.paid_time = timezone.now()
             order.save()
+            invalidate_membership(user.id)
 
         except Exception as e:
             messages.error(request, _(f'An error occurred during redemption: {e}'))
@@ -795,6 +775,7 @@ def simulate_pay(request, order_id):
             end_date=end_time,
             is_active=True
         )
+    invalidate_membership(user.id)
 
     # 重定向到订单详情页面，显示支付成功信息
     return redirect('blog:order_detail', order_id=order.order_id)
@@ -34,6 +34,11 @@ class Comment(models.Model):
         verbose_name = _('comment')
         verbose_name_plural = verbose_name
         get_latest_by = 'id'
+        indexes = [
+            # 文章评论: filter(article, is_enable, parent_comment)
+            models.Index(fields=['article', 'is_enable', 'parent_comment'],
+                         name='comment_article_enable_idx'),
+        ]
 
     def __str__(self):
         return self.body
@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from django import template
 
 register = template.Library()
@@ -9,10 +11,13 @@ def parse_commenttree(commentlist, comment):
         用法: {% parse_commenttree article_comments comment as childcomments %}
     """
     datas = []
+    children = defaultdict(list)
+    for c in commentlist:
+        if c.is_enable:
+            children[c.parent_comment_id].append(c)
 
     def parse(c):
-        childs = commentlist.filter(parent_comment=c, is_enable=True)
-        for child in childs:
+        for child in children.get(c.id, []):
             datas.append(child)
             parse(child)
 
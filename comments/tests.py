@@ -100,6 +100,16 @@ class CommentsTest(TransactionTestCase):
         comment = Comment.objects.get(id=parent_comment_id)
         tree = parse_commenttree(article.comment_list(), comment)
         self.assertEqual(len(tree), 1)
+        from comments.utils import build_comment_tree
+        article_comments = article.comment_list()
+        with self.assertNumQueries(0):
+            roots = build_comment_tree(article_comments)
+            self.assertEqual(len(roots), 2)
+            self.assertEqual(roots[0].id, parent_comment_id)
+            self.assertEqual(len(roots[0].child_comments), 1)
+            self.assertEqual(roots[0].child_comments[0].parent_comment.author.username, self.user.username)
+        response = self.client.get(article.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
         data = show_comment_item(comment, True)
         self.assertIsNotNone(data)
         s = get_max_articleid_commentid()
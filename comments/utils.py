@@ -1,4 +1,5 @@
 import logging
+from collections import defaultdict
 
 from django.utils.translation import gettext_lazy as _
 
@@ -37,3 +38,27 @@ def send_comment_email(comment):
             send_email([tomail], subject, html_content)
     except Exception as e:
         logger.error(e)
+
+
+def build_comment_tree(comments):
+    """
+    在内存中构建评论树, 不产生额外查询
+    :param comments: 文章的全部可见评论, 按 -id 排序
+    :return: 顶级评论列表, 每条评论的 child_comments 为其直接回复
+    """
+    comment_map = {c.id: c for c in comments}
+    children = defaultdict(list)
+    roots = []
+    for comment in comments:
+        if comment.parent_comment_id is None:
+            roots.append(comment)
+            continue
+        parent = comment_map.get(comment.parent_comment_id)
+        if parent is None:
+            # 父评论未通过审核, 与原逻辑一致不展示
+            continue
+        comment.parent_comment = parent
+        children[parent.id].append(comment)
+    for comment in comments:
+        comment.child_comments = children.get(comment.id, [])
+    return roots
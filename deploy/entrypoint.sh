@@ -18,9 +18,11 @@ python manage.py makemigrations && \
   python manage.py collectstatic --noinput  && \
   python manage.py compress --force && \
   python manage.py build_index && \
+  python manage.py build_jieba_dict && \
   python manage.py compilemessages  || exit 1
 
 exec gunicorn ${DJANGO_WSGI_MODULE}:application \
+--config deploy/gunicorn.conf.py \
 --name $NAME \
 --workers $NUM_WORKERS \
 --user=$USER --group=$GROUP \
@@ -28,4 +30,5 @@ exec gunicorn ${DJANGO_WSGI_MODULE}:application \
 --log-level=debug \
 --log-file=- \
 --worker-class gevent \
+--preload \
 --threads 4
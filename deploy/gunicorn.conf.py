@@ -0,0 +1,6 @@
+# gunicorn -c deploy/gunicorn.conf.py
+# --preload 在 master 中导入应用, gevent 需要在 ssl/threading/requests/elasticsearch 等被导入之前打补丁,
+# gunicorn 先加载配置文件再导入应用, 因此在这里打补丁
+from gevent import monkey
+
+monkey.patch_all()
@@ -49,6 +49,8 @@ admin_site.register(Order, OrderAdmin)
 
 admin_site.register(commands, CommandsAdmin)
 admin_site.register(EmailSendLog, EmailSendLogAdmin)
+admin_site.register(RequestProfile, RequestProfileAdmin)
+admin_site.register(PerformanceRollup, PerformanceRollupAdmin)
 
 admin_site.register(BlogUser, BlogUserAdmin)
 admin_site.register(RedemptionCode, RedemptionCodeAdmin)
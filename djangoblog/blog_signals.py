@@ -12,10 +12,11 @@ from django.dispatch import receiver
 from comments.models import Comment
 from comments.utils import send_comment_email
 from djangoblog.spider_notify import SpiderNotify
-from djangoblog.utils import cache, expire_view_cache, delete_sidebar_cache, delete_view_cache
+from djangoblog.utils import cache, clear_cache, expire_view_cache, delete_sidebar_cache, delete_view_cache
 from djangoblog.utils import get_current_site
 from oauth.models import OAuthUser
-from blog.models import Article
+from blog.models import Article, Category, Tag
+from blog.utils import invalidate_search_words
 
 logger = logging.getLogger(__name__)
 
@@ -68,7 +69,13 @@ def oauth_user_login_signal_handler(sender, **kwargs):
 @receiver(post_delete, sender=Article)
 def article_post_delete_callback(sender, instance, using, **kwargs):
     logger.info(f"Article {instance.title} deleted. Clearing cache.")
-    cache.clear()
+    clear_cache()
+
+
+@receiver(post_delete)
+def search_words_post_delete_callback(sender, instance, **kwargs):
+    if isinstance(instance, (Article, Category, Tag)):
+        invalidate_search_words()
 
 
 @receiver(post_save)
@@ -83,6 +90,8 @@ def model_post_save_callback(
     clearcache = False
     if isinstance(instance, LogEntry):
         return
+    if isinstance(instance, (Article, Category, Tag)) and update_fields != {'views'}:
+        invalidate_search_words()
     if 'get_full_url' in dir(instance):
         is_update_views = update_fields == {'views'}
         if not settings.TESTING and not is_update_views:
@@ -117,7 +126,7 @@ def model_post_save_callback(
             _thread.start_new_thread(send_comment_email, (instance,))
 
     if clearcache:
-        cache.clear()
+        clear_cache()
 
 
 @receiver(user_logged_in)
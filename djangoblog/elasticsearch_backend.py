@@ -7,9 +7,14 @@ from haystack.utils import log as logging
 
 from blog.documents import ArticleDocument, ArticleDocumentManager
 from blog.models import Article
+from djangoblog.search_cache import bump_index_generation, cached_search
+from djangoblog.utils import cache, get_sha256
 
 logger = logging.getLogger(__name__)
 
+SUGGESTION_CACHE_KEY = 'search_suggestion_{key}'
+SUGGESTION_CACHE_TIMEOUT = 60 * 60
+
 
 class ElasticSearchBackend(BaseSearchBackend):
     def __init__(self, connection_alias, **connection_options):
@@ -22,14 +27,13 @@ class ElasticSearchBackend(BaseSearchBackend):
         self.include_spelling = True
 
     def _get_models(self, iterable):
-        models = iterable if iterable and iterable[0] else Article.objects.all()
+        models = iterable if iterable and iterable[0] else self.manager.get_queryset()
         docs = self.manager.convert_to_doc(models)
         return docs
 
     def _create(self, models):
         self.manager.create_index()
-        docs = self._get_models(models)
-        self.manager.rebuild(docs)
+        self.manager.rebuild(models or None)
 
     def _delete(self, models):
         for m in models:
@@ -37,7 +41,7 @@ class ElasticSearchBackend(BaseSearchBackend):
         return True
 
     def _rebuild(self, models):
-        models = models if models else Article.objects.all()
+        models = models if models else self.manager.get_queryset()
         docs = self.manager.convert_to_doc(models)
         self.manager.update_docs(docs)
 
@@ -45,47 +49,51 @@ class ElasticSearchBackend(BaseSearchBackend):
 
         models = self._get_models(iterable)
         self.manager.update_docs(models)
+        bump_index_generation()
 
     def remove(self, obj_or_string):
         models = self._get_models([obj_or_string])
         self._delete(models)
+        bump_index_generation()
 
     def clear(self, models=None, commit=True):
         self.remove(None)
 
     @staticmethod
-    def get_suggestion(query: str) -> str:
-        """获取推荐词, 如果没有找到添加原搜索词"""
-
-        search = ArticleDocument.search() \
-            .query("match", body=query) \
-            .suggest('suggest_search', query, term={'field': 'body'}) \
-            .execute()
-
+    def parse_suggestion(query: str, suggest) -> str:
+        """取每个词的第一个推荐, 所有词都没有推荐时返回原搜索词"""
         keywords = []
-        for suggest in search.suggest.suggest_search:
-            if suggest["options"]:
-                keywords.append(suggest["options"][0]["text"])
+        changed = False
+        for item in suggest.suggest_search:
+            if item["options"]:
+                keywords.append(item["options"][0]["text"])
+                changed = True
             else:
-                keywords.append(suggest["text"])
+                keywords.append(item["text"])
 
-        return ' '.join(keywords)
+        return ' '.join(keywords) if changed else query
 
-    @log_query
-    def search(self, query_string, **kwargs):
-        logger.info('search query_string:' + query_string)
+    @staticmethod
+    def get_cached_suggestion(query: str):
+        return cache.get(SUGGESTION_CACHE_KEY.format(key=get_sha256(query)))
 
-        start_offset = kwargs.get('start_offset')
-        end_offset = kwargs.get('end_offset')
+    @staticmethod
+    def set_cached_suggestion(query: str, suggestion: str):
+        cache.set(SUGGESTION_CACHE_KEY.format(key=get_sha256(query)), suggestion, SUGGESTION_CACHE_TIMEOUT)
 
-        # 推荐词搜索
-        if getattr(self, "is_suggest", None):
-            suggestion = self.get_suggestion(query_string)
-        else:
-            suggestion = query_string
+    @staticmethod
+    def get_completions(prefix: str, count=10) -> list:
+        """搜索框联想, 使用 completion suggester"""
+        search = ArticleDocument.search() \
+            .suggest('completion', prefix, completion={'field': 'suggest', 'size': count, 'skip_duplicates': True}) \
+            .source(False)[0:0] \
+            .execute()
+        return [option['text'] for option in search.suggest.completion[0].options]
 
+    @staticmethod
+    def build_search(query_string, start_offset, end_offset, highlight=False):
         q = Q('bool',
-              should=[Q('match', body=suggestion), Q('match', title=suggestion)],
+              should=[Q('match', body=query_string), Q('match', title=query_string)],
               minimum_should_match="70%")
 
         search = ArticleDocument.search() \
@@ -93,14 +101,49 @@ class ElasticSearchBackend(BaseSearchBackend):
                      .filter('term', status='p') \
                      .filter('term', type='a') \
                      .source(False)[start_offset: end_offset]
+        if highlight:
+            search = search.highlight_options(
+                encoder='html', pre_tags=['<em>'], post_tags=['</em>'],
+                fragment_size=150, number_of_fragments=1, no_match_size=150) \
+                .highlight('body', 'title')
+        return search
+
+    @cached_search
+    @log_query
+    def search(self, query_string, **kwargs):
+        logger.info('search query_string:' + query_string)
+
+        start_offset = kwargs.get('start_offset')
+        end_offset = kwargs.get('end_offset')
+        highlight = kwargs.get('highlight')
+
+        # 推荐词搜索, 推荐词已缓存时直接搜索推荐词,
+        # 否则推荐与搜索放在同一个请求中, 只有推荐词与原词不同时才再查询一次
+        if getattr(self, "is_suggest", None):
+            suggestion = self.get_cached_suggestion(query_string)
+        else:
+            suggestion = query_string
 
+        search = self.build_search(suggestion or query_string, start_offset, end_offset, highlight)
+        if suggestion is None:
+            search = search.suggest('suggest_search', query_string, term={'field': 'body'})
         results = search.execute()
+        if suggestion is None:
+            suggestion = self.parse_suggestion(query_string, results.suggest)
+            self.set_cached_suggestion(query_string, suggestion)
+            if suggestion != query_string:
+                results = self.build_search(suggestion, start_offset, end_offset, highlight).execute()
         hits = results['hits'].total
         raw_results = []
         for raw_result in results['hits']['hits']:
             app_label = 'blog'
             model_name = 'Article'
             additional_fields = {}
+            fragments = raw_result.get('highlight')
+            if fragments:
+                # 与 whoosh 一致, 放到 text 字段下
+                additional_fields['highlighted'] = {
+                    'text': fragments.get('body') or fragments.get('title', [])}
 
             result_class = SearchResult
 
@@ -175,7 +218,7 @@ class ElasticSearchModelSearchForm(ModelSearchForm):
         # 是否建议搜索
         self.searchqueryset.query.backend.is_suggest = self.data.get("is_suggest") != "no"
         sqs = super().search()
-        return sqs
+        return sqs.highlight()
 
 
 class ElasticSearchEngine(BaseEngine):
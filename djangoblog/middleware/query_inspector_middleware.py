@@ -0,0 +1,35 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from djangoblog.query_inspector import NPlusOneError, QueryInspector
+
+logger = logging.getLogger(__name__)
+
+
+class QueryInspectorMiddleware:
+    """
+    Logs repeated query shapes (N+1) per request and queries slower than
+    SLOW_QUERY_MS. Meant for DEBUG and staging, it is removed otherwise.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'N_PLUS_ONE_THRESHOLD', 10) \
+            if getattr(settings, 'N_PLUS_ONE_DETECTION', settings.DEBUG) else None
+        self.slow_ms = getattr(settings, 'SLOW_QUERY_MS', None)
+        if not self.threshold and self.slow_ms is None:
+            raise MiddlewareNotUsed()
+
+    def __call__(self, request):
+        inspector = QueryInspector(threshold=self.threshold, slow_ms=self.slow_ms)
+        with inspector.inspect():
+            response = self.get_response(request)
+
+        if inspector.get_repeated():
+            report = inspector.format_repeated('{method} {path}'.format(method=request.method, path=request.path))
+            if getattr(settings, 'N_PLUS_ONE_RAISE', False):
+                raise NPlusOneError(report)
+            logger.warning(report)
+        return response
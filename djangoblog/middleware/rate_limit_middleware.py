@@ -1,47 +1,231 @@
 import logging
-from django.core.cache import cache
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
 from django.conf import settings
+from django.core.cache import cache
 from django.http import HttpResponse
 
 logger = logging.getLogger(__name__)
 
+SLIDING_WINDOW = 'sliding_window'
+TOKEN_BUCKET = 'token_bucket'
+
+DEFAULT_BYPASS_PATHS = (
+    '/admin/',
+    '/ckeditor/upload/',
+    '/wasabi-file-list-json/',
+    '/sitemap.xml',
+    '/robots.txt',
+)
+
+# KEYS[1] current window counter, KEYS[2] previous window counter, ARGV[1] ttl
+SLIDING_WINDOW_SCRIPT = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+local previous = redis.call('GET', KEYS[2])
+return {current, tonumber(previous) or 0}
+"""
+
+# KEYS[1] bucket hash, ARGV: capacity, refill rate per second, now, ttl.
+# Returns {allowed, tokens left * 1000} because Lua numbers are truncated to integers.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return {allowed, math.floor(tokens * 1000)}
+"""
+
+
+class RateLimit:
+    """One limit: `requests` per `window` seconds for paths matching `pattern`."""
+
+    def __init__(self, name, requests, window, algorithm, pattern=None):
+        self.name = name
+        self.requests = requests
+        self.window = window
+        self.algorithm = algorithm
+        self.pattern = re.compile(pattern) if pattern else None
+
+    def matches(self, path):
+        return self.pattern is None or self.pattern.search(path) is not None
+
+
+class RateLimiter:
+    """
+    Counts a hit with a single cache round trip: a Lua script on Redis,
+    add/incr with a TTL on other backends. The token bucket fallback is only
+    atomic within one process, which is exact for LocMemCache.
+    """
+
+    def __init__(self, cache_backend=None):
+        self.cache = cache_backend or cache
+        self._scripts = None
+        self._lock = threading.Lock()
+
+    def get_redis_scripts(self):
+        if self._scripts is None:
+            client = getattr(getattr(self.cache, '_cache', None), 'get_client', None)
+            if client is None:
+                self._scripts = {}
+            else:
+                client = client(write=True)
+                self._scripts = {
+                    SLIDING_WINDOW: client.register_script(SLIDING_WINDOW_SCRIPT),
+                    TOKEN_BUCKET: client.register_script(TOKEN_BUCKET_SCRIPT),
+                }
+        return self._scripts
+
+    def make_key(self, key):
+        return self.cache.make_and_validate_key(key) if hasattr(self.cache, 'make_and_validate_key') else key
+
+    def hit(self, limit, ident, now=None):
+        """
+        :return: (allowed, seconds until retry)
+        """
+        now = time.time() if now is None else now
+        key = 'rate_limit:{name}:{ident}'.format(name=limit.name, ident=ident)
+        if limit.algorithm == TOKEN_BUCKET:
+            return self.token_bucket(limit, key, now)
+        return self.sliding_window(limit, key, now)
+
+    def sliding_window(self, limit, key, now):
+        # Weighted sum of the current and previous fixed windows approximates a true sliding window.
+        bucket = int(now // limit.window)
+        current_key = '{key}:{bucket}'.format(key=key, bucket=bucket)
+        previous_key = '{key}:{bucket}'.format(key=key, bucket=bucket - 1)
+        ttl = limit.window * 2
+        script = self.get_redis_scripts().get(SLIDING_WINDOW)
+        if script is not None:
+            current, previous = script(keys=[self.make_key(current_key), self.make_key(previous_key)],
+                                       args=[ttl])
+        else:
+            if self.cache.add(current_key, 1, ttl):
+                current = 1
+            else:
+                try:
+                    current = self.cache.incr(current_key)
+                except ValueError:
+                    # expired between add and incr
+                    self.cache.set(current_key, 1, ttl)
+                    current = 1
+            previous = self.cache.get(previous_key, 0)
+        elapsed = (now % limit.window) / limit.window
+        count = previous * (1 - elapsed) + current
+        retry_after = limit.window - now % limit.window
+        return count <= limit.requests, retry_after
+
+    def token_bucket(self, limit, key, now):
+        rate = limit.requests / limit.window
+        ttl = limit.window * 2
+        script = self.get_redis_scripts().get(TOKEN_BUCKET)
+        if script is not None:
+            allowed, tokens = script(keys=[self.make_key(key)], args=[limit.requests, rate, now, ttl])
+            allowed, tokens = bool(allowed), tokens / 1000.0
+        else:
+            with self._lock:
+                tokens, ts = self.cache.get(key, (limit.requests, now))
+                tokens = min(limit.requests, tokens + max(0, now - ts) * rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                self.cache.set(key, (tokens, now), ttl)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+
 class RateLimitMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
-        self.rate_limit_requests = getattr(settings, 'RATE_LIMIT_REQUESTS', 100) # Default to 100 requests
-        self.rate_limit_time_window = getattr(settings, 'RATE_LIMIT_TIME_WINDOW', 60) # Default to 60 seconds
+        self.rate_limit_requests = getattr(settings, 'RATE_LIMIT_REQUESTS', 100)  # Default to 100 requests
+        self.rate_limit_time_window = getattr(settings, 'RATE_LIMIT_TIME_WINDOW', 60)  # Default to 60 seconds
+        algorithm = getattr(settings, 'RATE_LIMIT_ALGORITHM', SLIDING_WINDOW)
+        # Allow admin, static, and other specific paths to bypass rate limiting
+        self.bypass_paths = tuple(getattr(settings, 'RATE_LIMIT_BYPASS_PATHS', DEFAULT_BYPASS_PATHS)) + \
+            (settings.STATIC_URL,)
+        # The first matching route limit applies, otherwise the global one
+        self.limits = []
+        for i, route in enumerate(getattr(settings, 'RATE_LIMIT_ROUTES', [])):
+            pattern, requests, window = route[:3]
+            self.limits.append(RateLimit('route%d' % i, requests, window,
+                                         route[3] if len(route) > 3 else algorithm, pattern))
+        self.limits.append(RateLimit('global', self.rate_limit_requests, self.rate_limit_time_window, algorithm))
+        self.limiter = RateLimiter()
+        # In-process pre-filter: an IP rejected `limit * (factor - 1)` times within one window
+        # is blocked locally for a window, its requests no longer reach the cache
+        self.block_factor = getattr(settings, 'RATE_LIMIT_BLOCK_FACTOR', 2)
+        self.block_size = getattr(settings, 'RATE_LIMIT_BLOCK_SIZE', 10000)
+        self.blocked = OrderedDict()
+        self.denials = OrderedDict()
+        self._lock = threading.Lock()
 
     def __call__(self, request):
-        # Allow admin, static, and other specific paths to bypass rate limiting
-        # You can customize these paths as needed
-        bypass_paths = [
-            '/admin/',
-            settings.STATIC_URL,
-            '/ckeditor/upload/',
-            '/wasabi-file-list-json/',
-            '/sitemap.xml',
-            '/robots.txt',
-        ]
-        if any(request.path.startswith(path) for path in bypass_paths):
+        if request.path.startswith(self.bypass_paths):
             return self.get_response(request)
 
         ip_address = self.get_client_ip(request)
         if ip_address:
-            cache_key = f'rate_limit:{ip_address}'
-            # Atomically increment the count and set expiry if it's a new entry
-            count = cache.get(cache_key, 0)
-            if count == 0:
-                cache.set(cache_key, 1, timeout=self.rate_limit_time_window)
-            else:
-                cache.incr(cache_key)
+            now = time.time()
+            blocked_until = self.blocked.get(ip_address)
+            if blocked_until is not None:
+                if blocked_until > now:
+                    return self.too_many_requests(blocked_until - now)
+                self.blocked.pop(ip_address, None)
+
+            limit = next(limit for limit in self.limits if limit.matches(request.path))
+            try:
+                allowed, retry_after = self.limiter.hit(limit, ip_address, now)
+            except Exception as e:
+                # Fail open, the cache being down must not take the site down
+                logger.error('rate limit error: %s' % e)
+                return self.get_response(request)
+
+            if not allowed:
+                logger.warning(f"Rate limit exceeded for IP: {ip_address} ({limit.name})")
+                self.record_denial(ip_address, limit, now)
+                return self.too_many_requests(retry_after)
 
-            if count >= self.rate_limit_requests:
-                logger.warning(f"Rate limit exceeded for IP: {ip_address}")
-                return HttpResponse("Too many requests.", status=429)
-        
         response = self.get_response(request)
         return response
 
+    def record_denial(self, ip_address, limit, now):
+        if not self.block_factor:
+            return
+        with self._lock:
+            key = (ip_address, limit.name)
+            start, denied = self.denials.pop(key, (now, 0))
+            if now - start > limit.window:
+                start, denied = now, 0
+            denied += 1
+            if denied >= limit.requests * (self.block_factor - 1):
+                self.blocked[ip_address] = now + limit.window
+                self.blocked.move_to_end(ip_address)
+            else:
+                self.denials[key] = (start, denied)
+            for entries in (self.blocked, self.denials):
+                while len(entries) > self.block_size:
+                    entries.popitem(last=False)
+
+    def too_many_requests(self, retry_after):
+        response = HttpResponse("Too many requests.", status=429)
+        response['Retry-After'] = str(max(1, int(math.ceil(retry_after))))
+        return response
+
     def get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
         if x_forwarded_for:
@@ -0,0 +1,143 @@
+import gzip
+import logging
+import re
+
+from django.conf import settings
+from django.middleware.cache import CacheMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import decorator_from_middleware_with_args
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    # Python 3.14+
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+logger = logging.getLogger(__name__)
+
+# 与 GZipMiddleware 一致, 太短的内容不值得压缩
+MIN_LENGTH = 200
+QVALUE = re.compile(r'\bq\s*=\s*([0-9.]+)')
+
+
+# 只在写缓存时压缩一次, 可以用较高的级别; br 11 和 zstd 19 比这里慢一个数量级, 压缩率只高几个百分点
+COMPRESSORS = {'gzip': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda data: brotli.compress(data, quality=9)
+if zstd is not None:
+    # zstandard 和 compression.zstd 都有 compress(data, level), 输出完整的帧
+    COMPRESSORS['zstd'] = lambda data: zstd.compress(data, level=12)
+
+
+def get_encodings():
+    """
+    :return: 按优先级排列的可用编码, 未安装对应库的编码被跳过
+    """
+    encodings = getattr(settings, 'PRECOMPRESSED_ENCODINGS', ('zstd', 'br', 'gzip'))
+    return [encoding for encoding in encodings if encoding in COMPRESSORS]
+
+
+def precompress(content):
+    """
+    :return: dict of 编码 -> 压缩后的内容, 只保留比原文短的
+    """
+    variants = {}
+    if len(content) < MIN_LENGTH:
+        return variants
+    for encoding in get_encodings():
+        try:
+            data = COMPRESSORS[encoding](content)
+        except Exception as e:
+            logger.error('precompress {encoding} failed: {e}'.format(encoding=encoding, e=e))
+            continue
+        if len(data) < len(content):
+            variants[encoding] = data
+    return variants
+
+
+def parse_accept_encoding(header):
+    """
+    :return: dict of 编码 -> q 值, 如 'gzip, br;q=0.8' -> {'gzip': 1.0, 'br': 0.8}
+    """
+    accepted = {}
+    for item in header.split(','):
+        encoding, _, params = item.partition(';')
+        encoding = encoding.strip().lower()
+        if not encoding:
+            continue
+        match = QVALUE.search(params)
+        try:
+            accepted[encoding] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            accepted[encoding] = 0.0
+    return accepted
+
+
+def choose_encoding(header, variants):
+    """按服务端的优先级选出客户端接受(q > 0)的编码, 没有则返回 None"""
+    accepted = parse_accept_encoding(header)
+    for encoding in get_encodings():
+        if encoding in variants and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def encode_response(request, response):
+    """
+    用缓存中预先压缩的内容替换响应体, 设置了 Content-Encoding 后 GZipMiddleware 不再压缩.
+    缓存的页面对所有用户相同, 不含会被 BREACH 利用的私密内容, 因此不需要 GZipMiddleware 的随机填充
+    """
+    variants = response.__dict__.pop('precompressed', None)
+    if not variants or response.has_header('Content-Encoding'):
+        return response
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), variants)
+    if encoding is None:
+        return response
+    response.content = variants[encoding]
+    response.headers['Content-Length'] = str(len(response.content))
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response.headers['ETag'] = 'W/' + etag
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+class PrecompressedCacheMiddleware(CacheMiddleware):
+    """
+    写缓存前把各编码的压缩结果附在响应上一起缓存, 命中时按 Accept-Encoding 直接返回,
+    不必每次请求都由 GZipMiddleware 重新压缩.
+    缓存键在 GZipMiddleware 加上 Vary: Accept-Encoding 之前生成, 所有编码共用一条缓存
+    """
+
+    def process_request(self, request):
+        response = super().process_request(request)
+        if response is not None:
+            response = encode_response(request, response)
+        return response
+
+    def process_response(self, request, response):
+        if self._should_update_cache(request, response) and not response.streaming \
+                and response.status_code == 200 and not response.has_header('Content-Encoding'):
+            response.precompressed = precompress(response.content)
+        response = super().process_response(request, response)
+        return encode_response(request, response)
+
+
+def cache_page(timeout, *, cache=None, key_prefix=None):
+    """
+    与 django.views.decorators.cache.cache_page 用法相同, 缓存中同时保存压缩后的内容
+    """
+    return decorator_from_middleware_with_args(PrecompressedCacheMiddleware)(
+        page_timeout=timeout,
+        cache_alias=cache,
+        key_prefix=key_prefix,
+    )
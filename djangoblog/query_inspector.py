@@ -0,0 +1,118 @@
+import logging
+import os
+import re
+import time
+import traceback
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger('djangoblog.slow_query')
+
+# IN (%s, %s, ...) 的参数个数不同也是同一种查询
+IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+def get_query_shape(sql):
+    """去掉参数个数和空白的差异, 参数本身已经是 %s 占位符"""
+    return WHITESPACE.sub(' ', IN_LIST.sub('(%s...)', sql)).strip()
+
+
+def _is_project_frame(filename):
+    filename = os.path.abspath(filename)
+    return filename.startswith(str(settings.BASE_DIR)) and 'site-packages' not in filename \
+        and filename != os.path.abspath(__file__)
+
+
+def get_call_site(stack=None):
+    """
+    :return: 调用栈中最内层的项目代码位置, 如 blog/templatetags/blog_tags.py:134 in load_articletags
+    """
+    stack = stack or traceback.extract_stack()
+    for frame in reversed(stack):
+        if _is_project_frame(frame.filename):
+            return '{path}:{lineno} in {name}'.format(
+                path=os.path.relpath(frame.filename, settings.BASE_DIR), lineno=frame.lineno, name=frame.name)
+    return 'unknown'
+
+
+class QueryInspector:
+    """
+    作为 connection.execute_wrapper 使用, 统计同一形状的 SQL 在一次请求中执行的次数,
+    并把超过 slow_ms 的查询连同调用栈写入 djangoblog.slow_query 日志
+    """
+
+    def __init__(self, threshold=None, slow_ms=None):
+        """
+        :param threshold: 同一形状执行次数达到该值视为 N+1, None 时不检测
+        :param slow_ms: 慢查询阈值(毫秒), None 时不记录
+        """
+        self.threshold = threshold
+        self.slow_ms = slow_ms
+        self.counts = Counter()
+        self.call_sites = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            if self.threshold:
+                shape = get_query_shape(sql)
+                self.counts[shape] += 1
+                # 重复出现时才取调用栈, 只执行一次的查询不付出这个开销
+                if self.counts[shape] == 2:
+                    self.call_sites[shape] = get_call_site()
+            if self.slow_ms is not None and elapsed >= self.slow_ms:
+                stack = [frame for frame in traceback.extract_stack()[:-1] if _is_project_frame(frame.filename)]
+                slow_query_logger.warning('slow query {elapsed:.1f}ms: {sql}\n{stack}'.format(
+                    elapsed=elapsed, sql=sql, stack=''.join(traceback.format_list(stack))))
+
+    @contextmanager
+    def inspect(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def get_repeated(self):
+        """
+        :return: list of (执行次数, 调用位置, SQL 形状), 次数多的在前
+        """
+        if not self.threshold:
+            return []
+        return [(count, self.call_sites.get(shape, 'unknown'), shape)
+                for shape, count in self.counts.most_common() if count >= self.threshold]
+
+    def format_repeated(self, label=''):
+        lines = ['{label} repeated queries:'.format(label=label).strip()]
+        for count, call_site, shape in self.get_repeated():
+            lines.append('  {count}x {call_site}: {shape}'.format(count=count, call_site=call_site, shape=shape))
+        return '\n'.join(lines)
+
+
+class QueryInspectorTestMixin:
+    """
+    TestCase 混入类:
+        with self.assertNoNPlusOne():
+            self.client.get('/')
+    同一形状的 SQL 执行次数达到阈值时抛出 NPlusOneError
+    """
+    n_plus_one_threshold = 10
+
+    @contextmanager
+    def assertNoNPlusOne(self, threshold=None):
+        inspector = QueryInspector(threshold=threshold or self.n_plus_one_threshold)
+        with inspector.inspect():
+            yield inspector
+        if inspector.get_repeated():
+            raise NPlusOneError(inspector.format_repeated())
@@ -0,0 +1,127 @@
+import logging
+import time
+from functools import wraps
+
+from django.conf import settings
+
+from djangoblog.utils import cache, get_sha256
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'search_index_generation'
+RESULT_KEY = 'search_result_{generation}_{key}'
+STATS_HITS_KEY = 'search_cache_hits'
+STATS_MISSES_KEY = 'search_cache_misses'
+STATS_MISS_MS_KEY = 'search_cache_miss_ms'
+
+
+def get_index_generation():
+    """
+    索引代数, 每次写入索引后加一, 缓存的搜索结果以它为键的一部分
+    缓存被清空后用当前时间重新初始化, 不会与旧的代数重复
+    """
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_index_generation():
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        return get_index_generation()
+
+
+def normalize_query(query_string):
+    return ' '.join(str(query_string).lower().split())
+
+
+def _normalize_value(value):
+    if isinstance(value, (set, frozenset, list, tuple)):
+        return sorted(_normalize_value(v) for v in value)
+    if isinstance(value, type):
+        return value._meta.label_lower if hasattr(value, '_meta') else value.__name__
+    return repr(value)
+
+
+def _incr(key, delta=1):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+def _dump(result):
+    return {
+        'results': [(r.app_label, r.model_name, r.pk, r.score, getattr(r, 'highlighted', None))
+                    for r in result.get('results', [])],
+        'hits': result.get('hits', 0),
+        'facets': result.get('facets', {}),
+        'spelling_suggestion': result.get('spelling_suggestion'),
+    }
+
+
+def _load(value, result_class):
+    from haystack.models import SearchResult
+    result_class = result_class or SearchResult
+    results = []
+    for app_label, model_name, pk, score, highlighted in value['results']:
+        kwargs = {'highlighted': highlighted} if highlighted else {}
+        results.append(result_class(app_label, model_name, pk, score, **kwargs))
+    return dict(value, results=results)
+
+
+def cached_search(func):
+    """
+    缓存 SearchBackend.search 的结果(只保存 id/得分/高亮片段),
+    键为 (规范化的搜索词, 分页等参数, 索引代数), 索引写入后旧结果自然失效
+    """
+
+    @wraps(func)
+    def wrapper(backend, query_string, **kwargs):
+        timeout = getattr(settings, 'SEARCH_RESULT_CACHE_TIMEOUT', 0)
+        if not timeout or not query_string:
+            return func(backend, query_string, **kwargs)
+
+        params = sorted((k, _normalize_value(v)) for k, v in kwargs.items()
+                        if k != 'result_class' and v is not None)
+        material = repr((backend.connection_alias, normalize_query(query_string),
+                         getattr(backend, 'is_suggest', None), params))
+        key = RESULT_KEY.format(generation=get_index_generation(), key=get_sha256(material))
+        value = cache.get(key)
+        if value is not None:
+            _incr(STATS_HITS_KEY)
+            return _load(value, kwargs.get('result_class'))
+
+        start = time.perf_counter()
+        result = func(backend, query_string, **kwargs)
+        elapsed = int((time.perf_counter() - start) * 1000)
+        cache.set(key, _dump(result), timeout)
+        _incr(STATS_MISSES_KEY)
+        _incr(STATS_MISS_MS_KEY, elapsed)
+        return result
+
+    return wrapper
+
+
+def get_search_cache_stats():
+    """
+    :return: dict hits/misses/hit_rate/avg_backend_ms/saved_ms
+    """
+    values = cache.get_many([STATS_HITS_KEY, STATS_MISSES_KEY, STATS_MISS_MS_KEY])
+    hits = values.get(STATS_HITS_KEY, 0)
+    misses = values.get(STATS_MISSES_KEY, 0)
+    miss_ms = values.get(STATS_MISS_MS_KEY, 0)
+    avg_ms = miss_ms / misses if misses else 0
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0,
+        'avg_backend_ms': round(avg_ms, 1),
+        # 命中时省去的后端耗时, 按未命中的平均耗时估算
+        'saved_ms': int(hits * avg_ms),
+        'generation': get_index_generation(),
+    }
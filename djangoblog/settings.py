@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.10/ref/settings/
 """
 import os
 import sys
+import tempfile
 from platform import _wmi_query
 
 from django.utils.translation import gettext_lazy as _
@@ -95,7 +96,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.http.ConditionalGetMiddleware',
-    'blog.middleware.OnlineMiddleware'
+    'blog.middleware.OnlineMiddleware',
+    'djangoblog.middleware.query_inspector_middleware.QueryInspectorMiddleware',
 ]
 
 ROOT_URLCONF = 'djangoblog.urls'
@@ -187,10 +189,16 @@ HAYSTACK_CONNECTIONS = {
     'default': {
         'ENGINE': 'djangoblog.whoosh_cn_backend.WhooshEngine',
         'PATH': os.path.join(os.path.dirname(__file__), 'whoosh_index'),
+        # Seconds to wait for the index lock, segments kept before a background merge
+        'WRITER_TIMEOUT': 10,
+        'MAX_SEGMENTS': 10,
     },
 }
 # Automatically update searching index
-HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+HAYSTACK_SIGNAL_PROCESSOR = 'djangoblog.signal_processor.QueuedSignalProcessor'
+# Index updates are deduplicated and written in batches by a background thread
+HAYSTACK_QUEUE_BATCH_SIZE = 100
+HAYSTACK_QUEUE_FLUSH_INTERVAL = 0 if TESTING else 5
 AUTHENTICATION_BACKENDS = [
     'accounts.user_login_backend.EmailOrUsernameModelBackend']
 
@@ -229,7 +237,14 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'TIMEOUT': 10800,
         'LOCATION': 'unique-snowflake',
-    }
+    },
+    # 尚未写回数据库的浏览数, 不随默认缓存 clear, 也不会被淘汰
+    'view_counts': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'TIMEOUT': None,
+        'LOCATION': 'view-counts',
+        'OPTIONS': {'MAX_ENTRIES': 10 ** 7},
+    },
 }
 # 使用redis作为缓存
 if os.environ.get("DJANGO_REDIS_URL"):
@@ -237,7 +252,14 @@ if os.environ.get("DJANGO_REDIS_URL"):
         'default': {
             'BACKEND': 'django.core.cache.backends.redis.RedisCache',
             'LOCATION': f'redis://{os.environ.get("DJANGO_REDIS_URL")}',
-        }
+        },
+        # 默认缓存 clear 时会 FLUSHDB, 浏览数放在另一个库
+        'view_counts': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': f'redis://{os.environ.get("DJANGO_REDIS_URL")}',
+            'TIMEOUT': None,
+            'OPTIONS': {'db': int(os.environ.get('DJANGO_VIEW_COUNT_REDIS_DB') or 1)},
+        },
     }
 
 SITE_ID = 1
@@ -300,6 +322,11 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': True,
         },
+        'djangoblog.slow_query': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
     'root': {
         'handlers': ['console'],
@@ -381,6 +408,13 @@ if os.environ.get('DJANGO_ELASTICSEARCH_HOST'):
             'ENGINE': 'djangoblog.elasticsearch_backend.ElasticSearchEngine',
         },
     }
+elif os.environ.get('DJANGO_SEARCH_BACKEND') == 'sqlite_fts':
+    HAYSTACK_CONNECTIONS = {
+        'default': {
+            'ENGINE': 'djangoblog.sqlite_fts_backend.SqliteFtsEngine',
+            'PATH': os.path.join(os.path.dirname(__file__), 'sqlite_fts_index', 'index.sqlite3'),
+        },
+    }
 
 # CKEditor 配置
 CKEDITOR_JQUERY_URL = 'https://cdn.bootcdn.net/ajax/libs/jquery/3.6.0/jquery.min.js' # 如果你的Django Admin没有加载jQuery，可以加上这个
@@ -441,4 +475,52 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 # Rate Limiting settings
 RATE_LIMIT_REQUESTS = 500  # Number of requests allowed in the time window
 RATE_LIMIT_TIME_WINDOW = 300 # Time window in seconds (e.g., 300 seconds = 5 minutes)
-
+RATE_LIMIT_ALGORITHM = 'sliding_window'  # 'sliding_window' or 'token_bucket'
+RATE_LIMIT_ROUTES = [  # (path regex, requests, window seconds[, algorithm]), the first match replaces the global limit
+    (r'/postcomment$', 20, 60, 'token_bucket'),
+    # search and suggest hit the search backend; they sit in i18n_patterns, so allow a language prefix
+    (r'^(/(%s))?/(search|suggest)' % '|'.join(code for code, _ in LANGUAGES), 120, 60),
+]
+RATE_LIMIT_BLOCK_FACTOR = 2  # Block an IP in-process once it is rejected limit * (factor - 1) times in a window, 0 to disable
+
+# View counter settings
+VIEW_COUNT_CACHE = 'view_counts'  # Cache alias holding buffered views, falls back to default when missing
+VIEW_COUNT_DEDUP_WINDOW = 0  # Seconds a session/IP is counted once per article, 0 to disable; adds a cache key per visitor and article
+VIEW_COUNT_FLUSH_INTERVAL = 60  # Seconds between batched writes of buffered views, 0 to rely on flush_view_counts
+
+# Search result cache settings
+SEARCH_RESULT_CACHE_TIMEOUT = 60 * 10  # Seconds; keyed by index generation so index writes invalidate it, 0 to disable
+
+# jieba settings
+JIEBA_PRELOAD = not TESTING  # Load the jieba dictionary in wsgi.py so gunicorn --preload shares it across workers
+JIEBA_CACHE_DIR = os.environ.get('DJANGO_JIEBA_CACHE_DIR') or os.path.join(tempfile.gettempdir() if TESTING else BASE_DIR, 'jieba_cache')  # Serialized prefix dictionary, survives restarts unlike /tmp; tests write to the temp dir
+JIEBA_USER_DICT = os.path.join(JIEBA_CACHE_DIR, 'userdict.txt')  # Tag and category names, built by build_jieba_dict
+
+# Request telemetry settings (Elasticsearch performance index)
+TELEMETRY_QUEUE_SIZE = 10000  # Events buffered per process, the oldest are dropped when full
+TELEMETRY_BATCH_SIZE = 500  # Events per bulk request
+TELEMETRY_FLUSH_INTERVAL = 5  # Maximum seconds an event waits before being shipped
+
+# Server-Timing settings
+SERVER_TIMING = True  # Send db/cache/template/total durations in the Server-Timing response header
+SHOW_LOAD_TIMES = False  # Show the total from Server-Timing in the footer, read client side
+
+# Request profiling settings
+REQUEST_PROFILING = env_to_bool('DJANGO_REQUEST_PROFILING', False)  # Sample per-request db/cache/template/tag timings into servermanager.RequestProfile
+REQUEST_PROFILING_SAMPLE_RATE = 0.01  # Fraction of requests stored
+REQUEST_PROFILING_RETENTION_DAYS = 7  # Older samples are deleted when new ones are written
+
+# Performance rollup settings (run the rollup_performance command every few minutes)
+PERFORMANCE_ROLLUP_LAG = 2  # Minutes left unrolled, telemetry queues may still hold their events
+PERFORMANCE_ROLLUP_BACKFILL = 60 * 24  # Minutes of raw events rolled up on the first run
+PERFORMANCE_RAW_RETENTION_DAYS = 7  # Raw events in the performance index older than this are deleted
+PERFORMANCE_ROLLUP_RETENTION_DAYS = 180  # Rollups older than this are deleted
+
+# Query inspector settings (djangoblog.middleware.query_inspector_middleware)
+N_PLUS_ONE_DETECTION = DEBUG  # Log query shapes repeated within one request, with their call site
+N_PLUS_ONE_THRESHOLD = 10  # Executions of the same query shape that count as N+1
+N_PLUS_ONE_RAISE = False  # Raise NPlusOneError instead of logging, for staging smoke tests
+SLOW_QUERY_MS = int(os.environ['DJANGO_SLOW_QUERY_MS']) if os.environ.get('DJANGO_SLOW_QUERY_MS') else None  # Log slower queries with a stack trace to djangoblog.slow_query, None to disable
+
+# Precompressed page cache settings (djangoblog.page_cache.cache_page)
+PRECOMPRESSED_ENCODINGS = ('zstd', 'br', 'gzip')  # Variants stored with each cached page, in preference order; br needs brotli, zstd needs zstandard or Python 3.14
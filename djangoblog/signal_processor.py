@@ -0,0 +1,147 @@
+import atexit
+import copy
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections as db_connections
+from django.db import models, transaction
+from haystack.exceptions import NotHandled
+from haystack.signals import BaseSignalProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    """
+    替代 RealtimeSignalProcessor.
+    保存/删除只把 (model, pk) 放入队列, 同一对象多次变更只保留最后一次,
+    后台线程按数量或时间批量写入索引, 请求不再同步等待索引提交.
+
+    HAYSTACK_QUEUE_BATCH_SIZE: 队列达到该数量立即写入
+    HAYSTACK_QUEUE_FLUSH_INTERVAL: 最长等待秒数, 为0时同步写入(测试环境)
+    SearchIndex.skip_update_fields: 只修改这些字段时不更新索引
+    """
+
+    def setup(self):
+        self.batch_size = getattr(settings, 'HAYSTACK_QUEUE_BATCH_SIZE', 100)
+        self.flush_interval = getattr(settings, 'HAYSTACK_QUEUE_FLUSH_INTERVAL', 5)
+        self._pending = {}
+        self._first_pending_time = None
+        self._condition = threading.Condition()
+        self._worker = None
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.post_delete.connect(self.handle_delete)
+        atexit.register(self.flush)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.post_delete.disconnect(self.handle_delete)
+        self.flush()
+
+    def _get_index(self, using, sender):
+        try:
+            return self.connections[using].get_unified_index().get_index(sender)
+        except NotHandled:
+            return None
+
+    def handle_save(self, sender, instance, update_fields=None, raw=False, **kwargs):
+        if raw:
+            return
+        for using in self.connection_router.for_write(instance=instance):
+            index = self._get_index(using, sender)
+            if index is None:
+                continue
+            skip_fields = getattr(index, 'skip_update_fields', ())
+            if update_fields and set(update_fields) <= set(skip_fields):
+                continue
+            self.enqueue(using, sender, instance.pk, 'update', instance)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        for using in self.connection_router.for_write(instance=instance):
+            if self._get_index(using, sender) is None:
+                continue
+            # 删除完成后 django 会把 instance.pk 置为 None, 保留一份副本
+            self.enqueue(using, sender, instance.pk, 'delete', copy.copy(instance))
+
+    def enqueue(self, using, sender, pk, action, instance):
+        item = (using, sender, pk, action, instance)
+        if self.flush_interval <= 0:
+            self.process([item])
+            return
+        # 事务提交后再入队, 避免后台线程读到未提交的数据
+        transaction.on_commit(lambda: self._put(item))
+
+    def _put(self, item):
+        using, sender, pk = item[:3]
+        with self._condition:
+            if not self._pending:
+                self._first_pending_time = time.monotonic()
+            self._pending[(using, sender, pk)] = item
+            self._ensure_worker()
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='haystack-queue', daemon=True)
+            self._worker.start()
+
+    def _take(self):
+        with self._condition:
+            items = list(self._pending.values())
+            self._pending = {}
+            self._first_pending_time = None
+            return items
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._pending:
+                        waited = time.monotonic() - self._first_pending_time
+                        if len(self._pending) >= self.batch_size or waited >= self.flush_interval:
+                            break
+                        self._condition.wait(self.flush_interval - waited)
+                    else:
+                        self._condition.wait()
+            self.flush()
+
+    def flush(self):
+        items = self._take()
+        if not items:
+            return
+        try:
+            self.process(items)
+        except Exception as e:
+            logger.error('haystack queue flush error:{e}'.format(e=e))
+        finally:
+            db_connections.close_all()
+
+    def process(self, items):
+        """按 (backend, model) 分组, 更新批量取数据后一次写入"""
+        groups = {}
+        for using, sender, pk, action, instance in items:
+            groups.setdefault((using, sender), []).append((pk, action, instance))
+
+        for (using, sender), entries in groups.items():
+            index = self._get_index(using, sender)
+            if index is None:
+                continue
+            backend = self.connections[using].get_backend()
+            update_pks = [pk for pk, action, _ in entries if action == 'update']
+            removed = [instance for _, action, instance in entries if action == 'delete']
+            if update_pks:
+                objs = list(index.index_queryset(using=using).filter(pk__in=update_pks))
+                objs = [obj for obj in objs if index.should_update(obj)]
+                if objs:
+                    backend.update(index, objs)
+                found = {obj.pk for obj in objs}
+                # 不再属于索引范围(例如改为草稿)的对象需要移除
+                removed += [instance for pk, action, instance in entries
+                            if action == 'update' and pk not in found]
+            for instance in removed:
+                backend.remove(instance)
+            logger.info('haystack queue flush {model}: update {update} remove {remove}'.format(
+                model=sender._meta.label_lower, update=len(update_pks), remove=len(removed)))
@@ -0,0 +1,287 @@
+# encoding: utf-8
+import html
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+import jieba
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.encoding import force_str
+from haystack.backends import BaseEngine, BaseSearchBackend, BaseSearchQuery, log_query
+from haystack.constants import DJANGO_CT, DJANGO_ID, ID
+from haystack.exceptions import MissingDependency, SkipDocument
+from haystack.models import SearchResult
+from haystack.utils import get_identifier, get_model_ct
+from haystack.utils import log as logging
+
+from djangoblog.jieba_dict import preload
+from djangoblog.search_cache import bump_index_generation, cached_search
+
+logger = logging.getLogger(__name__)
+
+# jieba 分好的词用单元分隔符连接后写入 fts5, unicode61 分词器把它当作分隔符,
+# 去掉分隔符即可还原原文, 高亮片段不会多出空格
+TOKEN_SEPARATOR = '\x1f'
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+RESERVED_QUERY_WORDS = ('AND', 'OR', 'NOT', 'NEAR')
+
+
+def tokenize(text):
+    return TOKEN_SEPARATOR.join(jieba.cut(force_str(text)))
+
+
+def query_terms(query_string):
+    """搜索词分词, 去掉标点和 fts5 保留字"""
+    terms = []
+    for word in jieba.cut(force_str(query_string)):
+        word = word.strip()
+        if not word or word in RESERVED_QUERY_WORDS or not any(c.isalnum() for c in word):
+            continue
+        if word not in terms:
+            terms.append(word)
+    return terms
+
+
+def quote(term):
+    return '"%s"' % term.replace('"', '""')
+
+
+def format_snippet(snippet):
+    text = html.escape(snippet.replace(TOKEN_SEPARATOR, ''))
+    return text.replace(HIGHLIGHT_START, '<em>').replace(HIGHLIGHT_END, '</em>')
+
+
+class SqliteFtsSearchBackend(BaseSearchBackend):
+    """
+    基于 SQLite FTS5 的搜索后端, 使用 jieba 预先分词, bm25 排序.
+    haystack_doc 保存文档元数据, haystack_fts 保存分词后的全文, 两者 rowid 一致.
+    """
+
+    def __init__(self, connection_alias, **connection_options):
+        super(SqliteFtsSearchBackend, self).__init__(connection_alias, **connection_options)
+        self.path = connection_options.get('PATH')
+        if not self.path:
+            raise ImproperlyConfigured(
+                "You must specify a 'PATH' in your settings for connection '%s'." % connection_alias)
+        self._local = threading.local()
+        self.setup_complete = False
+        self.log = logging.getLogger('haystack')
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            conn = sqlite3.connect(self.path, timeout=30)
+            # WAL 模式下多个 worker 可同时读, 写入时不阻塞读
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def setup(self):
+        preload()
+        try:
+            with self.conn:
+                self.conn.execute(
+                    'CREATE TABLE IF NOT EXISTS haystack_doc ('
+                    'rowid INTEGER PRIMARY KEY, haystack_id TEXT UNIQUE, '
+                    'django_ct TEXT, django_id TEXT, data TEXT)')
+                self.conn.execute('CREATE INDEX IF NOT EXISTS haystack_doc_ct ON haystack_doc (django_ct)')
+                self.conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS haystack_fts USING fts5("
+                    "text, tokenize = 'unicode61')")
+        except sqlite3.OperationalError as e:
+            if 'fts5' in str(e):
+                raise MissingDependency('The sqlite3 library must be compiled with FTS5.')
+            raise
+        self.setup_complete = True
+
+    @property
+    def content_field_name(self):
+        from haystack import connections
+        return connections[self.connection_alias].get_unified_index().document_field
+
+    def _delete_ids(self, haystack_ids):
+        for haystack_id in haystack_ids:
+            row = self.conn.execute(
+                'SELECT rowid FROM haystack_doc WHERE haystack_id = ?', (haystack_id,)).fetchone()
+            if row:
+                self.conn.execute('DELETE FROM haystack_fts WHERE rowid = ?', row)
+                self.conn.execute('DELETE FROM haystack_doc WHERE rowid = ?', row)
+
+    def update(self, index, iterable, commit=True):
+        if not self.setup_complete:
+            self.setup()
+
+        content_field = self.content_field_name
+        docs = []
+        for obj in iterable:
+            try:
+                doc = index.full_prepare(obj)
+            except SkipDocument:
+                self.log.debug(u"Indexing for object `%s` skipped", obj)
+            else:
+                docs.append(doc)
+        if not docs:
+            return
+
+        try:
+            with self.conn:
+                self._delete_ids([doc[ID] for doc in docs])
+                for doc in docs:
+                    data = {k: v for k, v in doc.items()
+                            if k not in (ID, DJANGO_CT, DJANGO_ID, content_field, 'boost')}
+                    cursor = self.conn.execute(
+                        'INSERT INTO haystack_doc (haystack_id, django_ct, django_id, data) VALUES (?, ?, ?, ?)',
+                        (doc[ID], doc[DJANGO_CT], force_str(doc[DJANGO_ID]), json.dumps(data, cls=DjangoJSONEncoder)))
+                    self.conn.execute('INSERT INTO haystack_fts (rowid, text) VALUES (?, ?)',
+                                      (cursor.lastrowid, tokenize(doc.get(content_field, ''))))
+        except Exception as e:
+            if not self.silently_fail:
+                raise
+            self.log.error(u"%s while updating sqlite fts index" % e.__class__.__name__, exc_info=True)
+            return
+        bump_index_generation()
+
+    def remove(self, obj_or_string, commit=True):
+        if not self.setup_complete:
+            self.setup()
+
+        try:
+            with self.conn:
+                self._delete_ids([get_identifier(obj_or_string)])
+        except Exception as e:
+            if not self.silently_fail:
+                raise
+            self.log.error("Failed to remove document '%s' from sqlite fts: %s",
+                           get_identifier(obj_or_string), e, exc_info=True)
+            return
+        bump_index_generation()
+
+    def clear(self, models=None, commit=True):
+        if not self.setup_complete:
+            self.setup()
+
+        with self.conn:
+            if models is None:
+                self.conn.execute('DELETE FROM haystack_fts')
+                self.conn.execute('DELETE FROM haystack_doc')
+            else:
+                for model in models:
+                    self.conn.execute(
+                        'DELETE FROM haystack_fts WHERE rowid IN '
+                        '(SELECT rowid FROM haystack_doc WHERE django_ct = ?)', (get_model_ct(model),))
+                    self.conn.execute('DELETE FROM haystack_doc WHERE django_ct = ?', (get_model_ct(model),))
+        bump_index_generation()
+
+    def optimize(self):
+        if not self.setup_complete:
+            self.setup()
+        with self.conn:
+            self.conn.execute("INSERT INTO haystack_fts (haystack_fts) VALUES ('optimize')")
+
+    def _model_cts(self, models, limit_to_registered_models):
+        from haystack import connections
+        if models:
+            return sorted(get_model_ct(model) for model in models)
+        if limit_to_registered_models is None or limit_to_registered_models:
+            return sorted(get_model_ct(model) for model in
+                          connections[self.connection_alias].get_unified_index().get_indexed_models())
+        return []
+
+    def _search(self, match, start_offset=0, end_offset=None, highlight=False, model_cts=None,
+                exclude_id=None, result_class=None):
+        where = ['haystack_fts MATCH ?']
+        params = [match]
+        if model_cts:
+            where.append('d.django_ct IN (%s)' % ','.join('?' * len(model_cts)))
+            params += model_cts
+        if exclude_id:
+            where.append('d.haystack_id != ?')
+            params.append(exclude_id)
+        from_sql = ' FROM haystack_fts JOIN haystack_doc d ON d.rowid = haystack_fts.rowid WHERE ' + \
+                   ' AND '.join(where)
+
+        hits = self.conn.execute('SELECT COUNT(*)' + from_sql, params).fetchone()[0]
+        limit = -1 if end_offset is None else max(end_offset - start_offset, 0)
+        snippet = "snippet(haystack_fts, 0, '%s', '%s', '...', 32)" % (HIGHLIGHT_START, HIGHLIGHT_END) \
+            if highlight else 'NULL'
+        rows = self.conn.execute(
+            'SELECT d.django_ct, d.django_id, d.data, bm25(haystack_fts), ' + snippet + from_sql +
+            ' ORDER BY bm25(haystack_fts) LIMIT ? OFFSET ?', params + [limit, start_offset]).fetchall()
+
+        result_class = result_class or SearchResult
+        results = []
+        for django_ct, django_id, data, rank, fragment in rows:
+            app_label, model_name = django_ct.split('.')
+            additional_fields = json.loads(data)
+            if fragment is not None:
+                additional_fields['highlighted'] = {self.content_field_name: [format_snippet(fragment)]}
+            # bm25 越小越相关
+            results.append(result_class(app_label, model_name, django_id, -rank, **additional_fields))
+        return {
+            'results': results,
+            'hits': hits,
+            'facets': {},
+            'spelling_suggestion': None,
+        }
+
+    @cached_search
+    @log_query
+    def search(self, query_string, start_offset=0, end_offset=None, highlight=False, models=None,
+               limit_to_registered_models=None, result_class=None, **kwargs):
+        if not self.setup_complete:
+            self.setup()
+
+        terms = query_terms(query_string)
+        if not terms:
+            return {'results': [], 'hits': 0}
+        return self._search(' AND '.join(quote(t) for t in terms), start_offset, end_offset, highlight,
+                            self._model_cts(models, limit_to_registered_models), result_class=result_class)
+
+    def more_like_this(self, model_instance, additional_query_string=None, start_offset=0, end_offset=None,
+                       models=None, limit_to_registered_models=None, result_class=None, **kwargs):
+        """取原文中出现最多的词做 OR 查询"""
+        if not self.setup_complete:
+            self.setup()
+
+        haystack_id = get_identifier(model_instance)
+        row = self.conn.execute(
+            'SELECT f.text FROM haystack_fts f JOIN haystack_doc d ON d.rowid = f.rowid '
+            'WHERE d.haystack_id = ?', (haystack_id,)).fetchone()
+        if not row:
+            return {'results': [], 'hits': 0}
+        counter = Counter(word for word in row[0].split(TOKEN_SEPARATOR)
+                          if len(word.strip()) > 1 and any(c.isalnum() for c in word))
+        terms = [word for word, _ in counter.most_common(20)]
+        if not terms:
+            return {'results': [], 'hits': 0}
+        match = '(%s)' % ' OR '.join(quote(t) for t in terms)
+        if additional_query_string and additional_query_string != '*':
+            extra = query_terms(additional_query_string)
+            if extra:
+                match += ' AND ' + ' AND '.join(quote(t) for t in extra)
+        return self._search(match, start_offset, end_offset, False,
+                            self._model_cts(models, limit_to_registered_models),
+                            exclude_id=haystack_id, result_class=result_class)
+
+
+class SqliteFtsSearchQuery(BaseSearchQuery):
+    def clean(self, query_fragment):
+        return query_fragment
+
+    def build_query_fragment(self, field, filter_type, value):
+        # 与 ElasticSearchQuery 相同, 只支持全文搜索, 分词在后端完成
+        return value.query_string if hasattr(value, 'query_string') else force_str(value)
+
+
+class SqliteFtsEngine(BaseEngine):
+    backend = SqliteFtsSearchBackend
+    query = SqliteFtsSearchQuery
@@ -1,9 +1,10 @@
 from django.test import TestCase
 
+from djangoblog.query_inspector import QueryInspectorTestMixin
 from djangoblog.utils import *
 
 
-class DjangoBlogTest(TestCase):
+class DjangoBlogTest(QueryInspectorTestMixin, TestCase):
     def setUp(self):
         pass
 
@@ -30,3 +31,296 @@ class DjangoBlogTest(TestCase):
         }
         data = parse_dict_to_url(d)
         self.assertIsNotNone(data)
+
+    def test_queued_signal_processor(self):
+        from haystack import connection_router, connections
+        from accounts.models import BlogUser
+        from blog.models import Article, Category
+        from djangoblog.signal_processor import QueuedSignalProcessor
+
+        processor = QueuedSignalProcessor(connections, connection_router)
+        processor.teardown()
+        processor.flush_interval = 60
+        processor.batch_size = 1000
+
+        user = BlogUser.objects.create_user(username='signaluser', email='signal@signal.com')
+        category = Category.objects.create(name='signalcategory')
+        article = Article.objects.create(
+            title='signaltitle', body='signalcontent', author=user, category=category)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            processor.handle_save(Article, article)
+            processor.handle_save(Article, article)
+            processor.handle_save(Article, article, update_fields=['views'])
+        items = processor._take()
+        self.assertEqual(1, len(items))
+        self.assertEqual('update', items[0][3])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            processor.handle_save(Article, article)
+            processor.handle_delete(Article, article)
+        items = processor._take()
+        self.assertEqual(1, len(items))
+        self.assertEqual('delete', items[0][3])
+        processor.process(items)
+
+    def test_search_result_cache(self):
+        from haystack.models import SearchResult
+        from djangoblog.search_cache import bump_index_generation, cached_search, get_search_cache_stats
+
+        class Backend:
+            connection_alias = 'default'
+            calls = 0
+
+            @cached_search
+            def search(self, query_string, **kwargs):
+                self.calls += 1
+                return {'results': [SearchResult('blog', 'article', 1, 1.0, highlighted={'text': ['<em>a</em>']})],
+                        'hits': 1}
+
+        cache.clear()
+        backend = Backend()
+        backend.search('Django  Blog', start_offset=0, end_offset=10)
+        result = backend.search('django blog', start_offset=0, end_offset=10)
+        self.assertEqual(1, backend.calls)
+        self.assertEqual(1, result['hits'])
+        self.assertEqual('<em>a</em>', result['results'][0].highlighted['text'][0])
+
+        backend.search('django blog', start_offset=10, end_offset=20)
+        self.assertEqual(2, backend.calls)
+        bump_index_generation()
+        backend.search('django blog', start_offset=0, end_offset=10)
+        self.assertEqual(3, backend.calls)
+
+        stats = get_search_cache_stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(3, stats['misses'])
+
+    def test_sqlite_fts_backend(self):
+        import tempfile
+        from haystack import connections
+        from accounts.models import BlogUser
+        from blog.models import Article, Category
+        from djangoblog.sqlite_fts_backend import SqliteFtsSearchBackend
+
+        user = BlogUser.objects.create_user(username='ftsuser', email='fts@fts.com')
+        category = Category.objects.create(name='ftscategory')
+        first = Article.objects.create(title='全文搜索', body='使用 SQLite 实现中文全文搜索', author=user,
+                                       category=category, status='p')
+        second = Article.objects.create(title='博客部署', body='使用 Docker 部署博客, 支持全文搜索', author=user,
+                                        category=category, status='p')
+        index = connections['default'].get_unified_index().get_index(Article)
+
+        with tempfile.TemporaryDirectory() as path, self.settings(SEARCH_RESULT_CACHE_TIMEOUT=0):
+            backend = SqliteFtsSearchBackend('default', PATH=path + '/index.sqlite3')
+            backend.update(index, [first, second])
+            backend.update(index, [first])
+
+            result = backend.search('全文搜索', highlight=True)
+            self.assertEqual(2, result['hits'])
+            self.assertIn('<em>', result['results'][0].highlighted['text'][0])
+
+            result = backend.search('sqlite', start_offset=0, end_offset=10)
+            self.assertEqual([str(first.id)], [r.pk for r in result['results']])
+
+            result = backend.more_like_this(first)
+            self.assertEqual([str(second.id)], [r.pk for r in result['results']])
+
+            backend.remove(first)
+            self.assertEqual(0, backend.search('sqlite')['hits'])
+            backend.clear()
+            self.assertEqual(0, backend.search('部署')['hits'])
+            backend.conn.close()
+
+    def test_whoosh_segment_merge(self):
+        import tempfile
+        from haystack import connections
+        from accounts.models import BlogUser
+        from blog.models import Article, Category
+        from djangoblog.whoosh_cn_backend import WhooshSearchBackend, get_metrics
+
+        user = BlogUser.objects.create_user(username='whooshuser', email='whoosh@whoosh.com')
+        category = Category.objects.create(name='whooshcategory')
+        index = connections['default'].get_unified_index().get_index(Article)
+
+        articles = [Article.objects.create(title='whoosh' + str(i), body='segment', author=user,
+                                           category=category, status='p') for i in range(5)]
+        cache.clear()
+        with tempfile.TemporaryDirectory() as path:
+            backend = WhooshSearchBackend('default', PATH=path, MAX_SEGMENTS=2)
+            # 每次提交一个新段
+            for article in articles:
+                backend.update(index, [article])
+            self.assertLessEqual(backend.segment_count(), 2)
+            metrics = get_metrics()
+            self.assertGreaterEqual(metrics['merges'], 1)
+            self.assertIn('last_merge_ms', metrics)
+
+            self.assertIsNotNone(backend.merge_segments(optimize=True))
+            self.assertEqual(1, backend.segment_count())
+            backend.remove(article)
+
+    def test_server_timing(self):
+        from django.contrib.sites.models import Site
+        from djangoblog.timing import get_timings, phase, request_timing
+
+        with phase('db'):
+            self.assertIsNone(get_timings())
+        with request_timing() as timings:
+            cache.get_or_set('server_timing', 1)
+            Site.objects.count()
+        # get_or_set 内部的 get/add 不重复计数
+        self.assertEqual(1, timings.counts['cache'])
+        self.assertEqual(1, timings.counts['db'])
+
+        rsp = self.client.get('/')
+        self.assertEqual(rsp.status_code, 200)
+        header = rsp['Server-Timing']
+        for name in ('db', 'cache', 'template', 'total'):
+            self.assertIn(name + ';dur=', header)
+        self.assertNotIn(b'<!!LOAD_TIMES!!>', rsp.content)
+
+    def test_rate_limit(self):
+        from unittest.mock import patch
+        from django.conf import settings
+        from django.http import HttpResponse
+        from django.test import RequestFactory, override_settings
+        from djangoblog.middleware.rate_limit_middleware import RateLimitMiddleware
+
+        factory = RequestFactory()
+        cache.clear()
+        with override_settings(RATE_LIMIT_REQUESTS=3, RATE_LIMIT_TIME_WINDOW=60, RATE_LIMIT_BLOCK_FACTOR=2,
+                               RATE_LIMIT_ROUTES=[(r'/postcomment$', 2, 60, 'token_bucket')]):
+            middleware = RateLimitMiddleware(lambda request: HttpResponse('ok'))
+
+        def status(path, ip='10.0.0.1'):
+            # 固定在窗口开始处, 避免跨窗口
+            with patch('time.time', return_value=1200.0):
+                return middleware(factory.get(path, REMOTE_ADDR=ip)).status_code
+
+        self.assertEqual([200, 200, 200, 429], [status('/') for _ in range(4)])
+        self.assertEqual(200, status('/', ip='10.0.0.2'))
+        self.assertEqual(200, status('/admin/'))
+        # 评论接口单独计数, 令牌桶容量为 2
+        self.assertEqual([200, 200, 429], [status('/article/1/postcomment') for _ in range(3)])
+
+        # 被拒绝次数达到上限后在进程内直接拦截, 不再访问缓存
+        for _ in range(3):
+            status('/')
+        self.assertIn('10.0.0.1', middleware.blocked)
+        cache.clear()
+        with patch('time.time', return_value=1210.0):
+            rsp = middleware(factory.get('/', REMOTE_ADDR='10.0.0.1'))
+        self.assertEqual(429, rsp.status_code)
+        self.assertEqual('50', rsp['Retry-After'])
+
+        # 搜索路由带可选的语言前缀, 各语言共用同一个计数
+        search_route = next(route for route in settings.RATE_LIMIT_ROUTES if 'suggest' in route[0])
+        cache.clear()
+        with override_settings(RATE_LIMIT_REQUESTS=100, RATE_LIMIT_BLOCK_FACTOR=0,
+                               RATE_LIMIT_ROUTES=[(search_route[0], 3, 60)]):
+            middleware = RateLimitMiddleware(lambda request: HttpResponse('ok'))
+        self.assertEqual([200, 200, 200, 429],
+                         [status(path) for path in ('/search?q=a', '/en/search?q=a', '/zh-hant/suggest', '/suggest')])
+        self.assertEqual(200, status('/article/2020/01/01/search.html'))
+
+    def test_parse_user_agent(self):
+        googlebot = 'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)'
+        ua = parse_user_agent(googlebot)
+        self.assertTrue(ua.is_bot)
+        self.assertIs(ua, parse_user_agent(googlebot))
+        # 超长的 UA 不截断, 不同的 UA 不共用缓存
+        long_ua = parse_user_agent(googlebot + 'x' * 1000)
+        self.assertIsNot(long_ua, parse_user_agent(googlebot + 'x' * 2000))
+        self.assertEqual(googlebot + 'x' * 1000, long_ua.ua_string)
+        self.assertEqual('Other', parse_user_agent(None).browser.family)
+
+    def test_query_inspector(self):
+        from django.contrib.sites.models import Site
+        from djangoblog.query_inspector import NPlusOneError, QueryInspector, get_query_shape
+
+        self.assertEqual('SELECT * FROM t WHERE id IN (%s...)',
+                         get_query_shape('SELECT *  FROM t\nWHERE id IN (%s, %s, %s)'))
+
+        with self.assertRaises(NPlusOneError) as e:
+            with self.assertNoNPlusOne(threshold=3):
+                for i in range(3):
+                    list(Site.objects.filter(id=i))
+        self.assertIn('3x djangoblog/tests.py', str(e.exception))
+
+        with self.assertNoNPlusOne():
+            self.assertEqual(200, self.client.get('/').status_code)
+
+        inspector = QueryInspector(slow_ms=0)
+        with self.assertLogs('djangoblog.slow_query', 'WARNING') as logs:
+            with inspector.inspect():
+                Site.objects.count()
+        self.assertIn('test_query_inspector', logs.output[0])
+
+    def test_timed_library(self):
+        from djangoblog.timing import TimedLibrary, advise, request_timing
+
+        register = TimedLibrary()
+
+        @register.filter(is_safe=True)
+        def double(value):
+            return value * 2
+
+        @register.simple_tag(takes_context=True)
+        def greet(context, name):
+            return 'hi ' + name
+
+        self.assertTrue(register.filters['double'].is_safe)
+        self.assertIn('greet', register.tags)
+        with request_timing() as timings:
+            self.assertEqual(4, double(2))
+            double(3)
+        count, total, longest = timings.tags['double']
+        self.assertEqual(2, count)
+        self.assertGreaterEqual(total, longest)
+
+        with advise() as advisor:
+            for value in (1, 1, 1, 2):
+                double(value)
+        row = advisor.report(min_repeat=0.5, min_ms=0)[0]
+        self.assertEqual(('double', 4, 2, 0.5), (row['name'], row['calls'], row['distinct_inputs'],
+                                                 row['repeat_rate']))
+        self.assertTrue(row['cache'])
+
+    def test_precompressed_page_cache(self):
+        import gzip
+        from unittest import mock
+
+        from django.http import HttpResponse
+        from django.middleware.gzip import GZipMiddleware
+        from django.test import RequestFactory
+
+        from djangoblog.page_cache import cache_page, choose_encoding
+
+        self.assertEqual('gzip', choose_encoding('gzip, deflate', {'gzip': b''}))
+        self.assertIsNone(choose_encoding('gzip;q=0, deflate', {'gzip': b''}))
+        self.assertIsNone(choose_encoding('', {'gzip': b''}))
+
+        body = ('<p>precompressed page cache</p>' * 100).encode()
+        calls = []
+
+        def view(request):
+            calls.append(request)
+            return HttpResponse(body)
+
+        handler = GZipMiddleware(cache_page(60, key_prefix='test_precompressed')(view))
+        factory = RequestFactory()
+        response = handler(factory.get('/precompressed', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertEqual(body, gzip.decompress(response.content))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        # 命中缓存时不调用视图, 也不再经 GZipMiddleware 压缩
+        with mock.patch('django.middleware.gzip.compress_string') as compress_string:
+            response = handler(factory.get('/precompressed', HTTP_ACCEPT_ENCODING='gzip'))
+            self.assertEqual(body, gzip.decompress(response.content))
+            response = handler(factory.get('/precompressed'))
+            self.assertEqual(body, response.content)
+            self.assertFalse(response.has_header('Content-Encoding'))
+        compress_string.assert_not_called()
+        self.assertEqual(1, len(calls))
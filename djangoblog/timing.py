@@ -0,0 +1,316 @@
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from collections import Counter
+from functools import wraps
+
+from django import template
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import QuerySet
+
+PHASES = ('db', 'cache', 'template')
+CACHE_METHODS = ('get', 'set', 'add', 'delete', 'get_many', 'set_many', 'delete_many',
+                 'get_or_set', 'has_key', 'incr', 'decr', 'touch')
+
+# 当前请求各阶段累计耗时, 不在请求中时为 None
+_timings = ContextVar('request_timings', default=None)
+# 正在计时的阶段, 同一阶段嵌套调用(如 get_or_set 内部的 get/add)只计一次
+_active = ContextVar('request_timing_active', default=frozenset())
+_installed = False
+# 由 advise() 设置, 收集模板标签的输入用于片段缓存建议
+_advisor = None
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {name: 0.0 for name in PHASES}
+        self.counts = {name: 0 for name in PHASES}
+        # 模板标签名 -> [调用次数, 总耗时, 最大耗时]
+        self.tags = {}
+
+    def add(self, name, elapsed):
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def add_tag(self, name, elapsed):
+        stats = self.tags.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+    @property
+    def total(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def header(self):
+        """
+        生成 Server-Timing 头, 各阶段可能重叠(模板渲染中的查询同时计入 db 和 template)
+        :return: 如 db;dur=3.2;desc="4 queries", cache;dur=0.8, template;dur=12.5, total;dur=20.1
+        """
+        items = []
+        for name, elapsed in self.phases.items():
+            item = '{name};dur={elapsed:.1f}'.format(name=name, elapsed=elapsed)
+            if name == 'db':
+                item += ';desc="{count} queries"'.format(count=self.counts[name])
+            items.append(item)
+        items.append('total;dur={total:.1f}'.format(total=self.total))
+        return ', '.join(items)
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total, 2),
+            'db_queries': self.counts['db'],
+            'db_ms': round(self.phases['db'], 2),
+            'cache_calls': self.counts['cache'],
+            'cache_ms': round(self.phases['cache'], 2),
+            'template_ms': round(self.phases['template'], 2),
+            'tags': {name: {'count': count, 'ms': round(elapsed, 2), 'max_ms': round(longest, 2)}
+                     for name, (count, elapsed, longest) in self.tags.items()},
+        }
+
+
+def get_timings():
+    return _timings.get()
+
+
+@contextmanager
+def phase(name):
+    """在当前请求中计时一个阶段, 请求之外或同一阶段嵌套时不计时"""
+    timings = _timings.get()
+    active = _active.get()
+    if timings is None or name in active:
+        yield
+        return
+    token = _active.set(active | {name})
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - start) * 1000)
+        _active.reset(token)
+
+
+def timed(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+
+        wrapper._timed_phase = name
+        return wrapper
+
+    return decorator
+
+
+def _record_tag(name, start):
+    elapsed = (time.perf_counter() - start) * 1000
+    timings = _timings.get()
+    if timings is not None:
+        timings.add_tag(name, elapsed)
+    if _advisor is not None:
+        _advisor.record_call(name, elapsed)
+
+
+def _input_key(args, kwargs):
+    """模型实例按主键区分, Context 不作为输入"""
+    values = []
+    for value in list(args) + sorted(kwargs.items()):
+        if isinstance(value, template.Context):
+            continue
+        if hasattr(value, '_meta') and hasattr(value, 'pk'):
+            values.append('{label}:{pk}'.format(label=value._meta.label_lower, pk=value.pk))
+        elif isinstance(value, QuerySet):
+            # repr 会执行查询, 用 SQL 区分
+            try:
+                values.append(str(value.query))
+            except Exception:
+                values.append(value.model._meta.label_lower)
+        else:
+            values.append(repr(value)[:200])
+    return tuple(values)
+
+
+def _timed_function(name, func, timed=True):
+    """
+    :param timed: inclusion tag 在节点渲染时计时(包含渲染模板), 函数本身只记录输入
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _advisor is not None:
+            _advisor.record_input(name, _input_key(args, kwargs))
+        if not timed or (_timings.get() is None and _advisor is None):
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _record_tag(name, start)
+
+    return wrapper
+
+
+def _timed_compile(name, compile_func):
+    @wraps(compile_func)
+    def wrapper(parser, token):
+        node = compile_func(parser, token)
+        render = node.render
+
+        def timed_render(context):
+            if _timings.get() is None and _advisor is None:
+                return render(context)
+            start = time.perf_counter()
+            try:
+                return render(context)
+            finally:
+                _record_tag(name, start)
+
+        node.render = timed_render
+        return node
+
+    return wrapper
+
+
+class TimedLibrary(template.Library):
+    """
+    注册的 simple_tag/inclusion_tag/filter 都会计时, 按请求统计次数/总耗时/最大耗时,
+    用法与 template.Library 相同
+    """
+
+    def filter(self, name=None, filter_func=None, **flags):
+        # 各种写法最终都以 (name, filter_func) 调用到这里
+        if name is not None and filter_func is not None:
+            filter_func = _timed_function(name, filter_func)
+        return super().filter(name, filter_func, **flags)
+
+    def simple_tag(self, func=None, takes_context=None, name=None):
+        def dec(func):
+            tag_name = name or func.__name__
+            return super(TimedLibrary, self).simple_tag(
+                _timed_function(tag_name, func), takes_context=takes_context, name=tag_name)
+
+        if func is None:
+            return dec
+        elif callable(func):
+            return dec(func)
+        raise ValueError('Invalid arguments provided to simple_tag')
+
+    def inclusion_tag(self, filename, func=None, takes_context=None, name=None):
+        def dec(func):
+            tag_name = name or func.__name__
+            func = super(TimedLibrary, self).inclusion_tag(filename, takes_context=takes_context, name=tag_name)(
+                _timed_function(tag_name, func, timed=False))
+            self.tags[tag_name] = _timed_compile(tag_name, self.tags[tag_name])
+            return func
+
+        return dec
+
+
+class TagAdvisor:
+    """
+    统计每个模板标签的调用次数/耗时和输入的重复程度,
+    输入重复越多、耗时越长的标签越适合做片段缓存
+    """
+
+    def __init__(self):
+        self.stats = {}
+
+    def _get(self, name):
+        return self.stats.setdefault(name, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'inputs': Counter()})
+
+    def record_call(self, name, elapsed):
+        stats = self._get(name)
+        stats['calls'] += 1
+        stats['total_ms'] += elapsed
+        stats['max_ms'] = max(stats['max_ms'], elapsed)
+
+    def record_input(self, name, key):
+        self._get(name)['inputs'][key] += 1
+
+    def report(self, min_repeat=0.5, min_ms=0.5):
+        """
+        :param min_repeat: 输入重复率达到该值才建议缓存
+        :param min_ms: 平均耗时达到该值(毫秒)才建议缓存
+        :return: list of dict, 按可节省的耗时倒序
+        """
+        rows = []
+        for name, stats in self.stats.items():
+            if not stats['calls']:
+                continue
+            avg_ms = stats['total_ms'] / stats['calls']
+            distinct = min(len(stats['inputs']) or stats['calls'], stats['calls'])
+            repeat = 1 - distinct / stats['calls']
+            rows.append({
+                'name': name,
+                'calls': stats['calls'],
+                'distinct_inputs': distinct,
+                'repeat_rate': round(repeat, 3),
+                'avg_ms': round(avg_ms, 3),
+                'max_ms': round(stats['max_ms'], 3),
+                # 每种输入只需渲染一次
+                'saved_ms': round((stats['calls'] - distinct) * avg_ms, 1),
+                'cache': repeat >= min_repeat and avg_ms >= min_ms,
+            })
+        return sorted(rows, key=lambda row: -row['saved_ms'])
+
+
+@contextmanager
+def advise():
+    """在 with 块内收集模板标签的输入和耗时"""
+    global _advisor
+    advisor = TagAdvisor()
+    _advisor = advisor
+    try:
+        yield advisor
+    finally:
+        _advisor = None
+
+
+def db_wrapper(execute, sql, params, many, context):
+    with phase('db'):
+        return execute(sql, params, many, context)
+
+
+def _wrap_method(cls, method_name, name):
+    func = cls.__dict__.get(method_name) or getattr(cls, method_name, None)
+    if func is None or getattr(func, '_timed_phase', None):
+        return
+    setattr(cls, method_name, timed(name)(func))
+
+
+def install():
+    """
+    给缓存后端和模板渲染加上计时, 每个进程只需一次.
+    只包装 django 模板后端的 Template.render, include 和 inclusion tag 在其内部渲染, 不会重复计时
+    """
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    from django.template.backends.django import Template
+    _wrap_method(Template, 'render', 'template')
+    for alias in settings.CACHES:
+        cls = type(caches[alias])
+        for method_name in CACHE_METHODS:
+            _wrap_method(cls, method_name, 'cache')
+
+
+@contextmanager
+def request_timing():
+    """
+    请求开始时调用, 之后的查询/缓存/模板耗时计入返回的 RequestTimings
+    """
+    install()
+    timings = RequestTimings()
+    token = _timings.set(timings)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(db_wrapper))
+            yield timings
+    finally:
+        _timings.reset(token)
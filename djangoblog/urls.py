@@ -14,7 +14,7 @@ from djangoblog.admin_site import admin_site
 from djangoblog.elasticsearch_backend import ElasticSearchModelSearchForm
 from djangoblog.feeds import DjangoBlogFeed
 from djangoblog.sitemap import ArticleSiteMap, CategorySiteMap, StaticViewSitemap, TagSiteMap, UserSiteMap
-from django.views.decorators.cache import cache_page
+from djangoblog.page_cache import cache_page
 from djangoblog import views as djangoblog_views
 from blog import views as blog_views
 
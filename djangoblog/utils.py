@@ -7,6 +7,7 @@ import os
 import random
 import string
 import uuid
+from functools import lru_cache
 from hashlib import sha256
 
 import bleach
@@ -19,6 +20,7 @@ from django.core.cache import cache
 from django.templatetags.static import static
 from PIL import Image
 from bs4 import BeautifulSoup
+from user_agents import parse as parse_user_agent_uncached
 
 logger = logging.getLogger(__name__)
 
@@ -146,6 +148,19 @@ class CommonMarkdown:
         return body
 
 
+def parse_user_agent(ua_string):
+    """
+    解析 UA 字符串, 结果按字符串缓存在进程内, 最多缓存 1024 个.
+    访问来源的 UA 种类很少, 正则匹配只在第一次遇到时执行, 返回的对象不要修改
+    """
+    return _parse_user_agent(ua_string or '')
+
+
+@lru_cache(maxsize=1024)
+def _parse_user_agent(ua_string):
+    return parse_user_agent_uncached(ua_string)
+
+
 def send_email(emailto, title, content):
     from djangoblog.blog_signals import send_email_signal
     send_email_signal.send(
@@ -231,6 +246,13 @@ def delete_sidebar_cache():
         cache.delete(k)
 
 
+def clear_cache():
+    """清空默认缓存, 先把尚未写回的浏览数写入数据库"""
+    from blog.view_counter import flush_before_clear
+    flush_before_clear()
+    cache.clear()
+
+
 def delete_view_cache(prefix, keys):
     from django.core.cache.utils import make_template_fragment_key
     key = make_template_fragment_key(prefix, keys)
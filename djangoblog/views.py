@@ -6,6 +6,7 @@ from django.http import JsonResponse
 from bs4 import BeautifulSoup
 from blog.models import Article
 
+from accounts.utils import has_premium_access
 from djangoblog.utils import get_blog_setting, CommonMarkdown
 
 def age_verification_view(request):
@@ -30,6 +31,9 @@ def get_paginated_images(request, article_id, page_num=1):
     except Article.DoesNotExist:
         return JsonResponse({'error': 'Article not found'}, status=404)
 
+    if not has_premium_access(request.user, article):
+        return JsonResponse({'error': 'Membership required'}, status=403)
+
     html_content = CommonMarkdown.get_markdown(article.body)
     soup = BeautifulSoup(html_content, 'html.parser')
     images = soup.find_all('img')
@@ -7,6 +7,7 @@ import os
 import re
 import shutil
 import threading
+import time
 import warnings
 
 import six
@@ -22,7 +23,6 @@ from haystack.models import SearchResult
 from haystack.utils import get_identifier, get_model_ct
 from haystack.utils import log as logging
 from haystack.utils.app_loading import haystack_get_model
-from jieba.analyse import ChineseAnalyzer
 from whoosh import index
 from whoosh.analysis import StemmingAnalyzer
 from whoosh.fields import BOOLEAN, DATETIME, IDLIST, KEYWORD, NGRAM, NGRAMWORDS, NUMERIC, Schema, TEXT
@@ -32,7 +32,12 @@ from whoosh.highlight import ContextFragmenter, HtmlFormatter
 from whoosh.highlight import highlight as whoosh_highlight
 from whoosh.qparser import QueryParser
 from whoosh.searching import ResultsPage
-from whoosh.writing import AsyncWriter
+from whoosh.index import LockError
+from whoosh.writing import AsyncWriter, MERGE_SMALL
+
+from djangoblog.jieba_dict import get_analyzer, preload
+from djangoblog.search_cache import bump_index_generation, cached_search
+from djangoblog.utils import cache
 
 try:
     import whoosh
@@ -62,6 +67,38 @@ class WhooshHtmlFormatter(HtmlFormatter):
     template = '<%(tag)s>%(t)s</%(tag)s>'
 
 
+WHOOSH_METRICS_KEY = 'whoosh_metrics'
+WHOOSH_METRIC_KEY = 'whoosh_metric_{name}'
+WHOOSH_MERGE_LOCK_KEY = 'whoosh_merge_lock'
+WHOOSH_COUNTERS = ('lock_waits', 'lock_wait_ms', 'lock_timeouts', 'merges')
+
+
+def incr_metric(name, delta=1):
+    key = WHOOSH_METRIC_KEY.format(name=name)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+def set_metrics(**values):
+    metrics = cache.get(WHOOSH_METRICS_KEY) or {}
+    metrics.update(values)
+    cache.set(WHOOSH_METRICS_KEY, metrics, None)
+
+
+def get_metrics():
+    """
+    :return: dict segments/last_merge_ms/last_merge_time 及各计数器
+    """
+    metrics = dict(cache.get(WHOOSH_METRICS_KEY) or {})
+    counters = cache.get_many([WHOOSH_METRIC_KEY.format(name=name) for name in WHOOSH_COUNTERS])
+    for name in WHOOSH_COUNTERS:
+        metrics[name] = counters.get(WHOOSH_METRIC_KEY.format(name=name), 0)
+    return metrics
+
+
 class WhooshSearchBackend(BaseSearchBackend):
     # Word reserved by Whoosh for special use.
     RESERVED_WORDS = (
@@ -92,6 +129,10 @@ class WhooshSearchBackend(BaseSearchBackend):
             'POST_LIMIT',
             128 * 1024 * 1024)
         self.path = connection_options.get('PATH')
+        # 等待其他进程释放写锁的秒数, 超时后改用 AsyncWriter 在后台写入
+        self.writer_timeout = connection_options.get('WRITER_TIMEOUT', 10)
+        # 段数超过该值时在后台合并
+        self.max_segments = connection_options.get('MAX_SEGMENTS', 10)
 
         if connection_options.get('STORAGE', 'file') != 'file':
             self.use_file_storage = False
@@ -109,6 +150,8 @@ class WhooshSearchBackend(BaseSearchBackend):
         """
         from haystack import connections
         new_index = False
+        # 词典未预加载时(如管理命令)在这里加载, 已加载则直接返回
+        preload()
 
         # Make sure the index is there.
         if self.use_file_storage and not os.path.exists(self.path):
@@ -186,7 +229,7 @@ class WhooshSearchBackend(BaseSearchBackend):
             else:
                 # schema_fields[field_class.index_fieldname] = TEXT(stored=True, analyzer=StemmingAnalyzer(), field_boost=field_class.boost, sortable=True)
                 schema_fields[field_class.index_fieldname] = TEXT(
-                    stored=True, analyzer=ChineseAnalyzer(), field_boost=field_class.boost, sortable=True)
+                    stored=True, analyzer=get_analyzer(), field_boost=field_class.boost, sortable=True)
             if field_class.document is True:
                 content_field_name = field_class.index_fieldname
                 schema_fields[field_class.index_fieldname].spelling = True
@@ -204,7 +247,7 @@ class WhooshSearchBackend(BaseSearchBackend):
             self.setup()
 
         self.index = self.index.refresh()
-        writer = AsyncWriter(self.index)
+        writer = self.get_writer()
 
         for obj in iterable:
             try:
@@ -240,9 +283,12 @@ class WhooshSearchBackend(BaseSearchBackend):
                                 "object": get_identifier(obj)}})
 
         if len(iterable) > 0:
-            # For now, commit no matter what, as we run into locking issues
-            # otherwise.
-            writer.commit()
+            # 提交时不合并, 合并交给后台线程, 见 schedule_merge
+            writer.commit(merge=False)
+            bump_index_generation()
+            self.schedule_merge()
+        else:
+            writer.cancel()
 
     def remove(self, obj_or_string, commit=True):
         if not self.setup_complete:
@@ -252,10 +298,18 @@ class WhooshSearchBackend(BaseSearchBackend):
         whoosh_id = get_identifier(obj_or_string)
 
         try:
-            self.index.delete_by_query(
-                q=self.parser.parse(
-                    u'%s:"%s"' %
-                    (ID, whoosh_id)))
+            writer = self.get_writer()
+            try:
+                writer.delete_by_query(
+                    q=self.parser.parse(
+                        u'%s:"%s"' %
+                        (ID, whoosh_id)))
+                writer.commit(merge=False)
+            except Exception:
+                # 释放写锁, 否则之后的写入都会遇到 LockError
+                writer.cancel()
+                raise
+            bump_index_generation()
         except Exception as e:
             if not self.silently_fail:
                 raise
@@ -286,9 +340,16 @@ class WhooshSearchBackend(BaseSearchBackend):
                         u"%s:%s" %
                         (DJANGO_CT, get_model_ct(model)))
 
-                self.index.delete_by_query(
-                    q=self.parser.parse(
-                        u" OR ".join(models_to_delete)))
+                writer = self.get_writer()
+                try:
+                    writer.delete_by_query(
+                        q=self.parser.parse(
+                            u" OR ".join(models_to_delete)))
+                    writer.commit(merge=False)
+                except Exception:
+                    writer.cancel()
+                    raise
+            bump_index_generation()
         except Exception as e:
             if not self.silently_fail:
                 raise
@@ -321,6 +382,67 @@ class WhooshSearchBackend(BaseSearchBackend):
         self.index = self.index.refresh()
         self.index.optimize()
 
+    def get_writer(self):
+        """
+        多个 worker 共用一个索引目录, 先等待文件锁, 超时后退回 AsyncWriter,
+        由它在后台线程中拿到锁后写入, 不阻塞调用方
+        """
+        start = time.perf_counter()
+        try:
+            writer = self.index.writer(timeout=self.writer_timeout, delay=0.1)
+        except LockError:
+            incr_metric('lock_timeouts')
+            self.log.warning('whoosh writer lock timeout, fall back to AsyncWriter')
+            return AsyncWriter(self.index)
+        wait_ms = (time.perf_counter() - start) * 1000
+        if wait_ms >= 100:
+            incr_metric('lock_waits')
+            incr_metric('lock_wait_ms', int(wait_ms))
+        return writer
+
+    def segment_count(self):
+        if not self.setup_complete:
+            self.setup()
+        self.index = self.index.refresh()
+        return len(self.index._segments())
+
+    def schedule_merge(self):
+        """段数超过 max_segments 时由一个后台线程合并, 所有进程共用一把锁"""
+        count = self.segment_count()
+        set_metrics(segments=count)
+        if count <= self.max_segments or not cache.add(WHOOSH_MERGE_LOCK_KEY, 1, 60 * 10):
+            return
+        if settings.TESTING:
+            self.merge_segments(owns_lock=True)
+        else:
+            threading.Thread(target=self.merge_segments, kwargs={'owns_lock': True},
+                             name='whoosh-merge', daemon=True).start()
+
+    def merge_segments(self, optimize=False, owns_lock=False):
+        """
+        先合并小段, 仍超过 max_segments 或指定 optimize 时合并为一个段
+        :param owns_lock: 调用方已取得 WHOOSH_MERGE_LOCK_KEY, 合并结束后释放;
+            手动合并不释放, 以免清掉仍在运行的后台合并持有的锁
+        :return: 合并耗时(毫秒), 拿不到写锁时为 None
+        """
+        start = time.perf_counter()
+        try:
+            self.index = self.index.refresh()
+            self.index.writer(timeout=self.writer_timeout, delay=0.1).commit(mergetype=MERGE_SMALL)
+            if optimize or self.segment_count() > self.max_segments:
+                self.index.writer(timeout=self.writer_timeout, delay=0.1).commit(optimize=True)
+        except LockError:
+            self.log.warning('whoosh merge skipped, index is locked')
+            return None
+        finally:
+            if owns_lock:
+                cache.delete(WHOOSH_MERGE_LOCK_KEY)
+        elapsed = int((time.perf_counter() - start) * 1000)
+        incr_metric('merges')
+        set_metrics(segments=self.segment_count(), last_merge_ms=elapsed, last_merge_time=int(time.time()))
+        self.log.info('whoosh merge segments:{elapsed}ms'.format(elapsed=elapsed))
+        return elapsed
+
     def calculate_page(self, start_offset=0, end_offset=None):
         # Prevent against Whoosh throwing an error. Requires an end_offset
         # greater than 0.
@@ -345,6 +467,7 @@ class WhooshSearchBackend(BaseSearchBackend):
         page_num += 1
         return page_num, page_length
 
+    @cached_search
     @log_query
     def search(
             self,
@@ -727,7 +850,8 @@ class WhooshSearchBackend(BaseSearchBackend):
                 del (additional_fields[DJANGO_ID])
 
                 if highlight:
-                    sa = StemmingAnalyzer()
+                    # 中文内容需用结巴分词才能匹配到高亮词
+                    sa = get_analyzer()
                     formatter = WhooshHtmlFormatter('em')
                     terms = [token.text for token in sa(query_string)]
 
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "djangoblog.settings")
 
 application = get_wsgi_application()
+
+# 配合 gunicorn --preload 在 fork worker 之前加载分词词典
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, 'JIEBA_PRELOAD', False):
+    from djangoblog.jieba_dict import preload  # noqa: E402
+
+    preload()
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('owntracks', '0002_alter_owntracklog_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='owntracklog',
+            index=models.Index(fields=['creation_time', 'tid'], name='owntrack_time_tid_idx'),
+        ),
+    ]
@@ -18,3 +18,7 @@ class OwnTrackLog(models.Model):
         verbose_name = "OwnTrackLogs"
         verbose_name_plural = verbose_name
         get_latest_by = 'creation_time'
+        indexes = [
+            # 按日期查询轨迹: filter(creation_time__range) 后按 tid 分组
+            models.Index(fields=['creation_time', 'tid'], name='owntrack_time_tid_idx'),
+        ]
@@ -1,4 +1,11 @@
+from datetime import timedelta
+
 from django.contrib import admin
+from django.db.models import Avg, Count, F, FloatField, Max, Sum
+from django.db.models.functions import TruncHour
+from django.utils.timezone import now
+
+from servermanager.models import PerformanceRollup, RequestProfile
 # Register your models here.
 
 
@@ -17,3 +24,79 @@ class EmailSendLogAdmin(admin.ModelAdmin):
 
     def has_add_permission(self, request):
         return False
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('path', 'view_name', 'status_code', 'total_ms', 'db_queries', 'db_ms',
+                    'cache_calls', 'cache_ms', 'template_ms', 'tag_times', 'creation_time')
+    list_filter = ('method', 'status_code')
+    search_fields = ('path', 'view_name')
+    ordering = ('-total_ms',)
+    readonly_fields = [field.name for field in RequestProfile._meta.fields]
+    # 汇总最慢接口时只看最近的采样
+    summary_days = 7
+
+    def has_add_permission(self, request):
+        return False
+
+    def tag_times(self, obj):
+        return ', '.join('{name} {ms}ms/{count}'.format(name=name, **stats)
+                         for name, stats in sorted(obj.tags.items(), key=lambda item: -item[1]['ms']))
+
+    tag_times.short_description = '模板标签耗时'
+
+    def get_endpoint_summary(self, limit=20):
+        since = now() - timedelta(days=self.summary_days)
+        return RequestProfile.objects.filter(creation_time__gte=since) \
+            .values('view_name') \
+            .annotate(count=Count('id'), avg_total=Avg('total_ms'), max_total=Max('total_ms'),
+                      avg_queries=Avg('db_queries'), avg_db=Avg('db_ms'), avg_cache=Avg('cache_ms'),
+                      avg_template=Avg('template_ms')) \
+            .order_by('-avg_total')[:limit]
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context['endpoints'] = self.get_endpoint_summary()
+        extra_context['summary_days'] = self.summary_days
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+class PerformanceRollupAdmin(admin.ModelAdmin):
+    list_display = ('url', 'minute', 'count', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'bot_percent', 'countries')
+    search_fields = ('url',)
+    date_hierarchy = 'minute'
+    readonly_fields = [field.name for field in PerformanceRollup._meta.fields]
+    summary_hours = 24
+
+    def has_add_permission(self, request):
+        return False
+
+    def bot_percent(self, obj):
+        return '{:.0%}'.format(obj.bot_share)
+
+    bot_percent.short_description = '爬虫占比'
+
+    def get_summary(self, limit=20):
+        """
+        只读汇总表. 分位数无法精确合并, 按请求数加权平均 p50, 取各分钟 p95/p99 的最大值
+        """
+        queryset = PerformanceRollup.objects.filter(minute__gte=now() - timedelta(hours=self.summary_hours))
+        weighted_p50 = Sum(F('p50_ms') * F('count'), output_field=FloatField())
+        urls = list(queryset.values('url')
+                    .annotate(requests=Sum('count'), weighted_p50=weighted_p50, p95=Max('p95_ms'),
+                              p99=Max('p99_ms'), bots=Sum('bot_count'))
+                    .order_by('-requests')[:limit])
+        trend = list(queryset.annotate(hour=TruncHour('minute')).values('hour')
+                     .annotate(requests=Sum('count'), weighted_p50=weighted_p50, p95=Max('p95_ms'),
+                               bots=Sum('bot_count'))
+                     .order_by('hour'))
+        for row in urls + trend:
+            row['p50'] = row['weighted_p50'] / row['requests'] if row['requests'] else 0
+            row['bot_share'] = row['bots'] / row['requests'] if row['requests'] else 0
+        return urls, trend
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        urls, trend = self.get_summary()
+        extra_context.update(urls=urls, trend=trend, summary_hours=self.summary_hours)
+        return super().changelist_view(request, extra_context=extra_context)
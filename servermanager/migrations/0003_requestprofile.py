@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servermanager', '0002_alter_emailsendlog_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, verbose_name='路径')),
+                ('view_name', models.CharField(blank=True, default='', max_length=200, verbose_name='视图')),
+                ('method', models.CharField(max_length=10, verbose_name='方法')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='状态码')),
+                ('total_ms', models.FloatField(verbose_name='总耗时(ms)')),
+                ('db_queries', models.PositiveIntegerField(default=0, verbose_name='SQL次数')),
+                ('db_ms', models.FloatField(default=0, verbose_name='SQL耗时(ms)')),
+                ('cache_calls', models.PositiveIntegerField(default=0, verbose_name='缓存次数')),
+                ('cache_ms', models.FloatField(default=0, verbose_name='缓存耗时(ms)')),
+                ('template_ms', models.FloatField(default=0, verbose_name='模板耗时(ms)')),
+                ('tags', models.JSONField(blank=True, default=dict, verbose_name='模板标签耗时')),
+                ('creation_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+            ],
+            options={
+                'verbose_name': '请求耗时分析',
+                'verbose_name_plural': '请求耗时分析',
+                'ordering': ['-creation_time'],
+                'indexes': [models.Index(fields=['creation_time'], name='requestprofile_time_idx'), models.Index(fields=['view_name', 'total_ms'], name='requestprofile_view_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('servermanager', '0003_requestprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerformanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=500, verbose_name='路径')),
+                ('minute', models.DateTimeField(verbose_name='时间')),
+                ('count', models.PositiveIntegerField(verbose_name='请求数')),
+                ('p50_ms', models.FloatField(verbose_name='p50(ms)')),
+                ('p95_ms', models.FloatField(verbose_name='p95(ms)')),
+                ('p99_ms', models.FloatField(verbose_name='p99(ms)')),
+                ('max_ms', models.FloatField(verbose_name='最大耗时(ms)')),
+                ('bot_count', models.PositiveIntegerField(default=0, verbose_name='爬虫请求数')),
+                ('countries', models.JSONField(blank=True, default=dict, verbose_name='请求最多的国家')),
+            ],
+            options={
+                'verbose_name': '请求耗时汇总',
+                'verbose_name_plural': '请求耗时汇总',
+                'ordering': ['-minute'],
+                'indexes': [models.Index(fields=['minute'], name='performancerollup_minute_idx')],
+                'constraints': [models.UniqueConstraint(fields=('url', 'minute'), name='performancerollup_url_minute')],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils.timezone import now
 
 
 # Create your models here.
@@ -31,3 +32,61 @@ class EmailSendLog(models.Model):
         verbose_name = '邮件发送log'
         verbose_name_plural = verbose_name
         ordering = ['-creation_time']
+
+
+class RequestProfile(models.Model):
+    path = models.CharField('路径', max_length=500)
+    view_name = models.CharField('视图', max_length=200, blank=True, default='')
+    method = models.CharField('方法', max_length=10)
+    status_code = models.PositiveSmallIntegerField('状态码')
+    total_ms = models.FloatField('总耗时(ms)')
+    db_queries = models.PositiveIntegerField('SQL次数', default=0)
+    db_ms = models.FloatField('SQL耗时(ms)', default=0)
+    cache_calls = models.PositiveIntegerField('缓存次数', default=0)
+    cache_ms = models.FloatField('缓存耗时(ms)', default=0)
+    template_ms = models.FloatField('模板耗时(ms)', default=0)
+    tags = models.JSONField('模板标签耗时', default=dict, blank=True)
+    creation_time = models.DateTimeField('创建时间', default=now)
+
+    def __str__(self):
+        return self.path
+
+    class Meta:
+        verbose_name = '请求耗时分析'
+        verbose_name_plural = verbose_name
+        ordering = ['-creation_time']
+        indexes = [
+            # 按时间清理旧记录, 按视图汇总最慢的接口
+            models.Index(fields=['creation_time'], name='requestprofile_time_idx'),
+            models.Index(fields=['view_name', 'total_ms'], name='requestprofile_view_idx'),
+        ]
+
+
+class PerformanceRollup(models.Model):
+    url = models.CharField('路径', max_length=500)
+    minute = models.DateTimeField('时间')
+    count = models.PositiveIntegerField('请求数')
+    p50_ms = models.FloatField('p50(ms)')
+    p95_ms = models.FloatField('p95(ms)')
+    p99_ms = models.FloatField('p99(ms)')
+    max_ms = models.FloatField('最大耗时(ms)')
+    bot_count = models.PositiveIntegerField('爬虫请求数', default=0)
+    countries = models.JSONField('请求最多的国家', default=dict, blank=True)
+
+    def __str__(self):
+        return self.url
+
+    @property
+    def bot_share(self):
+        return self.bot_count / self.count if self.count else 0
+
+    class Meta:
+        verbose_name = '请求耗时汇总'
+        verbose_name_plural = verbose_name
+        ordering = ['-minute']
+        constraints = [
+            models.UniqueConstraint(fields=['url', 'minute'], name='performancerollup_url_minute'),
+        ]
+        indexes = [
+            models.Index(fields=['minute'], name='performancerollup_minute_idx'),
+        ]
@@ -77,3 +77,67 @@ class ServerManagerTest(TestCase):
 
         s.content = 'exit'
         msghandler.handler()
+
+    def test_request_profile(self):
+        from django.test import override_settings
+        from blog.telemetry import request_profile_queue
+        from .models import RequestProfile
+
+        user = BlogUser.objects.create_superuser(
+            email="profile@profile.com",
+            username="profileuser",
+            password="profileuser")
+        category = Category.objects.create(name="profilecategory")
+        article = Article.objects.create(title="profiletitle", body="profilebody", author=user,
+                                         category=category, type='a', status='p')
+
+        with override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_SAMPLE_RATE=1):
+            rsp = self.client.get(article.get_absolute_url())
+        self.assertEqual(rsp.status_code, 200)
+        request_profile_queue.flush()
+
+        profile = RequestProfile.objects.get(path=article.get_absolute_url())
+        self.assertEqual('blog:detailbyid', profile.view_name)
+        self.assertGreater(profile.db_queries, 0)
+        self.assertGreater(profile.template_ms, 0)
+        self.assertIn('load_article_detail', profile.tags)
+        self.assertIn('load_sidebar', profile.tags)
+
+        self.client.login(username='profileuser', password='profileuser')
+        rsp = self.client.get('/admin/servermanager/requestprofile/')
+        self.assertEqual(rsp.status_code, 200)
+        self.assertContains(rsp, '平均最慢的接口')
+
+    def test_performance_rollup(self):
+        from datetime import timedelta
+        from unittest.mock import patch
+        from blog.documents import ElaspedTimeDocumentManager
+        from blog.telemetry import rollup_performance
+        from .models import PerformanceRollup
+
+        now = timezone.now().replace(second=30, microsecond=0)
+        minute = now.replace(second=0) - timedelta(minutes=5)
+
+        def rollup(start, end):
+            for url, count in (('/', 10), ('/search', 4)):
+                yield {'url': url, 'minute': minute, 'count': count, 'p50_ms': 20, 'p95_ms': 80,
+                       'p99_ms': 120, 'max_ms': 150, 'bot_count': 1, 'countries': {'CN': count}}
+
+        with patch.object(ElaspedTimeDocumentManager, 'rollup', side_effect=rollup) as mock_rollup, \
+                patch.object(ElaspedTimeDocumentManager, 'delete_before') as delete_before:
+            self.assertEqual(2, rollup_performance(now))
+            start, end = mock_rollup.call_args[0]
+            self.assertEqual(now.replace(second=0) - timedelta(minutes=2), end)
+            delete_before.assert_called_once_with(now - timedelta(days=7))
+
+            # 从最后一分钟重新汇总, 不会重复
+            self.assertEqual(2, rollup_performance(now))
+            self.assertEqual(minute, mock_rollup.call_args[0][0])
+        self.assertEqual(2, PerformanceRollup.objects.count())
+        self.assertEqual(0.1, PerformanceRollup.objects.get(url='/').bot_share)
+
+        BlogUser.objects.create_superuser(email="rollup@rollup.com", username="rollupuser", password="rollupuser")
+        self.client.login(username='rollupuser', password='rollupuser')
+        rsp = self.client.get('/admin/servermanager/performancerollup/')
+        self.assertEqual(rsp.status_code, 200)
+        self.assertContains(rsp, '每小时趋势')